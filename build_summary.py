@@ -0,0 +1,18 @@
+import argparse
+
+from graffiti.utils.db_manager import rule_indexes
+from graffiti.utils.summary import rebuild_summary
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Compute the summary of the data of the rule indexes.')
+    parser.add_argument('rules', nargs='*',
+                        help='Rules of the indexes to summarize. By default, '
+                             'all.')
+    args = parser.parse_args()
+
+    rules = args.rules or [rule for rule, _ in rule_indexes]
+    summaries = rebuild_summary(rules)
+    print(f'{summaries} summary documents')
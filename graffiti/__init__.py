@@ -13,6 +13,7 @@ from .doi_ns import api as doi_api
 from .pid_ns import api as pid_api
 from .user_ns import api as user_api
 from .admin_doi_ns import api as admin_doi_api
+from .monitor_ns import api as monitor_api
 
 from config import swagger_title, swagger_version
 
@@ -44,3 +45,4 @@ api.add_namespace(admin_figure_api)
 api.add_namespace(pid_api)
 api.add_namespace(doi_api)
 api.add_namespace(admin_doi_api)
+api.add_namespace(monitor_api)
@@ -1,9 +1,12 @@
 from flask_restx import Namespace, Resource, reqparse
-from flask import request
+from flask import request, abort, send_file
 import os
 
 from .utils.decorator import save_request, token_required
 from .utils.db_manager import get_data_count, get_df
+from .utils.file_cache import export_cache
+from .services.export_service import (stream_data, write_export,
+                                      export_mimetypes)
 from .user_ns import user_response
 
 from config import csv_folder, csv_url
@@ -28,7 +31,12 @@ data_parser.add_argument('qc', type=int,
                          help='Quality Control flag value of the measurement',
                          choices=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
 data_parser.add_argument('format', help='Output format',
-                         choices=['json', 'csv'], default='json')
+                         choices=['json', 'csv', 'parquet', 'arrow'],
+                         default='json')
+
+stream_parser = data_parser.copy()
+stream_parser.replace_argument('format', help='Output format',
+                               choices=['csv', 'ndjson'], default='csv')
 
 data_complete_parser = data_parser.copy()
 data_complete_parser.add_argument('platform_code', type=str,
@@ -73,7 +81,7 @@ class GetDataCount(Resource):
 @api.response(503, 'Connection error with the DB.')
 class GetData(Resource):
     @api.doc(security='apikey')
-    @api.marshal_with(user_response, code=200, skip_none=True)
+    @api.response(200, 'Success', user_response)
     @api.expect(data_parser)
     @token_required
     @save_request
@@ -91,28 +99,80 @@ class GetData(Resource):
         platform_code_list = platform_code.split(',')
         parameter_list = parameter.split(',')
 
+        csv_name = export_cache.key(
+            f'data-{platform_code}_{parameter}_{rule}_dmin{depth_min}' + \
+            f'_dmax{depth_max}_tmin{time_min}_tmax{time_max}_qc{qc}')
+        dependencies = {'platform_code': platform_code_list,
+                        'parameter': parameter_list, 'rule': rule,
+                        'time_min': time_min, 'time_max': time_max}
+
+        if format in ('parquet', 'arrow'):
+            filename = export_cache.get(csv_name, format)
+            if not filename:
+                df = get_df(platform_code_list, parameter_list, rule,
+                            depth_min, depth_max, time_min, time_max, qc)
+
+                # Check if folder exist
+                if not os.path.exists(csv_folder):
+                    os.makedirs(csv_folder)
+
+                filename = export_cache.path(csv_name, format)
+                write_export(df, filename, format)
+                export_cache.put(csv_name, dependencies, format)
+            # The file is sent by the WSGI server without reading it in
+            # Python
+            return send_file(filename, mimetype=export_mimetypes[format],
+                             as_attachment=True, conditional=True)
+
         df = get_df(platform_code_list, parameter_list, rule, depth_min, depth_max,
                     time_min, time_max, qc)
         df_dict = df.to_dict()
         if format == 'json':
-            return {
+            return api.marshal({
                 'status': True,
                 'message': f'Data from {platform_code}, parameter {parameter}',
-                'result': [df_dict]}
+                'result': [df_dict]}, user_response, skip_none=True)
         else:
-            csv_name = f'{platform_code}_{parameter}_{rule}_dmin{depth_min}' + \
-                f'_dmax{depth_max}_tmin{time_min}_tmax{time_max}_qc{qc}'
-            filename = f'{csv_folder}/{csv_name}.csv'
-
             # Check if folder exist
             if not os.path.exists(csv_folder):
                 os.makedirs(csv_folder)
 
-            if not os.path.exists(filename):
+            if not export_cache.get(csv_name, 'csv'):
                 # Convert a dict to a csv
-                df.to_csv(filename, index = False, header=True)
-            return {
+                df.to_csv(export_cache.path(csv_name, 'csv'), index = False,
+                          header=True)
+                export_cache.put(csv_name, dependencies, 'csv')
+            return api.marshal({
                 'status': True,
                 'message': 'Data placed in result[0]',
                 'result': [f'{csv_url}/{csv_name}.csv']
-            }
+            }, user_response, skip_none=True)
+
+
+@api.route('/stream/<string:rule>/<string:platform_code>/<string:parameter>')
+@api.param('rule', 'Options: M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H, R')
+@api.param('platform_code', 'Platform code (you can write multiple platforms separated by ,)')
+@api.param('parameter', 'Parameter acronym (you can write multiple parameters separated by ,)')
+@api.response(401, 'Invalid email or password.')
+@api.response(503, 'Connection error with the DB.')
+class GetDataStream(Resource):
+    @api.doc(security='apikey')
+    @api.expect(stream_parser)
+    @token_required
+    @save_request
+    def get(self, rule, platform_code, parameter):
+        """
+        Download data as a stream of CSV or JSON lines (gzip if it is accepted)
+        """
+        depth_min = request.args.get("depth_min")
+        depth_max = request.args.get("depth_max")
+        time_min = request.args.get("time_min")
+        time_max = request.args.get("time_max")
+        qc = request.args.get("qc")
+        format = request.args.get('format', 'csv')
+        if format not in ('csv', 'ndjson'):
+            abort(400, 'Invalid format')
+
+        return stream_data(platform_code.split(','), parameter.split(','),
+                           rule, depth_min, depth_max, time_min, time_max, qc,
+                           format, request.headers.get('Accept-Encoding', ''))
@@ -1,10 +1,12 @@
-from flask_restx import Namespace, Resource, reqparse
-from flask import request
+from flask_restx import Namespace, Resource, reqparse, inputs
+from flask import request, send_file, make_response
+import gzip
 
 from .services.figure_service import (get_line, get_platform_pie, get_area,
                                       get_parameter_availability, get_map,
                                       get_platform_availability, get_scatter,
-                                      get_parameter_pie)
+                                      get_parameter_pie, get_figure_status,
+                                      get_figure_json, get_figure_viewer)
 from .utils.decorator import save_request, token_required
 from .user_ns import user_response
 
@@ -27,7 +29,24 @@ fig_parser.add_argument('template', type=str, help='Layout template',
                                   'plotly', 'plotly_white', 'plotly_dark',
                                   'presentation', 'xgridoff', 'ygridoff',
                                   'gridon'])
-
+fig_parser.add_argument('output', type=str,
+                        help='Save the figure as an HTML file or as a ' + \
+                            'gzip compressed Plotly JSON, with a viewer',
+                        choices=['html', 'json'], default='html')
+
+job_parser = fig_parser.copy()
+job_parser.add_argument('background', type=inputs.boolean,
+                        help='Make the figure in the background. Its state ' + \
+                            'is in /figure/status/<fig_name>')
+
+series_parser = job_parser.copy()
+series_parser.add_argument('points', type=int,
+                           help='Maximum number of values per trace. The ' + \
+                               'data is downsampled keeping peaks and troughs')
+series_parser.add_argument('render_mode', type=str,
+                           help='Draw the traces with SVG or WebGL. With ' + \
+                               'auto, large figures are drawn with WebGL',
+                           choices=['auto', 'svg', 'webgl'])
 
 platform_parser = fig_parser.copy()
 platform_parser.add_argument('platform_code', type=str, help='Platform code',
@@ -41,7 +60,7 @@ complete_parser = platform_parser.copy()
 complete_parser.add_argument('parameter', type=str, help='Parameter acronym',
                              action='split')
 
-advanced_parser = fig_parser.copy()
+advanced_parser = job_parser.copy()
 advanced_parser.add_argument('color', type=str,
                              help='Variable referenced to the color',
                              choices=['depth', 'time'])
@@ -53,6 +72,13 @@ advanced_parser.add_argument('marginal_y', type=str,
                              choices=['histogram', 'rug', 'box', 'violin'])
 advanced_parser.add_argument('trendline', type=str, help='Make a trendline',
                              choices=['ols', 'lowess', 'expanding', 'rolling'])
+advanced_parser.add_argument('render_mode', type=str,
+                             help='Draw the traces with SVG or WebGL. With ' + \
+                                 'auto, large figures are drawn with WebGL',
+                             choices=['auto', 'svg', 'webgl'])
+advanced_parser.add_argument('depth_bin', type=float,
+                             help='Size of the depth bins, in meters, if ' + \
+                                 'parameter_y is depth')
 
 
 @api.route('/area/<string:platform_code>/<string:parameter>')
@@ -64,7 +90,7 @@ advanced_parser.add_argument('trendline', type=str, help='Make a trendline',
 class GetArea(Resource):
     @api.doc(security='apikey')
     @api.marshal_with(user_response, code=201, skip_none=True)
-    @api.expect(fig_parser)
+    @api.expect(series_parser)
     @token_required
     @save_request
     def get(self, platform_code, parameter):
@@ -77,12 +103,18 @@ class GetArea(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
+        points = request.args.get('points', type=int)
+        render_mode = request.args.get('render_mode')
+        background = request.args.get('background', False,
+                                      type=inputs.boolean)
 
         platform_code_list = platform_code.split(',')
         parameter_list = parameter.split(',')
 
         return get_area(platform_code_list, parameter_list, depth_min,
-                        depth_max, time_min, time_max, qc, template, False)
+                        depth_max, time_min, time_max, qc, template,
+                        background, points, render_mode, output)
 
 
 @api.route('/line/<string:platform_code>/<string:parameter>')
@@ -94,7 +126,7 @@ class GetArea(Resource):
 class GetLine(Resource):
     @api.doc(security='apikey')
     @api.marshal_with(user_response, code=201, skip_none=True)
-    @api.expect(fig_parser)
+    @api.expect(series_parser)
     @token_required
     @save_request
     def get(self, platform_code, parameter):
@@ -107,12 +139,18 @@ class GetLine(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
+        points = request.args.get('points', type=int)
+        render_mode = request.args.get('render_mode')
+        background = request.args.get('background', False,
+                                      type=inputs.boolean)
 
         platform_code_list = platform_code.split(',')
         parameter_list = parameter.split(',')
 
         return get_line(platform_code_list, parameter_list, depth_min,
-                        depth_max, time_min, time_max, qc, template, False)
+                        depth_max, time_min, time_max, qc, template,
+                        background, points, render_mode, output)
 
 
 @api.route('/parameter_availability/<string:parameter>')
@@ -123,7 +161,7 @@ class GetLine(Resource):
 class GetParameterAvailability(Resource):
     @api.doc(security='apikey')
     @api.marshal_with(user_response, code=201, skip_none=True)
-    @api.expect(fig_parser)
+    @api.expect(job_parser)
     @token_required
     @save_request
     def get(self, parameter):
@@ -136,10 +174,14 @@ class GetParameterAvailability(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
+        background = request.args.get('background', False,
+                                      type=inputs.boolean)
 
         return get_parameter_availability(parameter, depth_min, depth_max,
                                           time_min, time_max, qc, template,
-                                          multithread = False)
+                                          multithread = background,
+                                          output=output)
 
 
 @api.route('/platform_availability/<string:platform_code>')
@@ -149,7 +191,7 @@ class GetParameterAvailability(Resource):
 class GetPlatformAvailability(Resource):
     @api.doc(security='apikey')
     @api.marshal_with(user_response, code=201, skip_none=True)
-    @api.expect(fig_parser)
+    @api.expect(job_parser)
     @token_required
     @save_request
     def get(self, platform_code):
@@ -162,10 +204,14 @@ class GetPlatformAvailability(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
+        background = request.args.get('background', False,
+                                      type=inputs.boolean)
 
         return get_platform_availability(platform_code, depth_min, depth_max,
                                          time_min, time_max, qc, template,
-                                         multithread = False)
+                                         multithread = background,
+                                         output=output)
 
 
 @api.route('/parameter_pie/<string:rule>')
@@ -194,9 +240,10 @@ class GetFigParameterPie(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
 
         return get_parameter_pie(rule, platform_code_list, depth_min, depth_max,
-                                 time_min, time_max, qc, template)
+                                 time_min, time_max, qc, template, output)
 
 
 @api.route('/platform_pie/<string:rule>')
@@ -225,9 +272,10 @@ class GetFigPlatformPie(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
 
         return get_platform_pie(rule, parameter_list, depth_min, depth_max,
-                                time_min, time_max, qc, template)
+                                time_min, time_max, qc, template, output)
 
 
 @api.route('/map/<string:rule>')
@@ -263,9 +311,11 @@ class GetFigMap(Resource):
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
 
         return get_map(rule, platform_code_list, parameter_list, depth_min,
-                       depth_max, time_min, time_max, qc, template)
+                       depth_max, time_min, time_max, qc, template,
+                       output=output)
 
 
 @api.route('/scatter/<string:platform_code_x>/<string:parameter_x>/<string:platform_code_y>/<string:parameter_y>')
@@ -287,13 +337,69 @@ class GetScatter(Resource):
         marginal_y = request.args.get('marginal_y')
         trendline = request.args.get('trendline')
         template = request.args.get('template')
+        output = request.args.get('output', 'html')
         depth_min = request.args.get("depth_min")
         depth_max = request.args.get("depth_max")
         time_min = request.args.get("time_min")
         time_max = request.args.get("time_max")
         qc = request.args.get("qc")
+        background = request.args.get('background', False,
+                                      type=inputs.boolean)
+        depth_bin = request.args.get('depth_bin', type=float)
+        render_mode = request.args.get('render_mode')
 
         return get_scatter(platform_code_x, parameter_x, platform_code_y,
                            parameter_y, color, marginal_x, marginal_y,
                            trendline, template, depth_min, depth_max, time_min,
-                           time_max, qc, False)
+                           time_max, qc, background, depth_bin, render_mode,
+                           output)
+
+
+@api.route('/status/<string:fig_name>')
+@api.param('fig_name', 'Name of the figure (file name of the link without .html)')
+@api.response(401, 'Invalid token')
+@api.response(404, 'Figure not found')
+class GetFigureStatus(Resource):
+    @api.doc(security='apikey')
+    @api.marshal_with(user_response, code=200, skip_none=True)
+    @token_required
+    def get(self, fig_name):
+        """
+        Get the state of a figure: queued, running, done or failed
+        """
+        return get_figure_status(fig_name)
+
+
+@api.route('/json/<string:fig_name>')
+@api.param('fig_name', 'Name of the figure (key of the link of a figure made with output=json)')
+@api.response(404, 'Figure not found')
+class GetFigureJson(Resource):
+    def get(self, fig_name):
+        """
+        Get the Plotly JSON of a figure, gzip compressed
+        """
+        figure_path = get_figure_json(fig_name)
+        if 'gzip' not in request.accept_encodings:
+            # The file is decompressed for the clients without gzip
+            with gzip.open(figure_path, 'rb') as json_file:
+                response = make_response(json_file.read())
+            response.mimetype = 'application/json'
+            return response
+        # The file is sent by the WSGI server without reading it in Python
+        response = send_file(figure_path, mimetype='application/json',
+                             conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+@api.route('/viewer')
+@api.param('key', 'Name of the figure (key of the link of a figure made with output=json)')
+class GetFigureViewer(Resource):
+    def get(self):
+        """
+        Page that draws the Plotly JSON of a figure
+        """
+        response = make_response(get_figure_viewer())
+        response.mimetype = 'text/html'
+        return response
@@ -0,0 +1,43 @@
+from flask_restx import Namespace, Resource
+
+from .utils.decorator import admin_token_required
+from .utils.elastic_manager import pool_stats
+from .utils.audit_log import audit_log
+from .user_ns import user_response
+
+
+api = Namespace('monitor', description='Internal statistics of the API')
+
+
+@api.route('/elastic')
+@api.response(401, 'Admin Token required.')
+class GetElasticStats(Resource):
+    @api.doc(security='apikey')
+    @api.marshal_with(user_response, code=200, skip_none=True)
+    @admin_token_required
+    def get(self):
+        """
+        Get the statistics of the connection pool with the DB
+        """
+        return {
+            'status': True,
+            'message': 'Connection pool statistics in result[0]',
+            'result': [pool_stats()]
+        }, 200
+
+
+@api.route('/audit')
+@api.response(401, 'Admin Token required.')
+class GetAuditStats(Resource):
+    @api.doc(security='apikey')
+    @api.marshal_with(user_response, code=200, skip_none=True)
+    @admin_token_required
+    def get(self):
+        """
+        Get the counters of the log of requests
+        """
+        return {
+            'status': True,
+            'message': 'Request log counters in result[0]',
+            'result': [audit_log.stats()]
+        }, 200
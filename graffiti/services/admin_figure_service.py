@@ -1,7 +1,5 @@
-import os
-import glob
-
-from config import fig_folder, df_folder
+from ..utils.df_cache import invalidate
+from ..utils.file_cache import figure_cache
 
 
 def delete_scatter(platform_code):
@@ -25,11 +23,9 @@ def delete_scatter(platform_code):
 
     """
     # Delete figures
-    for filename in glob.glob(f'{fig_folder}/scatter-{platform_code}*'):
-        os.remove(filename)
-    # Delete pkls
-    for filename in glob.glob(f'{df_folder}/{platform_code}*'):
-        os.remove(filename)
+    figure_cache.invalidate(platform_code=platform_code, kind='scatter')
+    # Delete cached data
+    invalidate(platform_code)
 
     response = {
         'status': True,
@@ -57,8 +53,7 @@ def delete_platform_pie():
 
     """
     # Delete figures
-    for filename in glob.glob(f'{fig_folder}/platform_pie*'):
-        os.remove(filename)
+    figure_cache.invalidate(kind='platform_pie')
 
     response =  {
         'status': True,
@@ -89,13 +84,9 @@ def delete_parameter_availability(parameter):
                 The result is an empty list.
             The status_code is always 204 (deleted).
     """
-    # Delete all metadata_map figures
-    # Loop Through the folder projects all files and deleting them one by one
-    for file_map in glob.glob(
-        f'{fig_folder}/parameter_availability-{parameter}*'):
-        os.remove(file_map)
-    for file_pkl in glob.glob(f'{df_folder}/*{parameter}*'):
-        os.remove(file_pkl)
+    # Delete figures
+    figure_cache.invalidate(parameter=parameter, kind='parameter_availability')
+    invalidate(parameter=parameter)
 
     response = {
         'status': True,
@@ -126,13 +117,10 @@ def delete_platform_availability(platform_code):
                 The result is an empty list.
             The status_code is always 204 (deleted).
     """
-    # Delete all figures
-    # Loop Through the folder projects all files and deleting them one by one
-    for file_map in glob.glob(
-        f'{fig_folder}/platform_availability-{platform_code}*'):
-        os.remove(file_map)
-    for file_pkl in glob.glob(f'{df_folder}/{platform_code}*'):
-        os.remove(file_pkl)
+    # Delete figures
+    figure_cache.invalidate(platform_code=platform_code,
+                            kind='platform_availability')
+    invalidate(platform_code)
 
     response = {
         'status': True,
@@ -158,10 +146,8 @@ def delete_map():
                 The result is an empty list.
             The status_code is always 204 (deleted).
     """
-    # Delete all metadata_map figures
-    # Loop Through the folder projects all files and deleting them one by one
-    for file_map in glob.glob(f'{fig_folder}/metadata_map*'):
-        os.remove(file_map)
+    # Delete figures
+    figure_cache.invalidate(kind='map')
 
     response = {
         'status': True,
@@ -188,8 +174,7 @@ def delete_parameter_pie():
             The status_code is always 204 (deleted).
     """
     # Delete figures
-    for filename in glob.glob(f'{fig_folder}/parameter_pie*'):
-        os.remove(filename)
+    figure_cache.invalidate(kind='parameter_pie')
 
     response = {
         'status': True,
@@ -222,10 +207,9 @@ def delete_line(platform_code, parameter):
                 The result is an empty list.
             The status_code is always 204 (deleted).
     """
-    for file_line in glob.glob(f'{fig_folder}/line-{platform_code}-{parameter}*'):
-        os.remove(file_line)
-    for file_pkl in glob.glob(f'{df_folder}/{platform_code}_{parameter}*'):
-        os.remove(file_pkl)
+    figure_cache.invalidate(platform_code=platform_code, parameter=parameter,
+                            kind='line')
+    invalidate(platform_code, parameter)
 
     response = {
         'status': True,
@@ -258,10 +242,9 @@ def delete_area(platform_code, parameter):
                 The result is an empty list.
             The status_code is always 204 (deleted).
     """
-    for file_line in glob.glob(f'{fig_folder}/area-{platform_code}-{parameter}*'):
-        os.remove(file_line)
-    for file_pkl in glob.glob(f'{df_folder}/{platform_code}_{parameter}*'):
-        os.remove(file_pkl)
+    figure_cache.invalidate(platform_code=platform_code, parameter=parameter,
+                            kind='area')
+    invalidate(platform_code, parameter)
 
     response = {
         'status': True,
@@ -0,0 +1,229 @@
+import io
+import os
+import csv
+import json
+import zlib
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from flask import Response, stream_with_context
+
+from ..utils.db_manager import data_fields, get_data_source
+from ..utils.df_cache import to_table
+from ..utils.helper import valid_range
+from ..utils.query import QueryFilter
+
+# Bytes of output that are joined before they are sent to the client
+stream_buffer_size = 64 * 1024
+
+# Content type of every export format
+export_mimetypes = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file'
+}
+
+# Columns of the binary export files
+export_schema = pa.schema([
+    ('time', pa.timestamp('ms', tz='UTC')),
+    ('depth', pa.float32()),
+    ('value', pa.float32()),
+    ('qc', pa.int8()),
+    ('platform_code', pa.dictionary(pa.int32(), pa.string())),
+    ('parameter', pa.dictionary(pa.int32(), pa.string()))
+])
+
+
+def data_rows(platform_code_list, parameter_list, rule, depth_min=None,
+              depth_max=None, time_min=None, time_max=None, qc=None):
+    """
+    Read the data from the scroll cursor of the DB, one document at a time.
+    The data of every platform_code and parameter is sorted by time and the
+    values out of the valid range are skipped.
+
+    Parameters
+    ----------
+        platform_code_list: list of str
+            Platform codes.
+        parameter_list: list of str
+            Parameter acronyms.
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+
+    Yields
+    ------
+        data: dict
+            Data document with the data_fields.
+    """
+    for platform_code in platform_code_list:
+        for parameter in parameter_list:
+            value_min, value_max = valid_range(platform_code, parameter)
+            query = QueryFilter(
+                platform_code=platform_code, parameter=parameter,
+                depth_min=depth_min, depth_max=depth_max, time_min=time_min,
+                time_max=time_max, qc=qc, value_min=value_min,
+                value_max=value_max)
+            yield from get_data_source(query, rule, sort=True)
+
+
+def csv_chunks(rows):
+    """ Write the rows as CSV, with a header """
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=data_fields,
+                            extrasaction='ignore')
+    writer.writeheader()
+
+    # The header is sent before the first query to the DB
+    yield output.getvalue()
+    output.seek(0)
+    output.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+        if output.tell() >= stream_buffer_size:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+
+def ndjson_chunks(rows):
+    """ Write the rows as JSON lines """
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps({field: row.get(field) for field in data_fields})
+        lines.append(line)
+        size += len(line) + 1
+        if size >= stream_buffer_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+            size = 0
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks):
+    """
+    Compress a stream of bytes with gzip. Every chunk is flushed, so the
+    client receives it without waiting for the next one.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def encode_chunks(chunks):
+    """ Encode a stream of str in UTF-8 """
+    for chunk in chunks:
+        if chunk:
+            yield chunk.encode('utf-8')
+
+
+def stream_data(platform_code_list, parameter_list, rule, depth_min=None,
+                depth_max=None, time_min=None, time_max=None, qc=None,
+                format='csv', accept_encoding=''):
+    """
+    Make a streaming response with the data. The rows are sent while they are
+    read from the DB, so the memory does not depend on the size of the data.
+
+    Parameters
+    ----------
+        platform_code_list: list of str
+            Platform codes.
+        parameter_list: list of str
+            Parameter acronyms.
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        time_min: str
+            Minimum date and time of the measurement.
+        time_max: str
+            Maximum date and time of the measurement.
+        qc: int
+            Quality Flag value of the measurement.
+        format: str
+            Options - csv, ndjson
+        accept_encoding: str
+            Accept-Encoding header of the request. The response is compressed
+            if it accepts gzip.
+
+    Returns
+    -------
+        response: flask Response
+    """
+    rows = data_rows(platform_code_list, parameter_list, rule, depth_min,
+                     depth_max, time_min, time_max, qc)
+
+    if format == 'ndjson':
+        chunks = encode_chunks(ndjson_chunks(rows))
+    else:
+        chunks = encode_chunks(csv_chunks(rows))
+
+    # An error of the DB after the first bytes closes the connection without
+    # the last chunk, so the client knows that the download is incomplete
+    body = chunks
+    headers = {
+        'Content-Disposition':
+            f'attachment; filename=data_{rule}.{format}',
+        'Vary': 'Accept-Encoding'
+    }
+    if 'gzip' in (accept_encoding or '').lower():
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(body),
+                    mimetype=export_mimetypes[format], headers=headers)
+
+
+def export_table(df):
+    """
+    Convert a DataFrame of get_df() into an Arrow Table with the
+    export_schema.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+
+    Returns
+    -------
+        table: pyarrow Table
+    """
+    if df.empty:
+        return export_schema.empty_table()
+    return to_table(df).cast(export_schema, safe=False)
+
+
+def write_export(df, file_path, format):
+    """
+    Save the data in a parquet or Arrow IPC file. The file is written with
+    another name and renamed, so a file with the final name is always
+    complete.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+            Output of get_df().
+        file_path: str
+            Path of the file.
+        format: str
+            Options - parquet, arrow
+    """
+    table = export_table(df)
+    temp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if format == 'parquet':
+        pq.write_table(table, temp_path, compression='zstd')
+    else:
+        with pa.OSFile(temp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(temp_path, file_path)
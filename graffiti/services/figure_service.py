@@ -1,16 +1,32 @@
 import os
-import threading
+import json
 import plotly
 import plotly.express as px
 import pandas as pd
 
-from flask import abort
+from elasticsearch import exceptions
+from flask import abort, url_for
 
 from config import (fig_folder, fig_url, config_fig, mapbox_access_token,
-                    rolling_window)
-from ..utils.db_manager import (good_rule, get_df, get_metadata, get_parameter,
-                                get_data_count, get_metadata_id)
-from ..utils.helper import time_to_str
+                    rolling_window, webgl_points)
+from ..utils.db_manager import (get_rule_counts, select_rule, get_df,
+                                get_metadata, get_parameter,
+                                get_time_histogram, get_platform_counts,
+                                get_metadata_sources)
+from ..utils.query import QueryFilter
+from ..utils.helper import (time_to_str, availability_intervals,
+                            depth_profile)
+from ..utils.alignment import align_series, time_tolerance
+from ..utils.job_queue import figure_jobs
+from ..utils.file_cache import figure_cache
+from ..utils.fig_spec import (line_spec, area_spec, pie_spec, write_spec,
+                              write_json, viewer_html)
+
+# Size of the depth bins of the profiles, in meters
+default_depth_bin = 0.25
+
+# Extensions of the files of the figures of every output
+figure_extensions = {'html': 'html', 'json': 'json.gz'}
 
 
 def create_fig_folder():
@@ -20,6 +36,209 @@ def create_fig_folder():
         os.makedirs(fig_folder)
 
 
+def figure_key(fig_name, output='html'):
+    """
+    Key of a figure in the figure cache. The keys of the JSON figures end with
+    -json, so the output of a figure is known from its key.
+
+    Parameters
+    ----------
+        fig_name: str
+            Name with all the arguments of the figure.
+        output: str
+            Options - html, json.
+
+    Returns
+    -------
+        key: str
+    """
+    if output not in figure_extensions:
+        abort(400, 'The output must be html or json')
+
+    key = figure_cache.key(fig_name)
+    if output == 'json':
+        key += '-json'
+    return key
+
+
+def figure_output(fig_name):
+    """ Output of a figure from its key: html or json """
+    return 'json' if fig_name.endswith('-json') else 'html'
+
+
+def figure_links(fig_name, output='html'):
+    """
+    Links to a figure.
+
+    Parameters
+    ----------
+        fig_name: str
+            Key of the figure in the figure cache.
+        output: str
+            Options - html, json.
+
+    Returns
+    -------
+        links: list of str
+            The HTML file of the figure or, with the output json, the Plotly
+            JSON of the figure and the viewer of the JSON. The links of the
+            JSON are made from the request, so they keep the host and the
+            path prefix of the API.
+    """
+    if output == 'json':
+        return [
+            url_for('figure_get_figure_json', fig_name=fig_name,
+                    _external=True),
+            url_for('figure_get_figure_viewer', key=fig_name,
+                    _external=True)]
+    return [f'{fig_url}/{fig_name}.html']
+
+
+def save_figure(fig, fig_name, output='html', config=config_fig):
+    """
+    Save a figure in the fig_folder.
+
+    Parameters
+    ----------
+        fig: plotly Figure or dict
+            Figure of plotly.express or spec of fig_spec.
+        fig_name: str
+            Key of the figure in the figure cache.
+        output: str
+            Options - html, json. With json, only the Plotly JSON of the figure
+            is saved, gzip compressed, in {fig_name}.json.gz
+        config: dict
+            Config of the HTML figure.
+
+    Returns
+    -------
+        figure_path: str
+            Path of the file of the figure.
+    """
+    figure_path = figure_cache.path(fig_name, figure_extensions[output])
+    if output == 'json':
+        write_json(fig, figure_path)
+    elif isinstance(fig, dict):
+        write_spec(fig, figure_path, config)
+    else:
+        plotly.io.write_html(fig, figure_path, config=config,
+                             include_plotlyjs='cdn')
+    return figure_path
+
+
+def save_no_data(fig_name, output='html'):
+    """ Save the figure of a background job without data """
+    if output == 'json':
+        save_figure({'data': [], 'layout': {'title': {
+            'text': 'No data found'}}}, fig_name, output)
+    else:
+        with open(f'{fig_folder}/{fig_name}.html', 'w') as fp:
+            fp.write('No data found')
+
+
+def make_figure(fig_name, dependencies, function, *args, **kwargs):
+    """
+    Run a thread_* function and add its figure to the figure cache.
+
+    Returns
+    -------
+        figure_path: str - bool
+            The return of the function.
+    """
+    figure_path = function(*args, **kwargs)
+    figure_cache.put(fig_name, dependencies,
+                     figure_extensions[kwargs.get('output', 'html')])
+    return figure_path
+
+
+def run_figure(fig_name, function, multithread, *args, dependencies=None,
+               **kwargs):
+    """
+    Make a figure with the pool of figure jobs. If the same figure is already
+    in progress, it is not made again.
+
+    Parameters
+    ----------
+        fig_name: str
+            Key of the figure in the figure cache, it identifies the job.
+        function: callable
+            Function that makes the figure, one of the thread_* functions.
+        multithread: bool
+            If True, the figure is made in the background. Otherwise, it waits
+            for the figure.
+        *args, **kwargs:
+            Arguments of the function.
+        dependencies: dict
+            Data of the figure, see FileCache.put().
+
+    Returns
+    -------
+        figure_path: str, bool or None
+            The return of the function, or None if multithread is True.
+    """
+    future = figure_jobs.submit(fig_name, make_figure, fig_name, dependencies,
+                                function, *args, detached=multithread,
+                                **kwargs)
+    if future is None:
+        abort(503, 'Too many figures in progress, please try again later')
+
+    if multithread:
+        return None
+    return future.result()
+
+
+def trace_mode(df, render_mode=None):
+    """
+    Get the render mode of the traces of a figure. SVG traces are slow in the
+    browser with many points, so WebGL is used for large figures.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+            Data of the figure.
+        render_mode: str
+            Options - auto, svg, webgl. With auto (default), the mode is webgl
+            if the figure has more than webgl_points values.
+
+    Returns
+    -------
+        mode: str
+            svg or webgl
+    """
+    if render_mode in ('svg', 'webgl'):
+        return render_mode
+    return 'webgl' if len(df) > webgl_points else 'svg'
+
+
+def working_response(fig_name, message=None, output='html'):
+    """
+    Response for a figure that is being made in the background.
+
+    Parameters
+    ----------
+        fig_name: str
+            Name of the figure.
+        message: str
+            Additional message for the user.
+        output: str
+            Options - html, json.
+
+    Returns
+    -------
+        (response, status_code): (dict, int)
+    """
+    response = {
+        'status': True,
+        'message': 'Working, please wait some minuts before access to the ' + \
+            'link from result[0]. The state of the figure is in ' + \
+            f'/figure/status/{fig_name}',
+        'result': figure_links(fig_name, output)}
+    if message:
+        response['message'] += f'. {message}'
+    status_code = 201
+    return response, status_code
+
+
 def get_rule(platform_code, parameter, depth_min=None, depth_max=None,
              time_min=None, time_max=None, qc=None):
     """
@@ -78,34 +297,28 @@ def get_rule(platform_code, parameter, depth_min=None, depth_max=None,
     
     if isinstance(parameter, str):
         parameter = [parameter]
-        
-    rule = 'None'
+    parameter = [str(param) for param in parameter]
+
+    query = QueryFilter(platform_code=platform_code, parameter=parameter,
+                        depth_min=depth_min, depth_max=depth_max,
+                        time_min=time_min, time_max=time_max, qc=qc)
+
+    # One filter per combination of platform_code and parameter
+    filters = {}
     for platform in platform_code:  # platform_code is a list
         for param in parameter:  # parameter is a list
-            search_string = '{"platform_code":' + f'"{platform}"' + \
-                ',"parameter":' + f'"{param}"' + '}'
-            if depth_min:
-                search_string = search_string[:-1] + \
-                    f',"depth_min":{depth_min}' + '}'
-            if depth_max:
-                search_string = search_string[:-1] + \
-                    f',"depth_max":{depth_max}' + '}'
-            if time_min:
-                search_string = search_string[:-1] + \
-                    f',"time_min":"{time_min}"' + '}'
-            if time_max:
-                search_string = search_string[:-1] + \
-                    f',"time_max":"{time_max}"' + '}'
-            if qc:
-                search_string = search_string[:-1] + \
-                    f',"qc":{qc}' + '}'
-
-            rule_platform = good_rule(search_string)  # rule is False if there
-                                                        # is a db connection
-                                                        # error
-            if rule_platform:
-                if rule_puntuation[rule_platform] > rule_puntuation[rule]:
-                    rule = rule_platform
+            filters[f'{platform}/{param}'] = QueryFilter(
+                platform_code=platform, parameter=param)
+
+    # counts is False if there is a db connection error
+    counts = get_rule_counts(query, filters)
+
+    rule = 'None'
+    if counts:
+        for combination_counts in counts.values():
+            rule_platform = select_rule(combination_counts)
+            if rule_puntuation[rule_platform] > rule_puntuation[rule]:
+                rule = rule_platform
 
     if rule == 'None':
         rule = False
@@ -114,11 +327,13 @@ def get_rule(platform_code, parameter, depth_min=None, depth_max=None,
 
 def thread_line(platform_code_list, parameter_list, fig_name, depth_min=None,
                 depth_max=None, time_min=None, time_max=None, qc=None,
-                template=None, detached=False):
+                template=None, detached=False, points=None,
+                render_mode=None, output='html'):
     """
     It creates a line figure, the x axis is the time and the y axis is the
     averave of values from the input parameter of the platform_code.
-    Save the figure in the {fig_folder}/{fig_name}.html
+    Save the figure in the {fig_folder}/{fig_name}.html, or
+    {fig_name}.json.gz with the output json.
 
     Parameters
     ----------
@@ -151,6 +366,13 @@ def thread_line(platform_code_list, parameter_list, fig_name, depth_min=None,
         detached: bool
             If detached is True, the function makes an html with the message
             'no data found'.
+        points: int
+            Maximum number of values per trace. If it is set, the raw data is
+            downsampled by the DB keeping the peaks and troughs.
+        render_mode: str
+            Options - auto, svg, webgl. See trace_mode().
+        output: str
+            Options - html, json. See save_figure().
     
     Returns
     -------
@@ -158,37 +380,35 @@ def thread_line(platform_code_list, parameter_list, fig_name, depth_min=None,
             Location of the figure (html file). If there is no data or a db
             connection error, it returns False
     """
-    rule = get_rule(platform_code_list, parameter_list, depth_min, depth_max,
-                    time_min, time_max, qc)  # rule is False if there is a db connection
-                                             # error
+    if points:
+        # The DB downsamples the raw data
+        rule = 'R'
+    else:
+        rule = get_rule(platform_code_list, parameter_list, depth_min,
+                        depth_max, time_min, time_max, qc)  # rule is False if
+                                                            # there is a db
+                                                            # connection error
     if rule:
         df = get_df(platform_code_list, parameter_list, rule, depth_min,
-                    depth_max, time_min, time_max, qc)
-
-        figure_path = f'{fig_folder}/{fig_name}.html'
+                    depth_max, time_min, time_max, qc, points)
 
         if df.empty:
             figure_path = False
         else:
-            fig = px.line(df, x='time', y='value', color='depth',
-                          symbol='parameter',
-                          line_dash='platform_code', line_shape="spline",
-                          render_mode="svg", template=template)
-
-            plotly.io.write_html(fig, figure_path, config=config_fig,
-                                 include_plotlyjs='cdn')
+            # The figure of px.line() is made without the objects of plotly
+            spec = line_spec(df, template, trace_mode(df, render_mode))
+            figure_path = save_figure(spec, fig_name, output)
     else:
         figure_path = False
 
     if figure_path == False and detached == True:
-        with open(f'{fig_folder}/{fig_name}.html', 'w') as fp:
-            fp.write('No data found')
+        save_no_data(fig_name, output)
     return figure_path
 
 
 def get_line(platform_code_list, parameter_list, depth_min=None, depth_max=None,
              time_min=None, time_max=None, qc=None, template=None,
-             multithread=True):
+             multithread=True, points=None, render_mode=None, output='html'):
     """
     Make a time series line figure using Plotly. The trace contains averages
     values of the input parameter. 
@@ -223,7 +443,16 @@ def get_line(platform_code_list, parameter_list, depth_min=None, depth_max=None,
             Getting the data and making the plot takes a while.
             This argument makes the figure with a secondary thread to avoid
             blocking the main program.
-    
+        points: int
+            Maximum number of values per trace.
+        render_mode: str
+            Options - auto, svg, webgl. By default, auto: the traces are drawn
+            with WebGL if the figure has more than webgl_points values.
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -235,6 +464,9 @@ def get_line(platform_code_list, parameter_list, depth_min=None, depth_max=None,
             The status_code is always 201 (created) if multithread = True,
             otherwhise status_code can be 404 if data is not found.
     """
+    if points is not None and points <= 0:
+        abort(400, 'points must be greater than 0')
+
     if isinstance(platform_code_list, str):
         platform_code_list = [platform_code_list]
     if isinstance(parameter_list, str):
@@ -247,35 +479,35 @@ def get_line(platform_code_list, parameter_list, depth_min=None, depth_max=None,
         f'-{(",").join(parameter_list)}-dmin{depth_min}' + \
         f'-dmax{depth_max}-tmin{time_min_str}-tmax{time_max_str}-qc{qc}' + \
         f'-template{template}'
+    if points:
+        fig_name += f'-points{points}'
+    if render_mode and render_mode != 'auto':
+        fig_name += f'-render{render_mode}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
         
+        path_fig = run_figure(fig_name, thread_line, multithread,
+                              platform_code_list, parameter_list, fig_name,
+                              depth_min, depth_max, time_min, time_max, qc,
+                              template, points=points,
+                              render_mode=render_mode,
+                              output=output,
+                              dependencies={
+                                  'platform_code': platform_code_list,
+                                  'parameter': parameter_list,
+                                  'time_min': time_min,
+                                  'time_max': time_max})
         if multithread:
-            f = threading.Thread(
-                target=thread_line,
-                args=(platform_code_list, parameter_list, fig_name, depth_min,
-                      depth_max, time_min, time_max, qc, template, True))
-            f.start()
-
-            response = {
-                'status': True,
-                'message': 'Working, please wait some minuts before ' + \
-                    'access to the link from result[0].',
-                'result': [f'{fig_url}/{fig_name}.html']}
-            status_code = 201
-
+            response, status_code = working_response(fig_name, output=output)
         else:
-            path_fig = thread_line(platform_code_list, parameter_list, fig_name,
-                                   depth_min, depth_max, time_min, time_max, qc,
-                                   template)
-
             if path_fig:
                 response = {
                     'status': True,
                     'message': 'Link to the figure in result[0]',
-                    'result': [f'{fig_url}/{fig_name}.html']}
+                    'result': figure_links(fig_name, output)}
                 status_code = 201
             else:
                 abort(404, 'Data not found')
@@ -283,7 +515,7 @@ def get_line(platform_code_list, parameter_list, depth_min=None, depth_max=None,
         response = {
             'status': True,
             'message': 'Link to the figure in result[0]',
-            'result': [f'{fig_url}/{fig_name}.html']}
+            'result': figure_links(fig_name, output)}
         status_code = 201
 
     return response, status_code
@@ -291,11 +523,13 @@ def get_line(platform_code_list, parameter_list, depth_min=None, depth_max=None,
 
 def thread_area(platform_code_list, parameter_list, fig_name, depth_min=None,
                 depth_max=None, time_min=None, time_max=None, qc=None,
-                template=None, detached=False):
+                template=None, detached=False, points=None,
+                render_mode=None, output='html'):
     """
     It creates an area figure, the x axis is the time and the y axis is the
     averave of values from the input parameter of the platform_code.
-    Save the figure in the {fig_folder}/{fig_name}.html
+    Save the figure in the {fig_folder}/{fig_name}.html, or
+    {fig_name}.json.gz with the output json.
 
     Parameters
     ----------
@@ -328,6 +562,13 @@ def thread_area(platform_code_list, parameter_list, fig_name, depth_min=None,
         detached: bool
             If detached is True, the function makes an html with the message
             'no data found'.
+        points: int
+            Maximum number of values per trace. If it is set, the raw data is
+            downsampled by the DB keeping the peaks and troughs.
+        render_mode: str
+            Options - auto, svg, webgl. See trace_mode().
+        output: str
+            Options - html, json. See save_figure().
     
     Returns
     -------
@@ -335,38 +576,37 @@ def thread_area(platform_code_list, parameter_list, fig_name, depth_min=None,
             Location of the figure (html file). If there is no data or a db
             connection error, it returns False
     """
-    rule = get_rule(platform_code_list, parameter_list, depth_min, depth_max,
-                    time_min, time_max, qc)  # rule is False if there is a db connection
-                                             # error
+    if points:
+        # The DB downsamples the raw data
+        rule = 'R'
+    else:
+        rule = get_rule(platform_code_list, parameter_list, depth_min,
+                        depth_max, time_min, time_max, qc)  # rule is False if
+                                                            # there is a db
+                                                            # connection error
 
     if rule:
         df = get_df(platform_code_list, parameter_list, rule, depth_min,
-                    depth_max, time_min, time_max, qc)
-
-        figure_path = f'{fig_folder}/{fig_name}.html'
+                    depth_max, time_min, time_max, qc, points)
 
         if df.empty:
             figure_path = False
         else:
-            fig = px.area(df, x='time', y='value', color='depth',
-                          line_group='platform_code', template=template,
-                          line_shape='spline', symbol='parameter')
-
-            plotly.io.write_html(fig, figure_path, config=config_fig, 
-                                 include_plotlyjs='cdn')
+            # The figure of px.area() is made without the objects of plotly
+            spec = area_spec(df, template, trace_mode(df, render_mode))
+            figure_path = save_figure(spec, fig_name, output)
     else:
         figure_path = False
 
     if figure_path == False and detached == True:
-        with open(f'{fig_folder}/{fig_name}.html', 'w') as fp:
-            fp.write('No data found')
+        save_no_data(fig_name, output)
 
     return figure_path
 
 
 def get_area(platform_code_list, parameter_list, depth_min=None, depth_max=None,
              time_min=None, time_max=None, qc=None, template=None,
-             multithread=True):
+             multithread=True, points=None, render_mode=None, output='html'):
     """
     Make an area figure using Plotly. The trace contains averages
     values of the input parameter. 
@@ -401,7 +641,16 @@ def get_area(platform_code_list, parameter_list, depth_min=None, depth_max=None,
             Getting the data and making the plot takes a while.
             This argument makes the figure with a secondary thread to avoid
             blocking the main program.
-    
+        points: int
+            Maximum number of values per trace.
+        render_mode: str
+            Options - auto, svg, webgl. By default, auto: the traces are drawn
+            with WebGL if the figure has more than webgl_points values.
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -413,6 +662,9 @@ def get_area(platform_code_list, parameter_list, depth_min=None, depth_max=None,
             The status_code is always 201 (created) if multithread = True,
             otherwhise status_code can be 404 if data is not found.
     """
+    if points is not None and points <= 0:
+        abort(400, 'points must be greater than 0')
+
     if isinstance(platform_code_list, str):
         platform_code_list = [platform_code_list]
     if isinstance(parameter_list, str):
@@ -424,34 +676,35 @@ def get_area(platform_code_list, parameter_list, depth_min=None, depth_max=None,
         f'-{(",").join(parameter_list)}' + \
         f'-dmin{depth_min}-dmax{depth_max}-tmin{time_min_str}' + \
         f'-tmax{time_max_str}-qc{qc}-template{template}'
+    if points:
+        fig_name += f'-points{points}'
+    if render_mode and render_mode != 'auto':
+        fig_name += f'-render{render_mode}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
 
+        path_fig = run_figure(fig_name, thread_area, multithread,
+                              platform_code_list, parameter_list, fig_name,
+                              depth_min, depth_max, time_min, time_max, qc,
+                              template, points=points,
+                              render_mode=render_mode,
+                              output=output,
+                              dependencies={
+                                  'platform_code': platform_code_list,
+                                  'parameter': parameter_list,
+                                  'time_min': time_min,
+                                  'time_max': time_max})
         if multithread:
-            f = threading.Thread(
-                target=thread_area,
-                args=(platform_code_list, parameter_list, fig_name, depth_min,
-                      depth_max, time_min, time_max, qc, template, True))
-            f.start()
-
-            response = {
-                'status': True,
-                'message': 'Working, please wait some minuts before ' + \
-                    'access to the link from result[0].',
-                'result': [f'{fig_url}/{fig_name}.html']}
-            status_code = 201
+            response, status_code = working_response(fig_name, output=output)
         else:
-            path_fig = thread_area(platform_code_list, parameter_list, fig_name,
-                                   depth_min, depth_max, time_min, time_max, qc,
-                                   template)
-
             if path_fig:
                 response = {
                     'status': True,
                     'message': 'Link to the figure in result[0]',
-                    'result': [f'{fig_url}/{fig_name}.html']}
+                    'result': figure_links(fig_name, output)}
                 status_code = 201
             else:
                 abort(404, 'Data not found')
@@ -460,21 +713,74 @@ def get_area(platform_code_list, parameter_list, depth_min=None, depth_max=None,
         response = {
             'status': True,
             'message': 'Link to the figure in result[0]',
-            'result': [f'{fig_url}/{fig_name}.html']}
+            'result': figure_links(fig_name, output)}
         status_code = 201
 
     return response, status_code
 
 
+def availability_search(platform_code, parameter, depth_min=None,
+                        depth_max=None, time_min=None, time_max=None, qc=None):
+    """
+    Make the filter of the data of an availability figure.
+
+    Parameters
+    ----------
+        platform_code: str or list of str
+            Platform code or list of platform_code.
+        parameter: str or list of str
+            Parameter acronym or list of parameters.
+
+    Returns
+    -------
+        query: QueryFilter
+    """
+    return QueryFilter(platform_code=platform_code, parameter=parameter,
+                       depth_min=depth_min, depth_max=depth_max,
+                       time_min=time_min, time_max=time_max, qc=qc)
+
+
+def availability_df(histogram, freq):
+    """
+    Make the DataFrame of a gantt figure with the time intervals with data.
+
+    Parameters
+    ----------
+        histogram: dict or bool
+            Histogram of get_time_histogram().
+        freq: str
+            Size of the buckets of the histogram, as pandas frequency.
+
+    Returns
+    -------
+        df: pandas DataFrame
+            Columns: Task, Start, Finish and Resource.
+    """
+    if not histogram:
+        return pd.DataFrame()
+
+    df_content = []
+    for key, times in histogram.items():
+        starts, ends = availability_intervals(times, freq)
+        df_content.append(pd.DataFrame({
+            'Task': str(key),
+            'Start': starts,
+            'Finish': ends,
+            'Resource': str(key)}))
+
+    return pd.concat(df_content, ignore_index=True)
+
+
 def thread_parameter_availability(parameter, platform_code_list, fig_name,
                                   depth_min=None, depth_max=None, time_min=None,
                                   time_max=None, qc=None, template=None,
-                                  detached=False):
+                                  detached=False, output='html'):
     """
     It creates an gantt figure, the x axis is the time and the y axis
     represents the aviability of the input parameter from the
     input platform_code list.
-    Save the figure in the {fig_folder}/{fig_name}.html
+    Save the figure in the {fig_folder}/{fig_name}.html, or
+    {fig_name}.json.gz with the output json.
 
     Parameters
     ----------
@@ -507,6 +813,8 @@ def thread_parameter_availability(parameter, platform_code_list, fig_name,
         detached: bool
             If detached is True, the function makes an html with the message
             'no data found'.
+        output: str
+            Options - html, json. See save_figure().
     
     Returns
     -------
@@ -519,55 +827,13 @@ def thread_parameter_availability(parameter, platform_code_list, fig_name,
 
     if rule:
 
-        figure_path = f'{fig_url}/{fig_name}.html'
+        # Time buckets with data of every platform
+        query = availability_search(platform_code_list, parameter, depth_min,
+                                    depth_max, time_min, time_max, qc)
+        histogram, freq = get_time_histogram(query, rule, 'platform_code')
 
-        # Create DataFrame
-        df_content = []
-        for platform_code in platform_code_list:
-            df_parameter = get_df(platform_code, parameter, rule, depth_min,
-                                depth_max, time_min, time_max, qc)
-
-            try:
-                df_parameter['time'] = pd.to_datetime(df_parameter['time'])
-                df_parameter.set_index('time', inplace=True)
-            except:
-                # df_parameter is empty
-                continue
-
-            df_parameter = df_parameter.resample(rule).mean()
-
-            ts = df_parameter['value'].isnull()
-            intervals = []
-            in_interval = False
-            end = None
-
-            for index, value in ts.items():
-                end = index.strftime('%Y-%m-%d %H:%M:%S')
-                if in_interval is False and value is False:
-                    in_interval = True
-                    start = index.strftime('%Y-%m-%d %H:%M:%S')
-                elif in_interval is True and value is True:
-                    in_interval = False
-                    intervals.append((start, end))
-                    if in_interval is True:
-                        intervals.append((start, end))
-            if not intervals:
-                df_parameter.reset_index(inplace=True)
-                start = df_parameter.iloc[0]['time'].strftime('%Y-%m-%d %H:%M:%S')
-                end = df_parameter.iloc[-1]['time'].strftime('%Y-%m-%d %H:%M:%S')
-                intervals.append((start, end))
-
-            # Make the dictionary
-            for start, end in intervals:
-                df_content.append(
-                    dict(
-                        Task=f'{platform_code}',
-                        Start=start,
-                        Finish=end,
-                        Resource=f'{platform_code}'))
-
-        # # Make fig
-        df = pd.DataFrame(df_content)
+        # Make fig
+        df = availability_df(histogram, freq)
 
         if df.empty:
             figure_path = False
@@ -584,20 +850,18 @@ def thread_parameter_availability(parameter, platform_code_list, fig_name,
 
             fig.update(layout_showlegend=False)
 
-            plotly.io.write_html(fig, f'{fig_folder}/{fig_name}.html',
-                                 config=config_fig, include_plotlyjs='cdn')
+            figure_path = save_figure(fig, fig_name, output)
     else:
         figure_path = False
 
     if figure_path == False and detached == True:
-        with open(f'{fig_folder}/{fig_name}.html', 'w') as fp:
-            fp.write('No data found')
+        save_no_data(fig_name, output)
     return figure_path
 
 
 def get_parameter_availability(parameter, depth_min=None, depth_max=None,
                                time_min=None, time_max=None, qc=None,
-                               template=None, multithread=True):
+                               template=None, multithread=True, output='html'):
     """
     Make an parameter aviability (gantt) figure using Plotly.
 
@@ -629,7 +893,11 @@ def get_parameter_availability(parameter, depth_min=None, depth_max=None,
             Getting the data and making the plot takes a while.
             This argument makes the figure with a secondary thread to avoid
             blocking the main program.
-    
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -648,7 +916,8 @@ def get_parameter_availability(parameter, depth_min=None, depth_max=None,
         f'dmax{depth_max}-tmin{time_min_str}-tmax{time_max_str}-qc{qc}' + \
         f'template{template}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
 
@@ -660,31 +929,23 @@ def get_parameter_availability(parameter, depth_min=None, depth_max=None,
         platform_code_list = response['result']
 
         if platform_code_list:
+            path_fig = run_figure(fig_name, thread_parameter_availability,
+                                  multithread, parameter, platform_code_list,
+                                  fig_name, depth_min, depth_max, time_min,
+                                  time_max, qc, template,
+                                  output=output,
+                                  dependencies={'parameter': parameter,
+                                                'time_min': time_min,
+                                                'time_max': time_max})
             if multithread:
-                j = threading.Thread(
-                    target=thread_parameter_availability,
-                    args=(parameter, platform_code_list, fig_name, depth_min,
-                          depth_max, time_min, time_max, qc, template, True))
-                j.start()
-
-                response = {
-                    'status': True,
-                    'message': 'Working, please wait some minuts before ' + \
-                        'access to the link from result[0].',
-                    'result': [f'{fig_url}/{fig_name}.html']}
-                status_code = 201
+                response, status_code = working_response(fig_name,
+                                                         output=output)
             else:
-                path_fig = thread_parameter_availability(parameter,
-                                                         platform_code_list,
-                                                         fig_name, depth_min,
-                                                         depth_max, time_min,
-                                                         time_max, qc, template)
-
                 if path_fig:
                     response = {
                         'status': True,
                         'message': 'Link to the figure in result[0]',
-                        'result': [f'{fig_url}/{fig_name}.html']}
+                        'result': figure_links(fig_name, output)}
                     status_code = 201
                 else:
                     abort(404, 'Data not found')
@@ -694,7 +955,7 @@ def get_parameter_availability(parameter, depth_min=None, depth_max=None,
         response = {
             'status': True,
             'message': 'Link to the figure in result[0]',
-            'result': [f'{fig_url}/{fig_name}.html']}
+            'result': figure_links(fig_name, output)}
         status_code = 201
 
     return response, status_code
@@ -702,11 +963,13 @@ def get_parameter_availability(parameter, depth_min=None, depth_max=None,
 
 def thread_platform_availability(platform_code, fig_name, depth_min=None,
                                  depth_max=None, time_min=None, time_max=None,
-                                 qc=None, template=None, detached=False):
+                                 qc=None, template=None, detached=False,
+                                 output='html'):
     """
     It creates an gantt figure, the x axis is the time and the y axis
     represents the aviability of the parameter of the input platform_code.
-    Save the figure in the {fig_folder}/{fig_name}.html
+    Save the figure in the {fig_folder}/{fig_name}.html, or
+    {fig_name}.json.gz with the output json.
 
     Parameters
     ----------
@@ -737,6 +1000,8 @@ def thread_platform_availability(platform_code, fig_name, depth_min=None,
         detached: bool
             If detached is True, the function makes an html with the message
             'no data found'.
+        output: str
+            Options - html, json. See save_figure().
     
     Returns
     -------
@@ -766,58 +1031,13 @@ def thread_platform_availability(platform_code, fig_name, depth_min=None,
 
     if rule:
 
-        figure_path = f'{fig_url}/{fig_name}.html'
-
-        df_content = []
-        for parameter in parameters:
+        # Time buckets with data of every parameter
+        query = availability_search(platform_code, parameters, depth_min,
+                                    depth_max, time_min, time_max, qc)
+        histogram, freq = get_time_histogram(query, rule, 'parameter')
 
-            df_parameter = get_df(platform_code, parameter, rule, depth_min,
-                                depth_max, time_min, time_max, qc)
-
-            try:
-                df_parameter['time'] = pd.to_datetime(df_parameter['time'])
-                df_parameter.set_index('time', inplace=True)
-            except KeyError:
-                # Empty df
-                continue
-
-            if rule != 'R':
-                df_parameter = df_parameter.resample(rule).mean()
-            else:
-                df_parameter = df_parameter.resample('H').mean()
-
-            ts = df_parameter['value'].isnull()
-            intervals = []
-            in_interval = False
-            end = None
-
-            for index, value in ts.items():
-                end = index.strftime('%Y-%m-%d %H:%M:%S')
-                if in_interval is False and value is False:
-                    in_interval = True
-                    start = index.strftime('%Y-%m-%d %H:%M:%S')
-                elif in_interval is True and value is True:
-                    in_interval = False
-                    intervals.append((start, end))
-                    if in_interval is True:
-                        intervals.append((start, end))
-            if not intervals:
-                df_parameter.reset_index(inplace=True)
-                start = df_parameter.iloc[0]['time'].strftime('%Y-%m-%d %H:%M:%S')
-                end = df_parameter.iloc[-1]['time'].strftime('%Y-%m-%d %H:%M:%S')
-                intervals.append((start, end))
-
-            # Make the dictionary
-            for start, end in intervals:
-                df_content.append(
-                    dict(
-                        Task=f'{parameter}',
-                        Start=start,
-                        Finish=end,
-                        Resource=f'{parameter}'))
-
-        # # Make fig
-        df = pd.DataFrame(df_content)
+        # Make fig
+        df = availability_df(histogram, freq)
 
         if df.empty:
             figure_path = False
@@ -835,20 +1055,18 @@ def thread_platform_availability(platform_code, fig_name, depth_min=None,
             fig.update(layout_showlegend=False)
             fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
 
-            plotly.io.write_html(fig, f'{fig_folder}/{fig_name}.html',
-                                config=config_fig, include_plotlyjs='cdn')
+            figure_path = save_figure(fig, fig_name, output)
     else:
         figure_path = False
 
     if figure_path == False and detached == True:
-        with open(f'{fig_folder}/{fig_name}.html', 'w') as fp:
-            fp.write('No data found')
+        save_no_data(fig_name, output)
     return figure_path
 
 
 def get_platform_availability(platform_code, depth_min=None, depth_max=None,
                               time_min=None, time_max=None, qc=None,
-                              template=None, multithread=True):
+                              template=None, multithread=True, output='html'):
     """
     Make an platform  aviability (gantt) figure using Plotly.
 
@@ -880,6 +1098,10 @@ def get_platform_availability(platform_code, depth_min=None, depth_max=None,
             Getting the data and making the plot takes a while.
             This argument makes the figure with a secondary thread to avoid
             blocking the main program.
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
 
     Returns
     -------
@@ -899,34 +1121,27 @@ def get_platform_availability(platform_code, depth_min=None, depth_max=None,
         f'-dmax{depth_max}-tmin{time_min_str}-tmax{time_max_str}-qc{qc}' + \
         f'-template{template}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
 
+        path_fig = run_figure(fig_name, thread_platform_availability,
+                              multithread, platform_code, fig_name, depth_min,
+                              depth_max, time_min, time_max, qc, template,
+                              output=output,
+                              dependencies={'platform_code': platform_code,
+                                            'time_min': time_min,
+                                            'time_max': time_max})
         if multithread:
-            j = threading.Thread(
-                    target=thread_platform_availability,
-                    args=(platform_code, fig_name, depth_min, depth_max,
-                          time_min, time_max, qc, True))
-            j.start()
-
-            response = {
-                'status': True,
-                'message': 'Working, please wait some minuts before access ' + \
-                    f'to the result link. {platform_code} availability',
-                'result': [f'{fig_url}/{fig_name}.html']
-            }
-            status_code = 201
+            response, status_code = working_response(
+                fig_name, f'{platform_code} availability', output)
         else:
-            path_fig =  thread_platform_availability(platform_code, fig_name,
-                                                     depth_min, depth_max,
-                                                     time_min, time_max, qc,
-                                                     template)
             if path_fig:
                 response = {
                     'status': True,
                     'message': f'{platform_code} availability',
-                    'result': [path_fig]}
+                    'result': figure_links(fig_name, output)}
                 status_code = 201
             else:
                 abort(404, 'Data not found')
@@ -934,7 +1149,7 @@ def get_platform_availability(platform_code, depth_min=None, depth_max=None,
         response = {
             'status': True,
             'message': f'{platform_code} availability',
-            'result': [f'{fig_url}/{fig_name}.html']
+            'result': figure_links(fig_name, output)
         }
         status_code = 201
 
@@ -943,7 +1158,7 @@ def get_platform_availability(platform_code, depth_min=None, depth_max=None,
 
 def get_parameter_pie(rule, platform_code_list=None, depth_min=None,
                       depth_max=None, time_min=None, time_max=None, qc=None,
-                      template=None):
+                      template=None, output='html'):
     """
     Make an parameter aviability (Pie Chart) figure using Plotly.
 
@@ -973,7 +1188,11 @@ def get_parameter_pie(rule, platform_code_list=None, depth_min=None,
             Options: 'ggplot2', 'seaborn', 'simple_white', 'plotly',
             'plotly_white', 'plotly_dark', 'presentation', 'xgridoff',
             'ygridoff' and 'gridon'.
-    
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -1000,7 +1219,8 @@ def get_parameter_pie(rule, platform_code_list=None, depth_min=None,
         f'-dmin{depth_min}-dmax{depth_max}-tmin{time_min_str}' + \
         f'-tmax{time_max_str}-qc{qc}-template{template}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
 
@@ -1013,18 +1233,20 @@ def get_parameter_pie(rule, platform_code_list=None, depth_min=None,
         parameter_list = response['result']
         
         if parameter_list:
-            # Create DataFrame
-            df = pd.DataFrame(parameter_list)
-            fig = px.pie(df, values='doc_count', names='key', template=template,
-                         labels={'key': 'Parameter',
-                                 'doc_count': 'Measurements'})
-            fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
-            plotly.io.write_html(fig, f'{fig_folder}/{fig_name}.html',
-                                 config=config_fig, include_plotlyjs='cdn')
+            spec = pie_spec(
+                [parameter['key'] for parameter in parameter_list],
+                [parameter['doc_count'] for parameter in parameter_list],
+                'Parameter', 'Measurements', template,
+                margin=dict(l=0, r=0, t=0, b=0))
+            save_figure(spec, fig_name, output)
+            figure_cache.put(fig_name, {'platform_code': platform_code_list,
+                                        'rule': rule, 'time_min': time_min,
+                                        'time_max': time_max},
+                             figure_extensions[output])
             response = {
                 'status': True,
                 'message': 'Link to the figure in result[0]',
-                'result': [f'{fig_url}/{fig_name}.html']}
+                'result': figure_links(fig_name, output)}
             status_code = 201
         else:
             abort(404, 'Data not found')
@@ -1032,14 +1254,15 @@ def get_parameter_pie(rule, platform_code_list=None, depth_min=None,
         response = {
             'status': True,
             'message': 'Link to the figure in result[0]',
-            'result': [f'{fig_url}/{fig_name}.html']}
+            'result': figure_links(fig_name, output)}
         status_code = 201
 
     return response, status_code
 
 
 def get_platform_pie(rule, parameter_list=None, depth_min=None, depth_max=None,
-                     time_min=None, time_max=None, qc=None, template=None):
+                     time_min=None, time_max=None, qc=None, template=None,
+                     output='html'):
     """
     Make an platform data number (Pie Chart) figure using Plotly.
 
@@ -1069,7 +1292,11 @@ def get_platform_pie(rule, parameter_list=None, depth_min=None, depth_max=None,
             Options: 'ggplot2', 'seaborn', 'simple_white', 'plotly',
             'plotly_white', 'plotly_dark', 'presentation', 'xgridoff',
             'ygridoff' and 'gridon'.
-    
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -1097,49 +1324,42 @@ def get_platform_pie(rule, parameter_list=None, depth_min=None, depth_max=None,
         f'-dmax{depth_max}-tmin{time_min_str}-tmax{time_max_str}-qc{qc}' + \
         f'-template{template}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
 
-        # Get metadata ids
-        response, status_code = get_metadata()
-
-        if status_code != 200:
-            return response, status_code
-
-        platform_code_list = response['result']
-
-        data_content = []
-        for platform_code in platform_code_list:
-
-            response, status_code = get_data_count(rule,
-                                                   platform_code=platform_code,
-                                                   parameter=parameter_list,
-                                                   depth_min=depth_min,
-                                                   depth_max=depth_max,
-                                                   time_min=time_min,
-                                                   time_max=time_max, qc=qc)
-            if status_code != 200:
-                continue
-
-            count = int(response['result'][0])
-            if count > 0:
-                data_content.append(
-                    {'Platform Code': platform_code, 'Measurements': count})
+        # Number of values of every platform, only if it has metadata
+        try:
+            counts = get_platform_counts(rule, parameter=parameter_list,
+                                         depth_min=depth_min,
+                                         depth_max=depth_max,
+                                         time_min=time_min, time_max=time_max,
+                                         qc=qc)
+            metadata = get_metadata_sources(list(counts), fields=[])
+        except exceptions.ConnectionError:
+            abort(503, 'Connection error with the DB')
+
+        data_content = [
+            {'Platform Code': platform_code, 'Measurements': count}
+            for platform_code, count in counts.items()
+            if count > 0 and platform_code in metadata]
 
         if data_content:
-            # Create DataFrame
-            df = pd.DataFrame(data_content)
-            fig = px.pie(df, values='Measurements', names='Platform Code',
-                         template=template)
-
-            plotly.io.write_html(fig, f'{fig_folder}/{fig_name}.html',
-                                 config=config_fig, include_plotlyjs='cdn')
+            spec = pie_spec(
+                [content['Platform Code'] for content in data_content],
+                [content['Measurements'] for content in data_content],
+                'Platform Code', 'Measurements', template)
+            save_figure(spec, fig_name, output)
+            figure_cache.put(fig_name, {'parameter': parameter_list,
+                                        'rule': rule, 'time_min': time_min,
+                                        'time_max': time_max},
+                             figure_extensions[output])
 
             response = {
                 'status': True,
                 'message': 'Platform pie',
-                'result': [f'{fig_url}/{fig_name}.html']
+                'result': figure_links(fig_name, output)
             }
             status_code = 201
         else:
@@ -1149,7 +1369,7 @@ def get_platform_pie(rule, parameter_list=None, depth_min=None, depth_max=None,
         response = {
             'status': True,
             'message': 'Link to the figure in result[0]',
-            'result': [f'{fig_url}/{fig_name}.html']}
+            'result': figure_links(fig_name, output)}
         status_code = 201
     
     return response, status_code
@@ -1157,7 +1377,7 @@ def get_platform_pie(rule, parameter_list=None, depth_min=None, depth_max=None,
 
 def get_map(rule, platform_code_list=None, parameter_list=None, depth_min=None,
             depth_max=None, time_min=None, time_max=None, qc=None,
-            template=None):
+            template=None, output='html'):
     """
     Make a map with the points where we have data that match with the input
     parameters.append()
@@ -1190,7 +1410,11 @@ def get_map(rule, platform_code_list=None, parameter_list=None, depth_min=None,
             Options: 'ggplot2', 'seaborn', 'simple_white', 'plotly',
             'plotly_white', 'plotly_dark', 'presentation', 'xgridoff',
             'ygridoff' and 'gridon'
-    
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -1226,67 +1450,47 @@ def get_map(rule, platform_code_list=None, parameter_list=None, depth_min=None,
         f'-dmin{depth_min}-dmax{depth_max}-tmin{time_min_str}' + \
         f'-tmax{time_max_str}-qc{qc}-template{template}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         # Check if folder exist
         if not os.path.exists(fig_folder):
             os.makedirs(fig_folder)
 
-        if platform_code_list is None:
-            # Get metadata list
-            response, status_code = get_metadata()
-            if status_code != 200:
-                return response, status_code
-            
-            platform_code_list = response['result']
-
-        if not platform_code_list:
+        # Platforms with data and their metadata
+        try:
+            counts = get_platform_counts(rule, platform_code=platform_code_list,
+                                         parameter=parameter_list,
+                                         depth_min=depth_min,
+                                         depth_max=depth_max,
+                                         time_min=time_min, time_max=time_max,
+                                         qc=qc)
+            metadata = get_metadata_sources(
+                [platform for platform, count in counts.items() if count > 0],
+                fields=['last_latitude_observation',
+                        'last_longitude_observation', 'parameters',
+                        'start_date_observation', 'end_date_observation'])
+        except exceptions.ConnectionError:
+            abort(503, 'Connection error with the DB')
+
+        if not metadata:
             abort(404, 'Data not found')
 
-        latitudes = []
-        longitudes = []
-        parameters = []
-        start_dates = []
-        end_dates = []
-        for platform in platform_code_list:
-
-            response, status_code = get_data_count(rule, platform_code=platform,
-                                                   parameter=parameter_list,
-                                                   depth_min=depth_min,
-                                                   depth_max=depth_max,
-                                                   time_min=time_min,
-                                                   time_max=time_max, qc=qc)
-            if status_code != 200:
-                continue
-            
-            count = int(response['result'][0])
-            if count > 0:
-                # Get metadata information
-                response, status_code = get_metadata_id(platform)
-                if status_code != 200:
-                    return response, status_code
-
-                lat = float(
-                    response['result'][0][platform].get(
-                        'last_latitude_observation'))
-                lon = float(
-                    response['result'][0][platform].get(
-                        'last_longitude_observation'))
-                latitudes.append(lat)
-                longitudes.append(lon)
-                parameters.append(
-                    f'{" ,".join(response["result"][0][platform].get("parameters"))}')
-                start_dates.append(
-                    f'{response["result"][0][platform].get("start_date_observation")}')
-                end_dates.append(
-                    f'{response["result"][0][platform].get("end_date_observation")}')
-
-        geo_df = pd.DataFrame(
-            list(zip(
-                latitudes, longitudes, platform_code_list, parameters,
-                start_dates, end_dates)),
-            columns =['lat', 'lon', 'platform_code', 'parameters', 'start_date',
-                      'end_date'])
+        geo_content = []
+        for platform, platform_metadata in metadata.items():
+            geo_content.append({
+                'lat': float(
+                    platform_metadata.get('last_latitude_observation')),
+                'lon': float(
+                    platform_metadata.get('last_longitude_observation')),
+                'platform_code': platform,
+                'parameters': " ,".join(
+                    platform_metadata.get('parameters', [])),
+                'start_date':
+                    f'{platform_metadata.get("start_date_observation")}',
+                'end_date':
+                    f'{platform_metadata.get("end_date_observation")}'})
+        geo_df = pd.DataFrame(geo_content)
 
         px.set_mapbox_access_token(mapbox_access_token)
         fig = px.scatter_mapbox(geo_df,
@@ -1296,13 +1500,17 @@ def get_map(rule, platform_code_list=None, parameter_list=None, depth_min=None,
                                 zoom=1, template=template)
         fig.update_layout(margin=dict(l=0, r=0, t=0, b=0))
 
-        plotly.io.write_html(fig, f'{fig_folder}/{fig_name}.html',
-                             include_plotlyjs='cdn')
+        save_figure(fig, fig_name, output, config=None)
+        figure_cache.put(fig_name, {'platform_code': platform_code_list,
+                                    'parameter': parameter_list,
+                                    'rule': rule, 'time_min': time_min,
+                                    'time_max': time_max},
+                         figure_extensions[output])
     
     response = {
         'status': True,
         'message': 'Link to the figure in result[0]',
-        'result': [f'{fig_url}/{fig_name}.html']
+        'result': figure_links(fig_name, output)
     }
     status_code = 201
 
@@ -1313,7 +1521,8 @@ def thread_scatter(platform_code_x, parameter_x, platform_code_y, parameter_y,
                    fig_name, color=None, marginal_x=None,
                    marginal_y=None, trendline=None, template=None,
                    depth_min=None, depth_max=None, time_min=None, time_max=None,
-                   qc=None, detached=False):
+                   qc=None, detached=False, depth_bin=None,
+                   render_mode=None, output='html'):
     
     platform_code_list = [platform_code_x, platform_code_y]
     if parameter_y != 'depth':
@@ -1331,7 +1540,7 @@ def thread_scatter(platform_code_x, parameter_x, platform_code_y, parameter_y,
 
     if rule:
 
-        figure_path = f'{fig_folder}/{fig_name}.html'
+        figure_path = figure_cache.path(fig_name, figure_extensions[output])
 
         if parameter_x != 'time':
             # Get x
@@ -1354,14 +1563,16 @@ def thread_scatter(platform_code_x, parameter_x, platform_code_y, parameter_y,
                 return figure_path
 
         if parameter_x == parameter_y:
-            df = df_x.join(df_y, how='left',
-                           lsuffix=f'_{parameter_x}', rsuffix=f'_{parameter_y}')
-            df.reset_index(inplace=True)
+            df = align_series(df_x.reset_index(), df_y.reset_index(),
+                              f'{platform_code_x}-{parameter_x}',
+                              f'{platform_code_y}-{parameter_y}',
+                              time_tolerance(rule))
 
             fig = px.scatter(df, x=f'{platform_code_x}-{parameter_x}',
                              y=f'{platform_code_y}-{parameter_y}', color=color,
                              marginal_x=marginal_x,
                              marginal_y=marginal_y, trendline=trendline,
+                             render_mode=trace_mode(df, render_mode),
                              template=template)
         else:
 
@@ -1388,68 +1599,56 @@ def thread_scatter(platform_code_x, parameter_x, platform_code_y, parameter_y,
                                     trendline=trendline,
                                     trendline_options=dict(
                                         function="mean", window=rolling_window),
+                                    render_mode=trace_mode(df, render_mode),
                                     template=template)
 
                 else:
-                    df = df_x.join(df_y, how='left',
-                                lsuffix=f'_{parameter_x}',
-                                rsuffix=f'_{parameter_y}')
-                    df.reset_index(inplace=True)
+                    df = align_series(df_x.reset_index(), df_y.reset_index(),
+                                      f'{platform_code_x}-{parameter_x}',
+                                      f'{platform_code_y}-{parameter_y}',
+                                      time_tolerance(rule))
                     fig = px.scatter(df, x=f'{platform_code_x}-{parameter_x}',
                                      y=f'{platform_code_y}-{parameter_y}',
                                      color=color, marginal_x=marginal_x,
                                      marginal_y=marginal_y, trendline=trendline,
+                                     render_mode=trace_mode(df, render_mode),
                                      template=template)
             else:
-                # Chage defauld color
-                if color == 'depth':
-                    color = None
-
-                # Make the df
-                df = df_x
-                df.reset_index(inplace=True)
-                del df['time']
-                del df['platform_code']
-                del df['parameter']
-                df = df.apply(pd.to_numeric)
-                df[f'{platform_code_x}-{parameter_x}'] = df[f'{platform_code_x}-{parameter_x}'].astype("float")
-                df.sort_values('depth', inplace=True)
-
-                depth = 0.25
-                max_depth = 30
-                inc_depth = depth
-
-                df_depth = pd.DataFrame()
-                df_25 = df[df['depth'] <= depth]
-                df_depth = df_25.mean().to_frame().T
-
-                while depth <= max_depth:
-                    upper_depth = depth + inc_depth
-                    df_split = df[df['depth'] <= upper_depth]
-                    df_split = df_split[df_split['depth'] > depth]
-                    depth += inc_depth
-                    if df_split.empty:
-                        continue
-                    df_depth = pd.concat(
-                        [df_depth, df_split.mean().to_frame().T], axis=0)
-
-                fig = px.scatter(df_depth, x=f'{platform_code_x}-{parameter_x}',
+                # The profile has no time and the depth is in the y axis
+                color = None
+
+                # Mean, minimum and maximum of every depth bin, in the depth
+                # range of the request or of the data
+                column = f'{platform_code_x}-{parameter_x}'
+                df = df_x.reset_index()
+                df_depth = depth_profile(df, column,
+                                         depth_bin or default_depth_bin,
+                                         depth_min, depth_max)
+                if df_depth.empty:
+                    figure_path = False
+                    return figure_path
+
+                fig = px.scatter(df_depth, x=column,
                                  y=f'{parameter_y}',
+                                 error_x=df_depth['max'] - df_depth[column],
+                                 error_x_minus=df_depth[column] - \
+                                     df_depth['min'],
+                                 hover_data=['min', 'max', 'count'],
                                  color=color, marginal_x=marginal_x,
                                  marginal_y=marginal_y, trendline=trendline,
+                                 render_mode=trace_mode(df_depth,
+                                                        render_mode),
                                  template=template)
 
                 fig['layout']['yaxis']['autorange'] = 'reversed'
 
-        plotly.io.write_html(fig, f'{fig_folder}/{fig_name}.html',
-                             config=config_fig, include_plotlyjs='cdn')
+        save_figure(fig, fig_name, output)
 
     else:
         figure_path = False
 
     if figure_path == False and detached == True:
-        with open(f'{fig_folder}/{fig_name}.html', 'w') as fp:
-            fp.write('No data found')
+        save_no_data(fig_name, output)
     return figure_path
 
 
@@ -1457,9 +1656,11 @@ def get_scatter(platform_code_x, paramerer_x, platform_code_y, parameter_y,
                 color=None, marginal_x=None,
                 marginal_y=None, trendline=None, template=None, depth_min=None,
                 depth_max=None, time_min=None, time_max=None, qc=None,
-                multithread=True):
+                multithread=True, depth_bin=None, render_mode=None,
+                output='html'):
     """
-    Make a scatter figure using Plotly.
+    Make a scatter figure using Plotly. If parameter_y is depth, the figure is
+    the depth profile of parameter_x.
 
     Parameters
     ----------
@@ -1501,7 +1702,18 @@ def get_scatter(platform_code_x, paramerer_x, platform_code_y, parameter_y,
             Getting the data and making the plot takes a while.
             This argument makes the figure with a secondary thread to avoid
             blocking the main program.
-    
+        depth_bin: float
+            Size of the depth bins of the profile, in meters. By default,
+            default_depth_bin. The bins start at depth_min or at the minimum
+            depth of the data.
+        render_mode: str
+            Options - auto, svg, webgl. By default, auto: the traces are drawn
+            with WebGL if the figure has more than webgl_points values.
+        output: str
+            Options - html, json. With json, the figure is saved as a gzip
+            compressed Plotly JSON and the result has the links to the JSON
+            and to its viewer.
+
     Returns
     -------
         (response, status_code): (dict, int)
@@ -1513,6 +1725,9 @@ def get_scatter(platform_code_x, paramerer_x, platform_code_y, parameter_y,
             The status_code is always 201 (created) if multithread = True,
             otherwhise status_code can be 404 if data is not found.
     """
+    if depth_bin is not None and depth_bin <= 0:
+        abort(400, 'depth_bin must be greater than 0')
+
     time_min_str, time_max_str = time_to_str(time_min, time_max)
 
     # Create the filename
@@ -1521,40 +1736,37 @@ def get_scatter(platform_code_x, paramerer_x, platform_code_y, parameter_y,
         f'-MX{marginal_x}' + \
         f'-MY-{marginal_y}-TL-{trendline}-TM-{template}-dmin{depth_min}' + \
         f'-dmax{depth_max}-tmin{time_min_str}-tmax{time_max_str}-qc{qc}'
+    if depth_bin and parameter_y == 'depth':
+        fig_name += f'-dbin{depth_bin}'
+    if render_mode and render_mode != 'auto':
+        fig_name += f'-render{render_mode}'
 
-    if not os.path.exists(f'{fig_folder}/{fig_name}.html'):
+    fig_name = figure_key(fig_name, output)
+    if not figure_cache.get(fig_name, figure_extensions[output]):
 
         create_fig_folder()
 
+        path_fig = run_figure(fig_name, thread_scatter, multithread,
+                              platform_code_x, paramerer_x, platform_code_y,
+                              parameter_y, fig_name, color, marginal_x,
+                              marginal_y, trendline, template, depth_min,
+                              depth_max, time_min, time_max, qc,
+                              depth_bin=depth_bin, render_mode=render_mode,
+                              output=output,
+                              dependencies={
+                                  'platform_code': [platform_code_x,
+                                                    platform_code_y],
+                                  'parameter': [paramerer_x, parameter_y],
+                                  'time_min': time_min,
+                                  'time_max': time_max})
         if multithread:
-            f = threading.Thread(
-                target=thread_scatter,
-                args=(platform_code_x, paramerer_x, platform_code_y,
-                      parameter_y, fig_name, color, marginal_x,
-                      marginal_y, trendline, template, depth_min, depth_max,
-                      time_min, time_max, qc, True))
-            f.start()
-
-            response = {
-                'status': True,
-                'message': 'Working, please wait some minuts before access ' + \
-                    'to the result link.',
-                'result': [f'{fig_url}/{fig_name}.html']}
-            status_code = 201
-
+            response, status_code = working_response(fig_name, output=output)
         else:
-            path_fig = thread_scatter(platform_code_x, paramerer_x,
-                                      platform_code_y, parameter_y, fig_name,
-                                      color,
-                                      marginal_x, marginal_y, trendline,
-                                      template, depth_min, depth_max, time_min,
-                                      time_max, qc, False)
-
             if path_fig:
                 response = {
                     'status': True,
                     'message': 'Link to the figure in result[0]',
-                    'result': [f'{fig_url}/{fig_name}.html']}
+                    'result': figure_links(fig_name, output)}
                 status_code = 201
             else:
                 abort(404, 'Data not found')
@@ -1562,7 +1774,84 @@ def get_scatter(platform_code_x, paramerer_x, platform_code_y, parameter_y,
         response = {
             'status': True,
             'message': 'Link to the figure in result[0]',
-            'result': [f'{fig_url}/{fig_name}.html']}
+            'result': figure_links(fig_name, output)}
         status_code = 201
 
     return response, status_code
+
+
+def get_figure_status(fig_name):
+    """
+    Get the state of a figure.
+
+    Parameters
+    ----------
+        fig_name: str
+            Key of the figure in the figure cache.
+
+    Returns
+    -------
+        (response, status_code): (dict, int)
+            The response is a dictionary with the keys -> status, message and
+            result.
+                The status is a bool that says if the operation was successful.
+                The message is a str with comments for the user.
+                The result contains a dict with the keys name, state (queued,
+                running, done or failed), submitted, started, finished, error
+                and link.
+            The status_code is 200 (OK) or 404 if the figure is unknown.
+    """
+    status = figure_jobs.status(fig_name)
+
+    output = figure_output(fig_name)
+
+    if status is None:
+        # The figure was made before the last restart or by other process
+        if os.path.exists(figure_cache.path(fig_name,
+                                            figure_extensions[output])):
+            status = {'name': fig_name, 'state': 'done'}
+        else:
+            abort(404, 'Figure not found')
+
+    status['link'] = figure_links(fig_name, output)[0]
+
+    response = {
+        'status': True,
+        'message': f'The figure is {status["state"]}',
+        'result': [status]}
+    status_code = 200
+    return response, status_code
+
+
+def get_figure_json(fig_name):
+    """
+    Get the file of the Plotly JSON of a figure made with the output json.
+
+    Parameters
+    ----------
+        fig_name: str
+            Key of the figure in the figure cache.
+
+    Returns
+    -------
+        figure_path: str
+            Path of the gzip compressed JSON file.
+    """
+    figure_path = None
+    if figure_output(fig_name) == 'json':
+        figure_path = figure_cache.get(fig_name, figure_extensions['json'])
+    if not figure_path:
+        abort(404, 'Figure not found')
+    return figure_path
+
+
+def get_figure_viewer():
+    """
+    Get the page that draws the Plotly JSON of the figures. The key of the
+    figure is the parameter key of the URL, like /figure/viewer?key=line-0123
+
+    Returns
+    -------
+        html: str
+    """
+    return viewer_html(json.dumps(config_fig, sort_keys=True))
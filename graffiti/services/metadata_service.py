@@ -1,8 +1,11 @@
+from elasticsearch_dsl import Search
 
+from ..utils.elastic_manager import get_elastic
 
+from config import metadata_index
 
 def get_metadata(search_string=None):
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     # Get all ids
     elastic_search = Search(using=elastic, index=metadata_index)
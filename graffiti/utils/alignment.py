@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from .helper import rule_interval
+
+# Maximum difference of depth, in meters, between two aligned values
+default_depth_tolerance = 0.5
+
+
+def time_tolerance(rule):
+    """
+    Maximum difference of time between two aligned values of a rule: half of
+    the interval of its averages.
+
+    Parameters
+    ----------
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+
+    Returns
+    -------
+        tolerance: pandas Timedelta
+    """
+    interval, _ = rule_interval(rule)
+    if 'fixed_interval' in interval:
+        return pd.Timedelta(interval['fixed_interval']) / 2
+    # Calendar months
+    return pd.Timedelta(days=31) / 2
+
+
+def series_frame(df, column):
+    """
+    Time, depth and values of a series as numbers, without missing values and
+    sorted by time.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+            Data with the columns time, depth and column.
+        column: str
+            Column with the values.
+
+    Returns
+    -------
+        series: pandas DataFrame
+    """
+    series = pd.DataFrame({
+        'time': pd.to_datetime(df['time'], utc=True, format='ISO8601',
+                               errors='coerce'),
+        'depth': pd.to_numeric(df['depth'], errors='coerce'),
+        column: pd.to_numeric(df[column], errors='coerce')})
+    series = series.dropna()
+    return series.sort_values('time', kind='mergesort').reset_index(drop=True)
+
+
+def match_depths(depths_x, depths_y, tolerance):
+    """
+    Nearest depth of x of every depth of y.
+
+    Parameters
+    ----------
+        depths_x: array of float
+        depths_y: array of float
+        tolerance: float
+            Maximum difference of depth.
+
+    Returns
+    -------
+        matches: pandas Series
+            The index is the depth of y and the value is the depth of x, or
+            NaN if there is no depth of x closer than the tolerance.
+    """
+    left = pd.DataFrame({'depth': np.unique(depths_y)})
+    right = pd.DataFrame({'depth': np.unique(depths_x)})
+    right['depth_x'] = right['depth']
+    matches = pd.merge_asof(left, right, on='depth', direction='nearest',
+                            tolerance=tolerance)
+    return matches.set_index('depth')['depth_x']
+
+
+def align_series(df_x, df_y, column_x, column_y, time_tolerance,
+                 depth_tolerance=default_depth_tolerance, dropna=True):
+    """
+    Join two series that are not measured at the same times or depths. Every
+    value of x is paired with the value of y of the nearest depth and, at that
+    depth, the nearest time, if they are within the tolerances. Both joins are
+    merges of sorted arrays, O(N log N).
+
+    Parameters
+    ----------
+        df_x: pandas DataFrame
+            Data with the columns time, depth and column_x.
+        df_y: pandas DataFrame
+            Data with the columns time, depth and column_y.
+        column_x: str
+            Column with the values of x.
+        column_y: str
+            Column with the values of y.
+        time_tolerance: pandas Timedelta
+            Maximum difference of time, see time_tolerance().
+        depth_tolerance: float
+            Maximum difference of depth, in meters.
+        dropna: bool
+            Delete the values of x without value of y.
+
+    Returns
+    -------
+        df: pandas DataFrame
+            Columns: time and depth of x, column_x and column_y. Sorted by
+            time.
+    """
+    series_x = series_frame(df_x, column_x)
+    series_y = series_frame(df_y, column_y)
+
+    # The values of y are moved to the nearest depth of x, and then the times
+    # are matched at every depth
+    depths = match_depths(series_x['depth'].to_numpy(),
+                          series_y['depth'].to_numpy(), depth_tolerance)
+    series_y['depth'] = series_y['depth'].map(depths)
+    series_y = series_y.dropna(subset=['depth'])
+
+    df = pd.merge_asof(series_x, series_y, on='time', by='depth',
+                       direction='nearest', tolerance=time_tolerance)
+    if dropna:
+        df = df.dropna(subset=[column_y]).reset_index(drop=True)
+    return df
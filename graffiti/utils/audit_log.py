@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+from elasticsearch import exceptions, helpers
+
+from .elastic_manager import get_elastic
+
+from config import (api_index, audit_queue_size, audit_batch_size,
+                    audit_flush_interval, audit_spill_file)
+
+
+class AuditLog:
+    """
+    Log of the requests to the API that does not block the requests. The
+    records are put in a bounded queue and a background thread sends them to
+    the DB with the _bulk API every batch_size records or flush_interval
+    milliseconds. If the DB is not available, the records are saved in a JSON
+    lines file and they are sent again after the next successful flush.
+
+    Parameters
+    ----------
+        index_name: str
+            Name of the index of the records.
+        queue_size: int
+            Maximum number of records waiting in the queue. The records are
+            dropped when the queue is full.
+        batch_size: int
+            Number of records per _bulk request.
+        flush_interval: int
+            Maximum milliseconds that a record waits in the queue.
+        spill_file: str
+            Path of the JSON lines file with the records that could not be
+            sent.
+    """
+    def __init__(self, index_name, queue_size, batch_size, flush_interval,
+                 spill_file):
+        self.index_name = index_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval / 1000
+        self.spill_file = spill_file
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.thread_pid = None
+        self.counters = {
+            'queued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'failed': 0,
+            'errors': 0
+        }
+
+    def record(self, body):
+        """
+        Add a record to the queue. It never blocks.
+
+        Parameters
+        ----------
+            body: dict
+                Record of the request.
+
+        Returns
+        -------
+            queued: bool
+                False if the queue is full and the record is dropped.
+        """
+        self._start()
+        try:
+            self.queue.put_nowait(body)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def stats(self):
+        """
+        Get the counters of the log.
+
+        Returns
+        -------
+            stats: dict
+                Keys: queued, flushed, dropped, spilled, replayed, failed
+                (records rejected by the DB or unreadable in the spill file),
+                errors (unexpected errors of the background thread) and
+                pending (records waiting in the queue).
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        stats['pending'] = self.queue.qsize()
+        return stats
+
+    def flush(self):
+        """ Send all the records of the queue to the DB """
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._send(batch)
+                batch = []
+        if batch:
+            self._send(batch)
+
+    def _count(self, counter, number=1):
+        with self.lock:
+            self.counters[counter] += number
+
+    def _start(self):
+        # The thread of a parent process does not exist after a fork
+        if self.thread is not None and self.thread_pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is None or self.thread_pid != os.getpid():
+                self.thread = threading.Thread(target=self._run,
+                                               name='audit-log', daemon=True)
+                self.thread_pid = os.getpid()
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # The thread is not restarted if it dies, so an error only loses
+            # the batch
+            try:
+                self._send(batch)
+            except Exception as e:
+                self._count('errors')
+                print(f'Audit log error: {e}')
+
+    def _bulk(self, records):
+        actions = ({'_index': self.index_name, '_source': record}
+                   for record in records)
+        indexed, errors = helpers.bulk(get_elastic(), actions,
+                                       chunk_size=self.batch_size,
+                                       raise_on_error=False)
+        if errors:
+            self._count('failed', len(errors))
+        return indexed
+
+    def _send(self, batch):
+        try:
+            self._count('flushed', self._bulk(batch))
+        except (exceptions.ConnectionError, exceptions.TransportError):
+            self._spill(batch)
+            return
+        self._replay()
+
+    def _spill(self, batch):
+        with self.lock:
+            with open(self.spill_file, 'a') as spill:
+                for record in batch:
+                    spill.write(json.dumps(record) + '\n')
+            self.counters['spilled'] += len(batch)
+
+    def _replay(self):
+        # The file is renamed, so the records that fail again are spilled to
+        # a new file
+        with self.lock:
+            if not os.path.exists(self.spill_file):
+                return
+            replay_file = f'{self.spill_file}.replay'
+            os.replace(self.spill_file, replay_file)
+
+        records = []
+        with open(replay_file) as replay:
+            for line in replay:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A line cut by a crash while it was spilled
+                    self._count('failed')
+        os.remove(replay_file)
+
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            try:
+                indexed = self._bulk(batch)
+            except (exceptions.ConnectionError, exceptions.TransportError):
+                self._spill(records[start:])
+                return
+            self._count('flushed', indexed)
+            self._count('replayed', len(batch))
+
+
+# Log of the requests to the API
+audit_log = AuditLog(api_index, audit_queue_size, audit_batch_size,
+                     audit_flush_interval, audit_spill_file)
+
+
+@atexit.register
+def _flush_audit_log():
+    try:
+        audit_log.flush()
+    except Exception:
+        pass
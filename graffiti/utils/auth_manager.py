@@ -1,10 +1,17 @@
+import json
+import time
+import base64
+import hashlib
+import threading
 import urllib3
 
+from collections import OrderedDict
 from keycloak import KeycloakOpenID, exceptions  # pip install python-keycloak
 from flask import abort
 
 from config import (keycloak_config, test_token, data_portal_token, test_user,
-                    test_email, data_portal_user, data_portal_email)
+                    test_email, data_portal_user, data_portal_email,
+                    token_cache_size, token_cache_ttl, public_key_ttl)
 
 
 # Dissable the InsecureRequestWarning that is raised in the connection with the
@@ -20,6 +27,142 @@ keycloak_openid = KeycloakOpenID(server_url=keycloak_config['issuer'],
                                      'client_secret'],
                                  verify=keycloak_config['verify'])
 
+# Minimum seconds between two downloads of the keys after a kid miss, so
+# tokens with unknown kids can not flood the AAI
+public_key_min_refresh = 10
+
+_keys_lock = threading.Lock()
+_keys = {
+    'realm': None,  # Public key of the realm
+    'jwks': {},  # JSON Web Keys by kid
+    'updated': 0.0
+}
+
+_claims_lock = threading.Lock()
+_claims = OrderedDict()  # sha256 of the token -> (user_info, expires)
+
+
+def token_header(auth_token):
+    """
+    Read the header of a JWT without verifying it.
+
+    Parameters
+    ----------
+        auth_token: str
+            JWT
+
+    Returns
+    -------
+        header: dict
+    """
+    header = auth_token.split('.')[0]
+    header += '=' * (-len(header) % 4)
+    return json.loads(base64.urlsafe_b64decode(header))
+
+
+def refresh_public_keys():
+    """ Download the public key and the JSON Web Keys of the realm """
+    realm = keycloak_openid.public_key()
+    try:
+        jwks = {key['kid']: key
+                for key in keycloak_openid.certs().get('keys', [])
+                if 'kid' in key}
+    except exceptions.KeycloakError:
+        jwks = {}
+
+    _keys['realm'] = realm
+    _keys['jwks'] = jwks
+    _keys['updated'] = time.monotonic()
+
+
+def get_public_key(kid=None):
+    """
+    Get the key to decode a token. The keys of the AAI are cached for
+    public_key_ttl seconds and they are downloaded again if the token is
+    signed with an unknown key.
+
+    Parameters
+    ----------
+        kid: str
+            Key ID of the header of the token.
+
+    Returns
+    -------
+        key: dict or str
+            JSON Web Key with the kid, or the public key of the realm.
+    """
+    with _keys_lock:
+        age = time.monotonic() - _keys['updated']
+        if _keys['realm'] is None or age > public_key_ttl or \
+                (kid and kid not in _keys['jwks'] and
+                 age > public_key_min_refresh):
+            refresh_public_keys()
+
+        if kid and kid in _keys['jwks']:
+            return _keys['jwks'][kid]
+        return _keys['realm']
+
+
+def decode_user(auth_token):
+    """
+    Get the user information of a token of the AAI. The information of the
+    tokens is cached until the token expires, for a maximum of
+    token_cache_ttl seconds.
+
+    Parameters
+    ----------
+        auth_token: str
+            JWT
+
+    Returns
+    -------
+        user_info: dict
+            Keys: user_id, email and admin.
+    """
+    token_hash = hashlib.sha256(auth_token.encode()).hexdigest()
+    now = time.time()
+
+    with _claims_lock:
+        cached = _claims.get(token_hash)
+        if cached is not None:
+            user_info, expires = cached
+            if now < expires:
+                _claims.move_to_end(token_hash)
+                return dict(user_info)
+            del _claims[token_hash]
+
+    # Decode token with keyloak
+    try:
+        kid = token_header(auth_token).get('kid')
+    except ValueError:
+        kid = None
+    KEYCLOAK_PUBLIC_KEY = get_public_key(kid)
+    options = {"verify_signature": False, "verify_aud": False, "exp": True}
+    token_info = keycloak_openid.decode_token(
+        auth_token, key=KEYCLOAK_PUBLIC_KEY, options=options)
+
+    admin = 0
+    if '/api_admin' in token_info['groups']:
+        admin = 1
+
+    user_info = {
+        'user_id': token_info['preferred_username'],
+        'email': token_info['email'],
+        'admin': admin
+    }
+
+    expires = now + token_cache_ttl
+    if token_info.get('exp'):
+        expires = min(expires, float(token_info['exp']))
+    if expires > now:
+        with _claims_lock:
+            _claims[token_hash] = (user_info, expires)
+            _claims.move_to_end(token_hash)
+            while len(_claims) > token_cache_size:
+                _claims.popitem(last=False)
+
+    return dict(user_info)
+
 
 def get_token_info(new_request):
     """
@@ -63,24 +206,10 @@ def get_token_info(new_request):
             }
         else:
             try:
-                # Decode token with keyloak
-                KEYCLOAK_PUBLIC_KEY = keycloak_openid.public_key()
-                options = {"verify_signature": False, "verify_aud": False, "exp": True}
-                token_info = keycloak_openid.decode_token(
-                    auth_token, key=KEYCLOAK_PUBLIC_KEY, options=options)
-
-                admin = 0
-                if '/api_admin' in token_info['groups']:
-                    admin = 1
-
                 response = {
                     'status': True,
                     'message': 'Success',
-                    'result': {
-                        'user_id': token_info['preferred_username'],
-                        'email': token_info['email'],
-                        'admin': admin
-                    }
+                    'result': decode_user(auth_token)
                 }
             
             except:
@@ -144,24 +273,10 @@ class Auth:
 
         if auth_token:
             try:
-                # Decode token with keyloak
-                KEYCLOAK_PUBLIC_KEY = keycloak_openid.public_key()
-                options = {"verify_signature": False, "verify_aud": False, "exp": True}
-                token_info = keycloak_openid.decode_token(
-                    auth_token, key=KEYCLOAK_PUBLIC_KEY, options=options)
-
-                admin = 0
-                if '/api_admin' in token_info['groups']:
-                    admin = 1
-
                 response_object = {
                     'status': True,
                     'message': 'Success',
-                    'result': {
-                        'user_id': token_info['preferred_username'],
-                        'email': token_info['email'],
-                        'admin': admin
-                    }
+                    'result': decode_user(auth_token)
                 }
 
                 return response_object, 201
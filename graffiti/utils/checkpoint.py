@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+# Chunk that marks that all the data of a rule and method is ingested
+complete = ''
+
+
+def file_hash(file_path, block_size=1 << 20):
+    """
+    SHA-256 of the content of a file.
+
+    Parameters
+    ----------
+        file_path: str
+            Path of the file.
+        block_size: int
+            Bytes read at once.
+
+    Returns
+    -------
+        file_hash: str
+            Hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """
+    Progress of the ingestion of the data files, saved in a SQLite database.
+    Every ingested chunk is a row keyed by the hash of the file, the rule, the
+    method and the name of the chunk, so a restarted ingestion skips the
+    chunks that are already in the DB. It can be used by several processes
+    at the same time.
+
+    Parameters
+    ----------
+        path: str
+            Path of the SQLite database. It is created if it does not exist.
+    """
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=60,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoint ('
+            'file_hash TEXT NOT NULL, '
+            'rule TEXT NOT NULL, '
+            'method TEXT NOT NULL, '
+            'chunk TEXT NOT NULL, '
+            'file_name TEXT, '
+            'created REAL NOT NULL, '
+            'PRIMARY KEY (file_hash, rule, method, chunk))')
+
+    def is_done(self, file_hash, rule, method, chunk=complete):
+        """
+        Check if a chunk is ingested. By default, it checks if all the data
+        of the rule and method is ingested.
+
+        Returns
+        -------
+            done: bool
+        """
+        row = self.connection.execute(
+            'SELECT 1 FROM checkpoint WHERE file_hash = ? AND rule = ? AND '
+            'method = ? AND chunk = ?',
+            (file_hash, rule, method, chunk)).fetchone()
+        return row is not None
+
+    def done_chunks(self, file_hash, rule, method):
+        """
+        Get the ingested chunks of a rule and method.
+
+        Returns
+        -------
+            chunks: set of str
+        """
+        rows = self.connection.execute(
+            'SELECT chunk FROM checkpoint WHERE file_hash = ? AND rule = ? '
+            'AND method = ?', (file_hash, rule, method))
+        return {row[0] for row in rows}
+
+    def mark_done(self, file_hash, rule, method, chunk=complete,
+                  file_name=None):
+        """
+        Save that a chunk is ingested. By default, it saves that all the data
+        of the rule and method is ingested, and the rows of its chunks are
+        deleted.
+        """
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute(
+                'INSERT OR REPLACE INTO checkpoint VALUES (?, ?, ?, ?, ?, ?)',
+                (file_hash, rule, method, chunk, file_name, time.time()))
+            if chunk == complete:
+                self.connection.execute(
+                    'DELETE FROM checkpoint WHERE file_hash = ? AND rule = ? '
+                    'AND method = ? AND chunk != ?',
+                    (file_hash, rule, method, complete))
+
+    def import_log(self, log_path, file_hashes, methods):
+        """
+        Import the progress of the old ingestion log. Every line of the log is
+        '<file name> <rule>' or '<file name> <rule>_<METHOD>'.
+
+        Parameters
+        ----------
+            log_path: str
+                Path of the log.
+            file_hashes: dict
+                Hash of every file name.
+            methods: list of str
+                Methods of the log, like mean, min and max.
+
+        Returns
+        -------
+            imported: int
+                Number of imported lines.
+        """
+        try:
+            with open(log_path) as log_file:
+                lines = [line.strip() for line in log_file]
+        except FileNotFoundError:
+            return 0
+
+        imported = 0
+        for line in lines:
+            file_name, _, name = line.rpartition(' ')
+            if file_name not in file_hashes:
+                continue
+
+            rule, method = name, 'mean'
+            for one_method in methods:
+                suffix = f'_{one_method.upper()}'
+                if one_method != 'mean' and name.endswith(suffix):
+                    rule, method = name[:-len(suffix)], one_method
+
+            if not self.is_done(file_hashes[file_name], rule, method):
+                self.mark_done(file_hashes[file_name], rule, method,
+                               file_name=file_name)
+                imported += 1
+        return imported
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,118 @@
+import time
+
+from elasticsearch import exceptions
+
+from .elastic_manager import get_elastic
+from .db_manager import rule_indexes
+
+# Name of the index template of the data indexes
+data_template = 'graffiti-data'
+
+# Mapping of the data documents. The fields that are filtered by exact values
+# are keywords and the time, depth and value have doc_values to be sorted and
+# aggregated.
+data_mapping = {
+    'properties': {
+        'platform_code': {'type': 'keyword'},
+        'parameter': {'type': 'keyword'},
+        'qc': {'type': 'keyword'},
+        'time': {'type': 'date', 'doc_values': True},
+        'time_qc': {'type': 'keyword'},
+        'depth': {'type': 'double', 'doc_values': True},
+        'depth_qc': {'type': 'keyword'},
+        'value': {'type': 'double', 'doc_values': True},
+        'lat': {'type': 'double'},
+        'lat_qc': {'type': 'keyword'},
+        'lon': {'type': 'double'},
+        'lon_qc': {'type': 'keyword'}
+    }
+}
+
+
+def put_data_template():
+    """
+    Create or update the index template of the data indexes. It is applied to
+    the rule indexes and their migrated copies when they are created.
+    """
+    patterns = sorted({f'{index}*' for _, index in rule_indexes})
+    get_elastic().indices.put_template(name=data_template, body={
+        'index_patterns': patterns,
+        'mappings': data_mapping
+    })
+
+
+def has_data_mapping(index):
+    """
+    Check if an index has the mapping of the data indexes.
+
+    Parameters
+    ----------
+        index: str
+            Name or alias of the index.
+
+    Returns
+    -------
+        same_mapping: bool
+    """
+    mappings = get_elastic().indices.get_mapping(index=index)
+    for index_mappings in mappings.values():
+        properties = index_mappings['mappings'].get('properties', {})
+        for field, field_mapping in data_mapping['properties'].items():
+            if field in properties and \
+                    properties[field].get('type') != field_mapping['type']:
+                return False
+    return True
+
+
+def migrate_index(index, force=False):
+    """
+    Copy a rule index into a new index with the data mapping. The new index is
+    named {index}-{timestamp} and the name of the old index becomes an alias
+    of it, so the API does not need any change. The ingestion must be stopped
+    during the migration.
+
+    Parameters
+    ----------
+        index: str
+            Name of the index in the configuration.
+        force: bool
+            Migrate the index even if it already has the data mapping.
+
+    Returns
+    -------
+        new_index: str or None
+            Name of the new index. None if the index does not exist or it does
+            not need the migration.
+    """
+    elastic = get_elastic()
+
+    try:
+        if not force and has_data_mapping(index):
+            return None
+    except exceptions.NotFoundError:
+        return None
+
+    aliases = elastic.indices.get_alias(index=index)
+    old_indexes = list(aliases)
+    is_alias = index not in old_indexes
+
+    new_index = f'{index}-{time.strftime("%Y%m%d%H%M%S")}'
+    elastic.indices.create(index=new_index)
+    elastic.reindex(body={'source': {'index': index},
+                          'dest': {'index': new_index}},
+                    slices='auto', refresh=True, wait_for_completion=True,
+                    request_timeout=24 * 3600)
+
+    if is_alias:
+        actions = [{'remove': {'index': old_index, 'alias': index}}
+                   for old_index in old_indexes]
+        actions.append({'add': {'index': new_index, 'alias': index}})
+        elastic.indices.update_aliases(body={'actions': actions})
+        for old_index in old_indexes:
+            elastic.indices.delete(index=old_index)
+    else:
+        # An alias can not have the name of an existing index
+        elastic.indices.delete(index=index)
+        elastic.indices.put_alias(index=new_index, name=index)
+
+    return new_index
@@ -1,26 +1,68 @@
 import os
-import glob
+import numpy as np
 import pandas as pd
 import hashlib as hash
 import json
 import requests
 import datetime
+import threading
+import time
 
-from elasticsearch import Elasticsearch, exceptions
+from elasticsearch import exceptions, helpers
 from elasticsearch_dsl import Search, A
 from xml.etree import ElementTree as ET
 from flask import abort, request
 
-from .helper import index_name, time_to_str
+from .helper import index_name, valid_range, rule_interval
 from .auth_manager import get_token_info
-
-from config import (elastic_host, data_index_r, data_index_h, data_index_2h,
+from .query import QueryFilter
+from .elastic_manager import get_elastic
+from . import df_cache
+from .file_cache import export_cache
+from .invalidation import Change, publish, subscribe
+from .summary import summary_counts
+
+from config import (data_index_r, data_index_h, data_index_2h,
                     data_index_3h, data_index_6h, data_index_8h, data_index_12h,
                     data_index_d, data_index_2d, data_index_3d, data_index_4d,
                     data_index_5d, data_index_6d, data_index_10d, api_index,
-                    data_index_15d, data_index_m, max_plot_points, df_folder,
-                    metadata_index, vocabulary_index, fig_folder, pid_folder,
-                    pid_url, csv_folder, csv_url)
+                    data_index_15d, data_index_m, max_plot_points,
+                    metadata_index, vocabulary_index, pid_folder,
+                    pid_url, csv_folder, csv_url, scan_page_size,
+                    rule_cache_ttl, bulk_chunk_size, bulk_thread_count)
+
+# Default search.max_buckets of the DB since Elasticsearch 7.9, used if the
+# setting can not be read. The aggregations split their buckets to stay under
+# it.
+default_max_buckets = 65535
+_max_buckets = None
+
+# Fields of the data documents that are needed to make a DataFrame
+data_fields = ['time', 'depth', 'value', 'qc', 'platform_code', 'parameter']
+
+# Average rules and their indexes, from the finest to the coarsest
+rule_indexes = [
+    ('R', data_index_r),
+    ('H', data_index_h),
+    ('2H', data_index_2h),
+    ('3H', data_index_3h),
+    ('6H', data_index_6h),
+    ('8H', data_index_8h),
+    ('12H', data_index_12h),
+    ('D', data_index_d),
+    ('2D', data_index_2d),
+    ('3D', data_index_3d),
+    ('4D', data_index_4d),
+    ('5D', data_index_5d),
+    ('6D', data_index_6d),
+    ('10D', data_index_10d),
+    ('15D', data_index_15d),
+    ('M', data_index_m)
+]
+
+# Memo of the rule counts. Key: normalized query, value: (time, counts)
+_rule_counts_cache = {}
+_rule_counts_lock = threading.Lock()
 
 
 def data_ingestion(index_name, data):
@@ -40,133 +82,295 @@ def data_ingestion(index_name, data):
             201 if data is ingested, 500 if Connection Error
     """
     status = 500
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
     try:
         elastic.index(index=index_name, document=data)
 
         status = 201
     except exceptions.ConnectionError:
         status = 500
-    elastic.close()
     return status
 
 
-def good_rule(search_string):
+def make_data_id(data):
     """
-    Data is ingested in several average periods. This function helps to decide
-    the average rule according to the input search string and the configured
-    max_plot_points.
+    ID of a data document: platform_code, parameter, depth and time.
 
     Parameters
     ----------
-        search_string: str
-            Search string for Elastic Search
-    
+        data: dict
+            Data document.
+
     Returns
     -------
-        rule: str - bool
-            The best rule to use. If the function detects a connection error
-            or a bad search query (check the dates), it returns False
+        data_id: str
     """
-    elastic_indexes = [
-        ('R', data_index_r),
-        ('H', data_index_h),
-        ('2H', data_index_2h),
-        ('3H', data_index_3h),
-        ('6H', data_index_6h),
-        ('8H', data_index_8h),
-        ('12H', data_index_12h),
-        ('D', data_index_d),
-        ('2D', data_index_2d),
-        ('3D', data_index_3d),
-        ('4D', data_index_4d),
-        ('5D', data_index_5d),
-        ('6D', data_index_6d),
-        ('10D', data_index_10d),
-        ('15D', data_index_15d),
-        ('M', data_index_m)
-    ]
-    # Convert search string to dict
-    search_dict = eval(search_string)
-
-    depth_min = search_dict.pop('depth_min', False)
-    depth_max = search_dict.pop('depth_max', False)
-    time_min = search_dict.pop('time_min', False)
-    time_max = search_dict.pop('time_max', False)
+    return f"{data['platform_code']}_{data['parameter']}_{data['depth']}" + \
+        f"_{data['time'].replace(' ', '_')}"
 
-    search_body = {}
-    search_body['query'] = {'bool': {'must': []}}
-    for key, value in search_dict.items():
-        if isinstance(value, list):
-            should_search = {'bool': {'should': []}}
-            for element in value:
-                should_search['bool']['should'].append(
-                    {'match': {key: element}})
-            search_body['query']['bool']['must'].append(should_search)
-        else:
-            search_body['query']['bool']['must'].append(
-                {'match': {key: value}})
 
-    if depth_min or depth_max:
-        search_range = {'range': {}}
-        search_range['range']['depth'] = {}
+def post_data_bulk(index_name, documents, chunk_size=None, thread_count=None):
+    """
+    Add many data documents to the DB with the _bulk API. The documents are
+    sent in chunks while they are generated, so they do not need to be in
+    memory at the same time. A document with errors does not stop the
+    ingestion of the others.
 
-        if depth_min:
-            search_range['range']['depth']['gte'] = depth_min
-        if depth_max:
-            search_range['range']['depth']['lte'] = depth_max
+    Parameters
+    ----------
+        index_name: str
+            Name of the index.
+        documents: iterable of dict
+            Data documents (see post_data).
+        chunk_size: int
+            Number of documents per request. By default, bulk_chunk_size.
+        thread_count: int
+            Number of requests at the same time. By default,
+            bulk_thread_count.
 
-        search_body['query']['bool']['must'].append(search_range)
+    Returns
+    -------
+        (response, status_code): (dict, int)
+            The response is a dict with 3 keys:
+                'status': True if all documents are ingested,
+                'message': Summary of the ingestion,
+                'result': [{'indexed': int, 'errors': int,
+                            'docs_per_second': float,
+                            'error_samples': list}]
+            The status_code is 201 (created) or 503 if there is a connection
+            error with the DB.
+    """
+    chunk_size = chunk_size or bulk_chunk_size
+    thread_count = thread_count or bulk_thread_count
+
+    actions = ({'_index': index_name, '_id': make_data_id(data),
+                '_source': data} for data in documents)
+
+    elastic = get_elastic()
+    if thread_count > 1:
+        results = helpers.parallel_bulk(elastic, actions,
+                                        thread_count=thread_count,
+                                        chunk_size=chunk_size,
+                                        raise_on_error=False,
+                                        raise_on_exception=False)
+    else:
+        results = helpers.streaming_bulk(elastic, actions,
+                                         chunk_size=chunk_size,
+                                         raise_on_error=False,
+                                         raise_on_exception=False)
+
+    indexed = 0
+    errors = 0
+    error_samples = []
+    connection_error = False
+    start = time.monotonic()
+    try:
+        for ok, item in results:
+            if ok:
+                indexed += 1
+            else:
+                errors += 1
+                if len(error_samples) < 10:
+                    error_samples.append(item)
+    except exceptions.ConnectionError as e:
+        # The caller is the ingestion worker, out of a request
+        connection_error = True
+        error_samples.append(str(e))
+    seconds = time.monotonic() - start
+
+    docs_per_second = (indexed + errors) / seconds if seconds else 0.0
+    print(f'{index_name}: {indexed} documents indexed, {errors} errors, ' + \
+          f'{docs_per_second:.0f} docs/sec')
 
-    if time_min or time_max:
-        search_range = {'range': {}}
-        search_range['range']['time'] = {}
+    response = {
+        'status': errors == 0 and not connection_error,
+        'message': f'{indexed} documents indexed, {errors} errors',
+        'result': [{
+            'indexed': indexed,
+            'errors': errors,
+            'docs_per_second': docs_per_second,
+            'error_samples': error_samples
+        }]
+    }
+    status_code = 201
+    if connection_error:
+        response['message'] = 'Connection error with the DB. ' + \
+            response['message']
+        status_code = 503
+    return response, status_code
 
-        if time_min:
-            search_range['range']['time']['gte'] = time_min
-        if time_max:
-            search_range['range']['time']['lte'] = time_max
 
-        search_body['query']['bool']['must'].append(search_range)
+def refresh_indexes(index_names):
+    """
+    Make the documents of the bulk ingestions visible to the searches, like
+    the aggregations of the summary. post_data_bulk() does not refresh the
+    indexes.
 
-    elastic = Elasticsearch(elastic_host)
+    Parameters
+    ----------
+        index_names: list of str
+            Names of the data indexes.
+    """
+    if index_names:
+        get_elastic().indices.refresh(index=','.join(sorted(index_names)),
+                                      ignore_unavailable=True)
 
-    rule = 'R'
-    for rule_in, index in elastic_indexes:
-        try:
-            elastic_search = Search(
-                    using=elastic, index=index).update_from_dict(search_body)
-            
-        except exceptions.ConnectionError:
-            elastic.close()
-            return False
 
-        try:
-            count = elastic_search.count()
-        except exceptions.NotFoundError:
-            count = 0
-        except exceptions.ConnectionError:
-            elastic.close()
-            return False
-        except exceptions.RequestError:
-            elastic.close()
+def make_search_body(query):
+    """
+    Convert a query filter into the body of an Elastic Search query.
+
+    Parameters
+    ----------
+        query: QueryFilter, dict or str
+            Filter of the data. A dict (or its JSON) has the arguments of
+            QueryFilter.
+
+    Returns
+    -------
+        search_body: dict
+            Body of the query.
+    """
+    return QueryFilter.of(query).to_body()
+
+
+def get_rule_counts(query, filters):
+    """
+    Count the data of every rule index that match with the query and each one
+    of the input filters. All the counts are obtained with a single _msearch
+    request, and they are memoized for rule_cache_ttl seconds.
+
+    Parameters
+    ----------
+        query: QueryFilter
+            Filter of the data.
+        filters: dict
+            The key is a name and the value is a QueryFilter that is applied
+            on top of the query.
+
+    Returns
+    -------
+        counts: dict - bool
+            The key is the name of the filter and the value is a dict with the
+            number of data per rule. If the function detects a connection
+            error or a bad search query (check the dates), it returns False
+    """
+    query = QueryFilter.of(query)
+    cache_key = (query, tuple(sorted(filters.items())))
+
+    with _rule_counts_lock:
+        cached = _rule_counts_cache.get(cache_key)
+    if cached and time.monotonic() - cached[0] < rule_cache_ttl:
+        return cached[1]
+
+    body = []
+    for _, index in rule_indexes:
+        body.append({'index': index})
+        body.append({
+            'size': 0,
+            'query': query.to_query(),
+            'aggs': {'combinations': {'filters': {'filters': {
+                name: one_filter.to_query()
+                for name, one_filter in filters.items()}}}}})
+
+    elastic = get_elastic()
+    try:
+        response = elastic.msearch(body=body)
+    except (exceptions.ConnectionError, exceptions.RequestError):
+        return False
+
+    counts = {name: {} for name in filters}
+    for (rule, _), rule_response in zip(rule_indexes, response['responses']):
+        error = rule_response.get('error')
+        if error:
+            if error.get('type') == 'index_not_found_exception':
+                continue
             return False
-        
+
+        buckets = rule_response['aggregations']['combinations']['buckets']
+        for name in filters:
+            counts[name][rule] = buckets[name]['doc_count']
+
+    with _rule_counts_lock:
+        # Forget the expired queries
+        now = time.monotonic()
+        for key in [key for key, (cache_time, _) in _rule_counts_cache.items()
+                    if now - cache_time >= rule_cache_ttl]:
+            del _rule_counts_cache[key]
+        _rule_counts_cache[cache_key] = (now, counts)
+
+    return counts
+
+
+@subscribe
+def forget_rule_counts(changes):
+    """ Forget the memoized rule counts of the queries of the changed data """
+    changes = [change for change in changes if change.kind == 'data']
+    with _rule_counts_lock:
+        for key in list(_rule_counts_cache):
+            query = key[0].to_dict()
+            if any(change.overlaps(query.get('platform_code'),
+                                   query.get('parameter'))
+                   for change in changes):
+                del _rule_counts_cache[key]
+
+
+def select_rule(counts):
+    """
+    Decide the average rule according to the number of data per rule and the
+    configured max_plot_points.
+
+    Parameters
+    ----------
+        counts: dict
+            Number of data per rule.
+
+    Returns
+    -------
+        rule: str
+            The best rule to use.
+    """
+    rule = 'R'
+    for rule_in, _ in rule_indexes:
+        count = counts.get(rule_in, 0)
         if (count != 0 and count < max_plot_points) or rule == 'M':
             rule = rule_in
-    elastic.close()
     return rule
 
 
-def get_data(search_string=None, rule=None):
+def good_rule(query):
+    """
+    Data is ingested in several average periods. This function helps to decide
+    the average rule according to the input query and the configured
+    max_plot_points.
+
+    Parameters
+    ----------
+        query: QueryFilter
+            Filter of the data.
+    
+    Returns
+    -------
+        rule: str - bool
+            The best rule to use. If the function detects a connection error
+            or a bad search query (check the dates), it returns False
+    """
+    counts = get_rule_counts(query, {'all': QueryFilter()})
+    if counts is False:
+        return False
+
+    return select_rule(counts['all'])
+
+
+def get_data(query=None, rule=None):
     """
     Get a list if ids odf data from the database that match with the input
-    search_string.
+    query.
 
     Parameters
     ----------
-        search_string: str
-            Search query for elasticsearch
+        query: QueryFilter
+            Filter of the data. By default, all the data.
         rule: str
             Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
 
@@ -180,58 +384,11 @@ def get_data(search_string=None, rule=None):
                 The reslut is a list of the ids of data.
             The status_code is 200 (found) or 404 (not found).
     """
-    elastic = Elasticsearch(elastic_host)
-
-    if search_string:
-        # Convert search string to dict
-        search_dict = eval(search_string)
-
-        depth_min = search_dict.pop('depth_min', False)
-        depth_max = search_dict.pop('depth_max', False)
-        time_min = search_dict.pop('time_min', False)
-        time_max = search_dict.pop('time_max', False)
-
-        search_body = {}
-        search_body['query'] = {'bool': {'must': []}}
-        for key, value in search_dict.items():
-            if isinstance(value, list):
-                should_search = {'bool': {'should': []}}
-                for element in value:
-                    should_search['bool']['should'].append(
-                        {'match': {key: element}})
-                search_body['query']['bool']['must'].append(should_search)
-            else:
-                search_body['query']['bool']['must'].append(
-                    {'match': {key: value}})
-
-        if depth_min or depth_max:
-            search_range = {'range': {}}
-            search_range['range']['depth'] = {}
-
-            if depth_min:
-                search_range['range']['depth']['gte'] = depth_min
-            if depth_max:
-                search_range['range']['depth']['lte'] = depth_max
-
-            search_body['query']['bool']['must'].append(search_range)
-
-        if time_min or time_max:
-            search_range = {'range': {}}
-            search_range['range']['time'] = {}
-
-            if time_min:
-                search_range['range']['time']['gte'] = time_min
-            if time_max:
-                search_range['range']['time']['lte'] = time_max
+    elastic = get_elastic()
 
-            search_body['query']['bool']['must'].append(search_range)
-
-        elastic_search = Search(
-            using=elastic, index=index_name(rule)).update_from_dict(search_body)
-
-    else:
-        # Get all ids
-        elastic_search = Search(using=elastic, index=index_name(rule))
+    elastic_search = Search(
+        using=elastic, index=index_name(rule)).update_from_dict(
+            make_search_body(query))
 
     elastic_search = elastic_search.source([])  # only get ids
     ids = [h.meta.id for h in elastic_search.scan()]
@@ -252,7 +409,6 @@ def get_data(search_string=None, rule=None):
         }
         status_code = 404
 
-    elastic.close()
 
     return response, status_code
 
@@ -280,7 +436,7 @@ def get_data_id(id_data, rule=None):
             The status_code is 200 - found, 204 - not found or 503 -
             connection error
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
         response = elastic.get(index=index_name(rule), id=id_data)
@@ -314,13 +470,433 @@ def get_data_id(id_data, rule=None):
         }
         status_code = 503
 
-    elastic.close()
 
     return response, status_code
 
 
+def get_data_source(query=None, rule=None, fields=None, sort=False):
+    """
+    Get the content of the data documents that match with the input
+    query. The documents are read in pages from the scroll cursor of
+    the search, so there is no need of one request per document.
+
+    Parameters
+    ----------
+        query: QueryFilter
+            Filter of the data. By default, all the data.
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
+        fields: list of str
+            Fields of the documents to return. By default, data_fields.
+        sort: bool
+            Return the documents sorted by time.
+
+    Yields
+    ------
+        source: dict
+            The _source of each document, only with the requested fields.
+    """
+    if fields is None:
+        fields = data_fields
+
+    elastic_search = Search(
+        using=get_elastic(), index=index_name(rule)).update_from_dict(
+            make_search_body(query))
+
+    elastic_search = elastic_search.source(fields).params(size=scan_page_size)
+    if sort:
+        elastic_search = elastic_search.sort('time').params(
+            preserve_order=True)
+
+    try:
+        for hit in elastic_search.scan():
+            yield hit.to_dict()
+    except exceptions.NotFoundError:
+        pass
+
+
+def get_max_buckets():
+    """
+    Get the maximum number of buckets of an aggregation, the search.max_buckets
+    setting of the DB. It is read once per process.
+
+    Returns
+    -------
+        max_buckets: int
+    """
+    global _max_buckets
+
+    if _max_buckets is not None:
+        return _max_buckets
+    try:
+        settings = get_elastic().cluster.get_settings(include_defaults=True,
+                                                      flat_settings=True)
+    except exceptions.ConnectionError:
+        # It is read again with the next aggregation
+        return default_max_buckets
+    except exceptions.TransportError as e:
+        # The user of the DB may not be allowed to read the settings
+        print(f'Error getting search.max_buckets: {e}')
+        settings = {}
+    for level in ('transient', 'persistent', 'defaults'):
+        value = settings.get(level, {}).get('search.max_buckets')
+        if value is not None:
+            _max_buckets = int(value)
+            return _max_buckets
+    _max_buckets = default_max_buckets
+    return _max_buckets
+
+
+def get_data_buckets(query, rule, points, value_min=None, value_max=None):
+    """
+    Get a downsampled version of the data that match with the input
+    query. The DB splits the time range in points / 2 buckets per
+    depth and returns the minimum and the maximum value of every bucket at the
+    time they were measured, so the peaks and troughs of the series are kept.
+    The number of buckets per depth is reduced if all the depths would exceed
+    search.max_buckets.
+
+    Parameters
+    ----------
+        query: QueryFilter
+            Filter of the data.
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
+        points: int
+            Maximum number of values per depth. It must be greater than 0.
+        value_min: float
+            Minimum valid value.
+        value_max: float
+            Maximum valid value.
+
+    Returns
+    -------
+        data: list of dict or False
+            The keys of the dicts are time, depth and value. False if the DB
+            can not make the aggregation.
+    """
+    if int(points) <= 0:
+        raise ValueError('points must be greater than 0')
+
+    search_body = QueryFilter.of(query).replace(
+        value_min=value_min, value_max=value_max).to_body()
+
+    elastic = get_elastic()
+
+    # Get the time range and the number of depths to know the size of the
+    # buckets
+    elastic_search = Search(
+        using=elastic, index=index_name(rule)).update_from_dict(search_body)
+    elastic_search = elastic_search.extra(size=0)
+    elastic_search.aggs.metric('time_stats', 'stats', field='time')
+    elastic_search.aggs.metric('depth_count', 'cardinality', field='depth')
+    try:
+        aggregations = elastic_search.execute().aggregations
+    except exceptions.NotFoundError:
+        return []
+    except (exceptions.RequestError, exceptions.TransportError) as e:
+        print(f'Error getting the time range of the data: {e}')
+        return False
+    time_stats = aggregations.time_stats
+    if not time_stats.count:
+        return []
+
+    # Every depth has a terms bucket and up to buckets + 1 time buckets
+    depths = max(aggregations.depth_count.value, 1)
+    buckets = max(min(int(points) // 2, get_max_buckets() // depths - 2), 1)
+    interval = max(
+        int((time_stats.max - time_stats.min) // buckets) + 1, 1000)
+
+    elastic_search = Search(
+        using=elastic, index=index_name(rule)).update_from_dict(search_body)
+    elastic_search = elastic_search.extra(size=0)
+    times = elastic_search.aggs.bucket(
+        'depths', 'terms', field='depth', size=10000).bucket(
+            'times', 'date_histogram', field='time',
+            fixed_interval=f'{interval}ms', min_doc_count=1)
+    times.metric('value_min', 'top_hits', size=1, sort=[{'value': 'asc'}],
+                 _source=['time', 'value'])
+    times.metric('value_max', 'top_hits', size=1, sort=[{'value': 'desc'}],
+                 _source=['time', 'value'])
+    try:
+        response = elastic_search.execute()
+    except exceptions.NotFoundError:
+        return []
+    except (exceptions.RequestError, exceptions.TransportError) as e:
+        print(f'Error downsampling the data: {e}')
+        return False
+
+    data = []
+    for depth_bucket in response.aggregations.depths.buckets:
+        for time_bucket in depth_bucket.times.buckets:
+            extremes = [time_bucket.value_min.hits.hits[0]['_source']]
+            if time_bucket.doc_count > 1:
+                extremes.append(time_bucket.value_max.hits.hits[0]['_source'])
+                # The values are in the order they were measured, so the lines
+                # do not go back in time
+                extremes.sort(key=lambda source: source['time'])
+            for source in extremes:
+                data.append({
+                    'time': source['time'],
+                    'depth': depth_bucket.key,
+                    'value': source['value']})
+    return data
+
+
+def get_time_extent(platform_code, parameter, rule):
+    """
+    Get the time of the first and the last data of a platform_code and
+    parameter.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
+
+    Returns
+    -------
+        extent: list of str
+            [time_min, time_max] or an empty list if there is no data.
+    """
+    search_body = QueryFilter(platform_code=platform_code,
+                              parameter=parameter).to_body()
+
+    elastic_search = Search(
+        using=get_elastic(), index=index_name(rule)).update_from_dict(
+            search_body)
+    elastic_search = elastic_search.extra(size=0)
+    elastic_search.aggs.metric('time_stats', 'stats', field='time')
+    try:
+        time_stats = elastic_search.execute().aggregations.time_stats
+    except exceptions.NotFoundError:
+        return []
+    if not time_stats.count:
+        return []
+    return [time_stats.min_as_string, time_stats.max_as_string]
+
+
+def histogram_rule(time_stats, terms, rule):
+    """
+    Finest rule, from the input rule to the coarsest one, whose date histogram
+    of the time range of the data and all the terms stays under
+    search.max_buckets.
+
+    Parameters
+    ----------
+        time_stats: AttrDict
+            Stats aggregation of the time of the data.
+        terms: int
+            Number of values of the field that splits the buckets.
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+
+    Returns
+    -------
+        rule: str
+            Rule of the interval of the buckets. It is never R, whose interval
+            is the one of H.
+    """
+    max_buckets = get_max_buckets()
+    names = [name for name, _ in rule_indexes]
+    candidates = names[max(names.index(rule), names.index('H')):]
+    for candidate in candidates:
+        interval, _ = rule_interval(candidate)
+        # The months are counted with their shortest length
+        size = pd.Timedelta(interval.get('fixed_interval', '28d'))
+        buckets = (time_stats.max - time_stats.min) // (
+            size.total_seconds() * 1000) + 2
+        if terms * (buckets + 1) <= max_buckets:
+            return candidate
+    return candidates[-1]
+
+
+def get_time_histogram(query, rule, field):
+    """
+    Get the time buckets with data of every value of a field. The size of the
+    buckets is the interval of the rule, or the interval of a coarser rule if
+    all the buckets would exceed search.max_buckets.
+
+    Parameters
+    ----------
+        query: QueryFilter
+            Filter of the data.
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+        field: str
+            Field to split the buckets, like platform_code or parameter.
+
+    Returns
+    -------
+        (histogram, freq): (dict or bool, str)
+            The keys of the histogram are the values of the field and the
+            values are arrays with the start time of the buckets with data
+            (epoch milliseconds). The histogram is False if there is an error
+            with the DB. The freq is the size of the buckets as pandas
+            frequency.
+    """
+    search_body = make_search_body(query)
+    elastic = get_elastic()
+
+    # Get the time range and the number of terms to know the size of the
+    # buckets
+    elastic_search = Search(
+        using=elastic, index=index_name(rule)).update_from_dict(search_body)
+    elastic_search = elastic_search.extra(size=0)
+    elastic_search.aggs.metric('time_stats', 'stats', field='time')
+    elastic_search.aggs.metric('term_count', 'cardinality', field=field)
+    try:
+        aggregations = elastic_search.execute().aggregations
+    except exceptions.NotFoundError:
+        return {}, rule_interval(rule)[1]
+    except (exceptions.RequestError, exceptions.TransportError) as e:
+        print(f'Error getting the time range of the data: {e}')
+        return False, None
+    if not aggregations.time_stats.count:
+        return {}, rule_interval(rule)[1]
+
+    interval, freq = rule_interval(histogram_rule(
+        aggregations.time_stats, max(aggregations.term_count.value, 1), rule))
+
+    elastic_search = Search(
+        using=elastic, index=index_name(rule)).update_from_dict(search_body)
+    elastic_search = elastic_search.extra(size=0)
+    elastic_search.aggs.bucket(
+        'terms', 'terms', field=field, size=10000).bucket(
+            'times', 'date_histogram', field='time', min_doc_count=1,
+            **interval)
+    try:
+        response = elastic_search.execute()
+    except exceptions.NotFoundError:
+        return {}, freq
+    except (exceptions.RequestError, exceptions.TransportError) as e:
+        print(f'Error getting the time histogram of the data: {e}')
+        return False, None
+
+    histogram = {}
+    for term_bucket in response.aggregations.terms.buckets:
+        histogram[term_bucket.key] = np.array(
+            [time_bucket.key for time_bucket in term_bucket.times.buckets],
+            dtype=np.int64)
+    return histogram, freq
+
+
+def make_df(data, value_min=None, value_max=None):
+    """
+    Make a DataFrame with the data of the DB, without the values that are out
+    of the valid range.
+
+    Parameters
+    ----------
+        data: list of dict
+            Data documents with the data_fields.
+        value_min: float
+            Minimum valid value.
+        value_max: float
+            Maximum valid value.
+
+    Returns
+    -------
+        df: pandas DataFrame
+    """
+    df = pd.DataFrame.from_records(data, columns=data_fields)
+    df['value'] = pd.to_numeric(df['value'], errors='coerce')
+
+    # Some data has erroneus values, let's delete it
+    if value_min is not None:
+        df = df[~(df['value'] < value_min)]
+    if value_max is not None:
+        df = df[~(df['value'] > value_max)]
+    return df
+
+
+def get_cached_df(platform_code, parameter, rule, depth_min=None,
+                  depth_max=None, time_min=None, time_max=None, qc=None):
+    """
+    Get the data of a platform_code and parameter from the DataFrame cache.
+    The cache is split in monthly chunks. Only the chunks that overlap with the
+    time range are read, and the missing ones are read from the DB and saved
+    in the cache.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        time_min: str
+            Minimum date and time of the measurement.
+        time_max: str
+            Maximum date and time of the measurement.
+        qc: int
+            Quality Flag value of the measurement.
+
+    Returns
+    -------
+        df: pandas DataFrame
+            Data sorted by time.
+    """
+    extent = df_cache.get_extent(platform_code, parameter, rule)
+    if extent is None:
+        _, version = df_cache.missing_chunks(platform_code, parameter, rule,
+                                             [])
+        extent = get_time_extent(platform_code, parameter, rule)
+        df_cache.set_extent(platform_code, parameter, rule, extent, version)
+    if not extent:
+        return pd.DataFrame()
+
+    first = df_cache.to_timestamp(extent[0])
+    last = df_cache.to_timestamp(extent[1])
+    if time_min:
+        first = max(first, df_cache.to_timestamp(time_min))
+    if time_max:
+        last = min(last, df_cache.to_timestamp(time_max))
+    if first > last:
+        return pd.DataFrame()
+
+    chunks = df_cache.chunk_names(first, last)
+    missing, version = df_cache.missing_chunks(platform_code, parameter, rule,
+                                               chunks)
+
+    value_min, value_max = valid_range(platform_code, parameter)
+
+    # Data that could not be saved in the cache because it was invalidated
+    # while it was read from the DB
+    not_cached = []
+    for run in df_cache.chunk_runs(missing):
+        run_start, _ = df_cache.chunk_bounds(run[0])
+        _, run_end = df_cache.chunk_bounds(run[-1])
+        query = QueryFilter(
+            platform_code=platform_code, parameter=parameter,
+            time_min=run_start.isoformat(),
+            time_max=(run_end - pd.Timedelta(1, 'ms')).isoformat())
+        df_run = make_df(get_data_source(query, rule), value_min, value_max)
+        if not df_cache.write_chunks(platform_code, parameter, rule, df_run,
+                                     run, version):
+            not_cached.append(df_cache.filter_table(
+                df_cache.to_table(df_run), depth_min, depth_max, time_min,
+                time_max, qc))
+
+    cached = df_cache.read_chunks(platform_code, parameter, rule, chunks,
+                                  depth_min, depth_max, time_min, time_max,
+                                  qc)
+    return df_cache.to_df([cached] + not_cached)
+
+
 def get_df(platform_code_list, parameter_list, rule, depth_min=None,
-           depth_max=None, time_min=None, time_max=None, qc=None):
+           depth_max=None, time_min=None, time_max=None, qc=None,
+           points=None):
     """
     Get data from the database and make a pandas DataFrame.
 
@@ -349,6 +925,10 @@ def get_df(platform_code_list, parameter_list, rule, depth_min=None,
             Examples: yyyy-MM-dd'T'HH:mm:ss.SSSZ or yyyy-MM-dd.
         qc: int
             Quality Flag value of the measurement.
+        points: int
+            Maximum number of values per platform_code, parameter and depth.
+            If it is set, the data is downsampled by the DB keeping the
+            minimum and maximum values of each time bucket.
 
     Returns
     -------
@@ -361,8 +941,6 @@ def get_df(platform_code_list, parameter_list, rule, depth_min=None,
     if isinstance(parameter_list, str):
         parameter_list = [parameter_list]
 
-    time_min_str, time_max_str = time_to_str(time_min, time_max)
-
     df = pd.DataFrame()
 
     for platform_code in platform_code_list:
@@ -371,78 +949,29 @@ def get_df(platform_code_list, parameter_list, rule, depth_min=None,
         for parameter in parameter_list:
             print('Getting data from parameter {}...'.format(parameter))
 
-            df_name = f'{platform_code}_{parameter}_{rule}_dmin{depth_min}' + \
-                f'_dmax{depth_max}_tmin{time_min_str}_tmax{time_max_str}_qc{qc}'
-
-            if not os.path.exists(f'{df_folder}/{df_name}.pkl'):
-
-                # Check if folder exist
-                if not os.path.exists(df_folder):
-                    os.makedirs(df_folder)
-
-                # Get all data from 'platform_code'
-                search_string = '{"platform_code":' + f'"{platform_code}"' + \
-                    ',"parameter":' + f'"{parameter}"' + '}'
-                if depth_min:
-                    search_string = search_string[:-1] + \
-                        f',"depth_min":{depth_min}' + '}'
-                if depth_max:
-                    search_string = search_string[:-1] + \
-                        f',"depth_max":{depth_max}' + '}'
-                if time_min:
-                    search_string = search_string[:-1] + \
-                        f',"time_min":"{time_min}"' + '}'
-                if time_max:
-                    search_string = search_string[:-1] + \
-                        f',"time_max":"{time_max}"' + '}'
-                if qc:
-                    search_string = search_string[:-1] + \
-                        f',"qc":{qc}' + '}'
-
-                response, status_code = get_data(search_string, rule)
-
-                data_id_list = response['result']
-                data = []
-                for data_id in data_id_list:
-                    print('Getting data from id {}...'.format(data_id))
-                    response, status_code = get_data_id(data_id, rule)
-
-
-                    if status_code != 200:
-                        return response, status_code
-
-                    # Some data has erroneus values, let's delete it
-                    if float(
-                        response['result'][0][data_id]['value']) > 40 and \
-                            parameter == 'TEMP':
-                        continue
-                    if float(
-                        response['result'][0][data_id]['value']) < 1 and \
-                            parameter == 'TEMP':
-                        continue
-                    if float(
-                        response['result'][0][data_id]['value']) < 30 and \
-                            parameter == 'PSAL':
-                        continue
-                    if platform_code == 'OBSEA' and \
-                        float(response['result'][0][data_id]['value']) < 10 and \
-                            parameter == 'TEMP':
-                        continue
-                    if platform_code == 'OBSEA' and \
-                        float(response['result'][0][data_id]['value']) > 30 and \
-                            parameter == 'TEMP':
-                        continue
-
-                    data.append(response['result'][0][data_id])
-
-                if data:
-                    df_part = pd.DataFrame(data)
-                    df_part = df_part.sort_values(by='time')
-                    df_part.to_pickle(f'{df_folder}/{df_name}.pkl')
+            try:
+                if points:
+                    query = QueryFilter(
+                        platform_code=platform_code, parameter=parameter,
+                        depth_min=depth_min, depth_max=depth_max,
+                        time_min=time_min, time_max=time_max, qc=qc)
+
+                    value_min, value_max = valid_range(platform_code,
+                                                       parameter)
+                    data = get_data_buckets(query, rule, points, value_min,
+                                            value_max)
+                    if data is False:
+                        abort(503, 'The DB could not downsample the data')
+                    for one_data in data:
+                        one_data['platform_code'] = platform_code
+                        one_data['parameter'] = parameter
+                    df_part = make_df(data)
                 else:
-                    df_part = pd.DataFrame()
-            else:
-                df_part = pd.read_pickle(f'{df_folder}/{df_name}.pkl')
+                    df_part = get_cached_df(platform_code, parameter, rule,
+                                            depth_min, depth_max, time_min,
+                                            time_max, qc)
+            except exceptions.ConnectionError:
+                abort(503, 'Connection error with the DB')
 
             if not df_part.empty:
                 if df.empty:
@@ -501,22 +1030,14 @@ def get_metadata(platform_code: str=None, parameter: str=None,
 
     if output == 'parameter':
         platform_code_list = platform_code.split(',')
-        parameter_list = []
-        for one_platform in platform_code_list:
-            parameter_response, status_code = get_parameter(
-                platform_code=one_platform, depth_min=depth_min,
-                depth_max=depth_max, time_min=time_min, time_max=time_max,
-                qc=qc)
-
-            if status_code == 200:
-                one_parameter_list = [
-                    one_param[
-                        'key'] for one_param in parameter_response['result']]
-            else:
-                one_parameter_list = []
-            parameter_list += one_parameter_list
+        parameter_response, status_code = get_parameter(
+            platform_code=platform_code_list, depth_min=depth_min,
+            depth_max=depth_max, time_min=time_min, time_max=time_max, qc=qc)
 
-        parameter_list = list(set(parameter_list))
+        parameter_list = []
+        if status_code == 200:
+            parameter_list = [
+                one_param['key'] for one_param in parameter_response['result']]
         response = {
             'status': True,
             'message': 'List of parameters',
@@ -524,7 +1045,7 @@ def get_metadata(platform_code: str=None, parameter: str=None,
         }
         status_code = 200
     else:
-        elastic = Elasticsearch(elastic_host)
+        elastic = get_elastic()
 
         try:
             elastic_search = Search(using=elastic, index=metadata_index)
@@ -533,14 +1054,14 @@ def get_metadata(platform_code: str=None, parameter: str=None,
             ids = [h.meta.id for h in elastic_search.scan()]
 
             # Only return the platform code if it contains data
-            platform_code_list = []
-            for platform_code in ids:
-                response, status_code = get_data_count('M', platform_code,
-                                                    parameter, depth_min,
-                                                    depth_max, time_min,
-                                                    time_max, qc)
-                if status_code == 200 and response['result'][0] > 0:
-                    platform_code_list.append(platform_code)
+            counts = get_platform_counts('M', parameter=parameter,
+                                         depth_min=depth_min,
+                                         depth_max=depth_max,
+                                         time_min=time_min, time_max=time_max,
+                                         qc=qc)
+            platform_code_list = [
+                platform_code for platform_code in ids
+                if counts.get(platform_code, 0) > 0]
 
             if platform_code_list:
                 response = {
@@ -556,7 +1077,6 @@ def get_metadata(platform_code: str=None, parameter: str=None,
         except exceptions.ConnectionError:
             abort(503, 'Connection error with the DB')
 
-        elastic.close()
     return response, status_code
 
 
@@ -597,87 +1117,48 @@ def get_parameter(platform_code=None, depth_min=None, depth_max=None,
                 The result is a list with the platform_code's.
             The status_code is 200 - found or 503 - connection error
     """
-    elastic = Elasticsearch(elastic_host)
-
-    a = A('terms', field='parameter')
-
-    if depth_min or depth_max or time_min or time_max or qc or platform_code:
-
-        search_body = {}
-        search_body['query'] = {'bool': {'must': []}}
-
-        search_dict = {}
-        if platform_code:
-            search_dict['platform_code'] = platform_code
-        if qc:
-            search_dict['qc'] = qc
-
-        for key, value in search_dict.items():
-            if isinstance(value, list):
-                should_search = {'bool': {'should': []}}
-                for element in value:
-                    should_search['bool']['should'].append(
-                        {'match': {key: element}})
-                search_body['query']['bool']['must'].append(should_search)
-            else:
-                search_body['query']['bool']['must'].append(
-                    {'match': {key: value}})
-
-        if depth_min or depth_max:
-            search_range = {'range': {}}
-            search_range['range']['depth'] = {}
-
-            if depth_min:
-                search_range['range']['depth']['gte'] = depth_min
-            if depth_max:
-                search_range['range']['depth']['lte'] = depth_max
-
-            search_body['query']['bool']['must'].append(search_range)
-
-        if time_min or time_max:
-            search_range = {'range': {}}
-            search_range['range']['time'] = {}
+    # The summary index has the number of values of every parameter, but not
+    # their times
+    if not time_min and not time_max:
+        counts = summary_counts(rule, 'parameter', platform_code=platform_code,
+                                depth_min=depth_min, depth_max=depth_max,
+                                qc=qc)
+        if counts is not None:
+            response = {
+                'status': True,
+                'message': 'List of parameters',
+                'result': [{'key': key, 'doc_count': count}
+                           for key, count in counts.items()]
+            }
+            status_code = 200
+            return response, status_code
 
-            if time_min:
-                search_range['range']['time']['gte'] = time_min
-            if time_max:
-                search_range['range']['time']['lte'] = time_max
+    elastic = get_elastic()
 
-            search_body['query']['bool']['must'].append(search_range)
+    a = A('terms', field='parameter')
 
-        connected = True
-        try:
-            elastic_search = Search(
-                using=elastic,
-                index=index_name(rule)).update_from_dict(search_body)
-        except exceptions.ConnectionError:
-            connected = False
-            response = {
-                'status': False,
-                'message': 'Internal error. Unable to connect to DB',
-                'result': []
-            }
-            status_code = 503
+    search_body = QueryFilter(platform_code=platform_code,
+                              depth_min=depth_min, depth_max=depth_max,
+                              time_min=time_min, time_max=time_max,
+                              qc=qc).to_body()
 
-    else:
-        connected = True
-        try:
-            # Get all ids
-            elastic_search = Search(using=elastic, index=index_name(rule))
-        except exceptions.ConnectionError:
-            connected = False
-            response = {
-                'status': False,
-                'message': 'Internal error. Unable to connect to DB',
-                'result': []
-            }
-            status_code = 503
+    connected = True
+    try:
+        elastic_search = Search(
+            using=elastic, index=index_name(rule)).update_from_dict(search_body)
+    except exceptions.ConnectionError:
+        connected = False
+        response = {
+            'status': False,
+            'message': 'Internal error. Unable to connect to DB',
+            'result': []
+        }
+        status_code = 503
 
     if connected:
         elastic_search.aggs.bucket('parameter_terms', a)
         response = elastic_search.execute()
         diccionario = response.to_dict()
-        elastic.close()
         response = {
             'status': True,
             'message': 'List of parameters',
@@ -688,6 +1169,138 @@ def get_parameter(platform_code=None, depth_min=None, depth_max=None,
     return response, status_code
 
 
+def count_search_body(platform_code=None, parameter=None, depth_min=None,
+                      depth_max=None, time_min=None, time_max=None, qc=None):
+    """
+    Make the body of the query to count data.
+
+    Parameters
+    ----------
+        platform_code: str or list of str
+            Platform code or list of platform_code
+        parameter: str or list of str
+            Parameter acronym or list of parameters.
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        time_min: str
+            Minimum date and time of the measurement.
+        time_max: str
+            Maximum date and time of the measurement.
+        qc: int
+            Quality Control value of the measurement.
+
+    Returns
+    -------
+        search_body: dict
+            Body of the query.
+    """
+    return QueryFilter(platform_code=platform_code, parameter=parameter,
+                       depth_min=depth_min, depth_max=depth_max,
+                       time_min=time_min, time_max=time_max,
+                       qc=qc).to_body()
+
+
+def get_platform_counts(rule, platform_code=None, parameter=None,
+                        depth_min=None, depth_max=None, time_min=None,
+                        time_max=None, qc=None):
+    """
+    Get the number of values of every platform_code that match the given
+    filters, with one terms aggregation.
+
+    Parameters
+    ----------
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
+        platform_code: str or list of str
+            Platform code or list of platform_code. By default, all.
+        parameter: str or list of str
+            Parameter acronym or list of parameters.
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        time_min: str
+            Minimum date and time of the measurement.
+        time_max: str
+            Maximum date and time of the measurement.
+        qc: int
+            Quality Control value of the measurement.
+
+    Returns
+    -------
+        counts: dict
+            Number of values of every platform_code with data, sorted from the
+            largest number.
+    """
+    # The summary index has the number of values of every platform, but not
+    # their times
+    if not time_min and not time_max:
+        counts = summary_counts(rule, 'platform_code',
+                                platform_code=platform_code,
+                                parameter=parameter, depth_min=depth_min,
+                                depth_max=depth_max, qc=qc)
+        if counts is not None:
+            return counts
+
+    search_body = count_search_body(platform_code, parameter, depth_min,
+                                    depth_max, time_min, time_max, qc)
+
+    elastic_search = Search(
+        using=get_elastic(), index=index_name(rule)).update_from_dict(
+            search_body)
+    elastic_search = elastic_search.extra(size=0)
+    elastic_search.aggs.bucket('platforms', 'terms', field='platform_code',
+                               size=10000)
+    try:
+        response = elastic_search.execute()
+    except exceptions.NotFoundError:
+        return {}
+
+    return {bucket.key: bucket.doc_count
+            for bucket in response.aggregations.platforms.buckets}
+
+
+def get_metadata_sources(platform_code_list, fields=None):
+    """
+    Get the metadata of some platform_codes with one request.
+
+    Parameters
+    ----------
+        platform_code_list: list of str
+            Platform codes (the IDs of the metadata documents).
+        fields: list of str
+            Fields of the metadata to return. By default, all. An empty list
+            only checks that the metadata exists.
+
+    Returns
+    -------
+        metadata: dict
+            The keys are the platform codes with metadata and the values are
+            their metadata.
+    """
+    if not platform_code_list:
+        return {}
+
+    if fields is None:
+        source = True
+    elif not fields:
+        source = False
+    else:
+        source = fields
+
+    try:
+        response = get_elastic().mget(index=metadata_index,
+                                      body={'ids': list(platform_code_list)},
+                                      _source=source)
+    except exceptions.NotFoundError:
+        return {}
+
+    return {doc['_id']: doc.get('_source', {})
+            for doc in response['docs'] if doc.get('found')}
+
+
 def get_data_count(rule, platform_code=None, parameter=None, depth_min=None,
                    depth_max=None, time_min=None, time_max=None, qc=None):
     """
@@ -729,67 +1342,10 @@ def get_data_count(rule, platform_code=None, parameter=None, depth_min=None,
                 The reslut is the number of the values.
             The status_code is 200 (found).
     """
-    search_body = {'query': {'match_all': {}}}
-
-    if platform_code or parameter or depth_min or depth_max or time_min or \
-        time_max or qc:
-
-        search_body = {}
-        search_body['query'] = {'bool': {'must': []}}
-
-        if platform_code:
-            if isinstance(platform_code, str):
-                platform_code = [platform_code]
-
-            should_search = {'bool': {'should': []}}
-            for platform in platform_code:
-                should_search['bool']['should'].append(
-                    {'match': {'platform_code': platform}})
-            search_body['query']['bool']['must'].append(should_search)
-
-        if parameter:
-            if isinstance(parameter, str):
-                parameter = [parameter]
-
-            should_search = {'bool': {'should': []}}
-            for param in parameter:
-                should_search['bool']['should'].append(
-                    {'match': {'parameter': param}})
-            search_body['query']['bool']['must'].append(should_search)
-
-        if qc:
-            if isinstance(qc, str):
-                qc = [qc]
-
-            should_search = {'bool': {'should': []}}
-            for flag in qc:
-                should_search['bool']['should'].append(
-                    {'match': {'qc': flag}})
-            search_body['query']['bool']['must'].append(should_search)
-
-        if depth_min or depth_max:
-            search_range = {'range': {}}
-            search_range['range']['depth'] = {}
+    search_body = count_search_body(platform_code, parameter, depth_min,
+                                    depth_max, time_min, time_max, qc)
 
-            if depth_min:
-                search_range['range']['depth']['gte'] = depth_min
-            if depth_max:
-                search_range['range']['depth']['lte'] = depth_max
-
-            search_body['query']['bool']['must'].append(search_range)
-
-        if time_min or time_max:
-            search_range = {'range': {}}
-            search_range['range']['time'] = {}
-
-            if time_min:
-                search_range['range']['time']['gte'] = time_min
-            if time_max:
-                search_range['range']['time']['lte'] = time_max
-
-            search_body['query']['bool']['must'].append(search_range)
-
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     elastic_search = Search(
             using=elastic, index=index_name(rule)).update_from_dict(search_body)
@@ -806,7 +1362,6 @@ def get_data_count(rule, platform_code=None, parameter=None, depth_min=None,
     }
     status_code = 200
 
-    elastic.close()
     return response, status_code
 
 
@@ -829,7 +1384,7 @@ def get_metadata_id(platform_code: str, format: str='json'):
             The status_code is 200 - found, 404 - not found or 503 -
             connection error
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
         el_response = elastic.get(index=metadata_index, id=platform_code)
@@ -841,12 +1396,12 @@ def get_metadata_id(platform_code: str, format: str='json'):
                     'result': [{platform_code: el_response['_source']}]
                 }
             else:
-                filename = f'{csv_folder}/{platform_code}.csv'
+                csv_name = export_cache.key(f'metadata-{platform_code}')
                 # Check if folder exist
                 if not os.path.exists(csv_folder):
                     os.makedirs(csv_folder)
 
-                if not os.path.exists(filename):
+                if not export_cache.get(csv_name, 'csv'):
                     metadata_dict = el_response['_source']
                     if 'parameters' in metadata_dict:
                         metadata_dict['parameters'] = \
@@ -854,12 +1409,15 @@ def get_metadata_id(platform_code: str, format: str='json'):
 
                     # Convert a dict to a csv
                     df = pd.DataFrame.from_dict([metadata_dict])
-                    df.to_csv(filename, index = False, header=True)
+                    df.to_csv(export_cache.path(csv_name, 'csv'), index = False,
+                              header=True)
+                    export_cache.put(csv_name, {'platform_code': platform_code},
+                                     'csv')
 
                 response = {
                     'status': True,
                     'message': 'Metadata information',
-                    'result': [f'{csv_url}/{platform_code}.csv']
+                    'result': [f'{csv_url}/{csv_name}.csv']
                 }
             status_code = 200
         else:
@@ -869,7 +1427,6 @@ def get_metadata_id(platform_code: str, format: str='json'):
     except exceptions.ConnectionError:
         abort(503, 'Connection error with the DB.')
 
-    elastic.close()
     return response, status_code
 
 
@@ -893,7 +1450,7 @@ def get_vocabulary(platform_code: str):
             The status_code is 200 - found, 204 - not found or 503 -
             connection error
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
         response = elastic.get(vocabulary_index, platform_code)
@@ -912,7 +1469,6 @@ def get_vocabulary(platform_code: str):
     except exceptions.ConnectionError:
         abort(503, 'Connection error with the DB')
 
-    elastic.close()
     return response, status_code
 
 
@@ -938,20 +1494,22 @@ def post_data(rule: str, data: dict):
                 'result': [{data_id: the_inout_data}]
             The status_code is always 201 (created)
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
-    data_id = f"{data['platform_code']}_{data['parameter']}_{data['depth']}" + \
-        f"_{data['time'].replace(' ', '_')}"
+    data_id = make_data_id(data)
 
     elastic.index(index=index_name(rule), id=data_id, document=data)
 
+    # Only the cached data with the time of the data is outdated
+    publish(Change('data', data['platform_code'], data['parameter'], rule,
+                   data['time'], data['time']))
+
     response = {
         'status': True,
         'message': 'Created',
         'result': [{data_id: data}]
     }
     status_code = 201
-    elastic.close()
     return response, status_code
 
 
@@ -973,24 +1531,26 @@ def delete_data(rule: str, data_id: str):
             404 - Data not found.
             503 - Connection error with the DB
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
+        data = elastic.get(index=index_name(rule), id=data_id,
+                           _source=['platform_code', 'parameter',
+                                    'time'])['_source']
         response = elastic.delete(index=index_name(rule), id=data_id)
 
         if response['result'] == 'deleted':
             status_code = 202
+            publish(Change('data', data.get('platform_code'),
+                           data.get('parameter'), rule, data.get('time'),
+                           data.get('time')))
         else:
-            elastic.close()
             abort(404, 'Data not found.')
 
     except exceptions.NotFoundError:
-        elastic.close()
         abort(404, 'Data not found.')
     except exceptions.ConnectionError:
-        elastic.close()
         abort(404, 'Connection error with the DB.')
-    elastic.close()
     return response, status_code
 
 
@@ -1016,15 +1576,12 @@ def post_metadata(platform_code: str, metadata: dict):
                     input platform_code and the value is the input metadata
             status_code is always 201, (Added)
     """
-    # Delete all metadata_map figures
-    #Loop Through the folder projects all files and deleting them one by one
-    for file_map in glob.glob(f'{fig_folder}/metadata_map*'):
-        os.remove(file_map)
-
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     elastic.index(index=metadata_index, id=platform_code, document=metadata)
 
+    publish(Change('metadata', platform_code))
+
     response = {
         'status': True,
         'message': 'Added',
@@ -1032,7 +1589,6 @@ def post_metadata(platform_code: str, metadata: dict):
     }
     status_code = 201
 
-    elastic.close()
     return response, status_code
 
 
@@ -1061,19 +1617,14 @@ def put_metadata(platform_code, metadata):
                 406 - Bad payload (input metadata)
                 503 - Connection error with the DB
     """
-    # Delete all metadata_map figures
-    #Loop Through the folder projects all files and deleting them one by one
-    for file_map in glob.glob(f'{fig_folder}/metadata_map*'):
-        os.remove(file_map)
-
-
     upload_metadata = {'doc': metadata}
 
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
     try:
         response = elastic.update(
             index=metadata_index, id=platform_code, body=upload_metadata)
         if response['result'] == 'updated':
+            publish(Change('metadata', platform_code))
             response = elastic.get(index=metadata_index, id=platform_code)
             response = {
                 'status': True,
@@ -1113,7 +1664,6 @@ def put_metadata(platform_code, metadata):
         }
         status_code = 503
 
-    elastic.close()
     return response, status_code
 
 
@@ -1134,18 +1684,18 @@ def delete_metadata(platform_code: str):
             404 - Metadata not found,
             503 - Connection error with the DB
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
         response = elastic.delete(index=metadata_index, id=platform_code)
         if response['result'] == 'deleted':
             status_code = 202
+            publish(Change('metadata', platform_code))
     except exceptions.NotFoundError:
         status_code = 404
     except exceptions.ConnectionError:
         status_code = 503
 
-    elastic.close()
     return status_code
 
 
@@ -1156,7 +1706,7 @@ def get_doi():
     data, _ = get_token_info(request)
     user = data['result'].get('user_id', 'anonymus')
     try:
-        elastic = Elasticsearch(elastic_host)
+        elastic = get_elastic()
 
         # Search for user
         search_body = {
@@ -1208,7 +1758,7 @@ def put_doi(user: str, num_doi: int):
             503 - Connection error with the DB.
 
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     # Search for user
     search_body = {
@@ -1405,7 +1955,7 @@ def get_pid(email):
     """
     Get PIDs from email
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     # Search for user
     search_body = {
@@ -1824,7 +2374,7 @@ def add_values_v2(payload, mail, DOI=False):
     url_pid = files_url +  '/' + str(year) + '/' + PID + '.html'
 
     # Guarda el filename en el elastic
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
     body = {
         'email': mail,
         'filename': url_pid
@@ -1856,7 +2406,7 @@ def get_query_id(query_id: str):
                     key (query_id) and a value (the content)',
                 'result': A list of dicts
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
         response = elastic.get(api_index, query_id)
@@ -1876,7 +2426,6 @@ def get_query_id(query_id: str):
     except exceptions.ConnectionError:
         abort(503, 'Connection error with the DB')
 
-    elastic.close()
     return response, status_code
 
 
@@ -1902,7 +2451,7 @@ def get_query(user_id: str, namespace: str=None):
         The function can abort the request with a code:
             503 - Connection error with the DB
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
     
     search_body = {}
     search_body['query'] = {'match': {'user': user_id}}
@@ -1938,7 +2487,6 @@ def get_query(user_id: str, namespace: str=None):
     except exceptions.ConnectionError:
         abort(503, "Connection error with the DB")
 
-    elastic.close()
     return response, status_code
 
 
@@ -1964,7 +2512,7 @@ def post_vocabulary(platform_code: str, vocabulary: dict):
                     input platform_code and the value is the input vocabulary
             status_code is always 201, (Added)
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     elastic.index(index=vocabulary_index, id=platform_code, document=vocabulary)
 
@@ -1975,7 +2523,6 @@ def post_vocabulary(platform_code: str, vocabulary: dict):
     }
     status_code = 201
 
-    elastic.close()
     return response, status_code
 
 
@@ -2008,7 +2555,7 @@ def put_vocabulary(platform_code, vocabulary):
 
     upload_vocabulary = {'doc': vocabulary}
 
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
     try:
         response = elastic.update(
             index=vocabulary_index, id=platform_code, body=upload_vocabulary)
@@ -2052,7 +2599,6 @@ def put_vocabulary(platform_code, vocabulary):
         }
         status_code = 503
 
-    elastic.close()
     return response, status_code
 
 
@@ -2073,7 +2619,7 @@ def delete_vocabulary(platform_code: str):
             404 - Vocabulary not found,
             503 - Connection error with the DB
     """
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
 
     try:
         response = elastic.delete(index=vocabulary_index, id=platform_code)
@@ -2084,7 +2630,6 @@ def delete_vocabulary(platform_code: str):
     except exceptions.ConnectionError:
         status_code = 503
 
-    elastic.close()
     return status_code
 
 
@@ -2502,7 +3047,7 @@ def post_pid(payload, mail, DOI=False):
     url_pid = pid_url +  '/' + str(year) + '/' + PID + '.html'
 
     # Save the PID into the elasticsearch
-    elastic = Elasticsearch(elastic_host)
+    elastic = get_elastic()
     body = {
         'email': mail,
         'pid': PID,
@@ -3,11 +3,11 @@ import datetime
 from functools import wraps
 from flask import request, abort
 
-from .db_manager import data_ingestion
+from .audit_log import audit_log
 from .auth_manager import get_token_info
 
-from config import (api_index, data_portal_token, data_portal_user,
-                    data_portal_email, test_token, test_user, test_email)
+from config import (data_portal_token, data_portal_user, data_portal_email,
+                    test_token, test_user, test_email)
 
 
 def save_request(f):
@@ -60,11 +60,9 @@ def save_request(f):
                     '%Y-%m-%d %H:%M:%S.%f')[:-3]
             }
 
-        status = data_ingestion(api_index, body)
-        if status == 201:
-            return f(*args, **kwargs)
-        elif status == 500:
-            abort(503, 'Connection error with the DB.')
+        # The record is sent to the DB in the background
+        audit_log.record(body)
+        return f(*args, **kwargs)
 
     return decorated
 
@@ -0,0 +1,519 @@
+import os
+import glob
+import json
+import fcntl
+import threading
+import contextlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .invalidation import subscribe
+
+from config import df_folder
+
+# The data of every platform_code, parameter and rule is saved in one Parquet
+# file per month:
+#   df_folder/<platform_code>/<parameter>/<rule>/<YYYY-MM>.parquet
+# The _manifest.json of the folder says which months are cached, the version
+# of the cache and the time extent of the data in the DB.
+manifest_name = '_manifest.json'
+lock_name = '_manifest.lock'
+
+chunk_freq = 'M'
+chunk_format = '%Y-%m'
+
+schema = pa.schema([
+    ('time', pa.timestamp('ms', tz='UTC')),
+    ('depth', pa.float64()),
+    ('value', pa.float64()),
+    ('qc', pa.float64()),
+    ('platform_code', pa.string()),
+    ('parameter', pa.string())
+])
+
+
+def to_timestamp(value):
+    """
+    Convert a date and time into a UTC pandas Timestamp.
+
+    Parameters
+    ----------
+        value: str or datetime
+            Date and time. Values without time zone are UTC.
+
+    Returns
+    -------
+        timestamp: pandas Timestamp
+    """
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    else:
+        timestamp = timestamp.tz_convert('UTC')
+    return timestamp
+
+
+def chunk_names(time_min, time_max):
+    """
+    Names of the time chunks that overlap with a time range.
+
+    Parameters
+    ----------
+        time_min: str
+            Minimum date and time.
+        time_max: str
+            Maximum date and time.
+
+    Returns
+    -------
+        chunks: list of str
+            Names of the chunks, sorted by time (YYYY-MM).
+    """
+    periods = pd.period_range(to_timestamp(time_min).tz_localize(None),
+                              to_timestamp(time_max).tz_localize(None),
+                              freq=chunk_freq)
+    return [period.strftime(chunk_format) for period in periods]
+
+
+def chunk_bounds(chunk):
+    """
+    Time range of a chunk.
+
+    Parameters
+    ----------
+        chunk: str
+            Name of the chunk (YYYY-MM).
+
+    Returns
+    -------
+        (start, end): (pandas Timestamp, pandas Timestamp)
+            The start is included and the end is not.
+    """
+    period = pd.Period(chunk, freq=chunk_freq)
+    start = period.start_time.tz_localize('UTC')
+    end = (period + 1).start_time.tz_localize('UTC')
+    return start, end
+
+
+def chunk_runs(chunks):
+    """
+    Group the chunks into runs of consecutive chunks, so every run can be read
+    from the DB with one query.
+
+    Parameters
+    ----------
+        chunks: list of str
+            Names of the chunks, sorted by time.
+
+    Returns
+    -------
+        runs: list of list of str
+    """
+    runs = []
+    for chunk in chunks:
+        if runs and \
+                pd.Period(chunk, freq=chunk_freq) - 1 == \
+                pd.Period(runs[-1][-1], freq=chunk_freq):
+            runs[-1].append(chunk)
+        else:
+            runs.append([chunk])
+    return runs
+
+
+def partition_folder(platform_code, parameter, rule):
+    """ Folder with the cached data of a platform_code, parameter and rule """
+    return os.path.join(df_folder, str(platform_code), str(parameter),
+                        str(rule))
+
+
+def read_manifest(platform_code, parameter, rule):
+    """
+    Read the manifest of a partition.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - R, M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H,
+            2H, H
+
+    Returns
+    -------
+        manifest: dict
+            Keys: version (int), chunks (dict with the version of every cached
+            chunk) and extent (list with the first and last time of the data
+            in the DB, or None if it is unknown).
+    """
+    path = os.path.join(partition_folder(platform_code, parameter, rule),
+                        manifest_name)
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {'version': 0, 'chunks': {}, 'extent': None}
+
+
+def write_manifest(platform_code, parameter, rule, manifest):
+    """ Save the manifest of a partition, replacing the old one atomically """
+    folder = partition_folder(platform_code, parameter, rule)
+    os.makedirs(folder, exist_ok=True)
+
+    path = os.path.join(folder, manifest_name)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def partition_lock(platform_code, parameter, rule):
+    """
+    Lock a partition while its manifest is read and written. The lock is a
+    file lock, so it works between the threads of a process and between the
+    processes of the API and the uploads.
+    """
+    folder = partition_folder(platform_code, parameter, rule)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, lock_name), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_extent(platform_code, parameter, rule):
+    """
+    Get the saved time extent of the data of a partition.
+
+    Returns
+    -------
+        extent: list or None
+            [time_min, time_max], an empty list if there is no data in the DB
+            or None if the extent is not saved.
+    """
+    return read_manifest(platform_code, parameter, rule)['extent']
+
+
+def set_extent(platform_code, parameter, rule, extent, version):
+    """
+    Save the time extent of the data of a partition, if the partition has not
+    been invalidated since the extent was read from the DB.
+
+    Parameters
+    ----------
+        extent: list
+            [time_min, time_max] or an empty list if there is no data.
+        version: int
+            Version of the partition when the extent was read from the DB.
+    """
+    with partition_lock(platform_code, parameter, rule):
+        manifest = read_manifest(platform_code, parameter, rule)
+        if manifest['version'] != version:
+            return
+        manifest['extent'] = extent
+        write_manifest(platform_code, parameter, rule, manifest)
+
+
+def missing_chunks(platform_code, parameter, rule, chunks):
+    """
+    Get the chunks that are not in the cache.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - R, M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H,
+            2H, H
+        chunks: list of str
+            Names of the chunks.
+
+    Returns
+    -------
+        (missing, version): (list of str, int)
+            The missing chunks and the version of the partition. The version
+            has to be used to write the chunks with write_chunks().
+    """
+    manifest = read_manifest(platform_code, parameter, rule)
+    missing = [chunk for chunk in chunks if chunk not in manifest['chunks']]
+    return missing, manifest['version']
+
+
+def to_table(df):
+    """
+    Convert a DataFrame made with the data of the DB into an Arrow Table.
+    """
+    df = df.reindex(columns=schema.names)
+    df = df.assign(
+        time=pd.to_datetime(df['time'], utc=True, format='ISO8601',
+                            errors='coerce'),
+        depth=pd.to_numeric(df['depth'], errors='coerce'),
+        value=pd.to_numeric(df['value'], errors='coerce'),
+        qc=pd.to_numeric(df['qc'], errors='coerce'),
+        platform_code=df['platform_code'].astype(str),
+        parameter=df['parameter'].astype(str))
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False,
+                                safe=False)
+
+
+def write_chunks(platform_code, parameter, rule, df, chunks, version):
+    """
+    Save the data of some chunks in the cache. Chunks without data are saved
+    too, so they are not requested again to the DB.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - R, M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H,
+            2H, H
+        df: pandas DataFrame
+            All data of the chunks.
+        chunks: list of str
+            Names of the chunks.
+        version: int
+            Version of the partition when the data was read from the DB.
+
+    Returns
+    -------
+        written: bool
+            False if the partition has been invalidated since the data was
+            read from the DB. Then, the data may be outdated and it is not
+            saved.
+    """
+    folder = partition_folder(platform_code, parameter, rule)
+    table = to_table(df)
+    times = table.column('time')
+
+    with partition_lock(platform_code, parameter, rule):
+        manifest = read_manifest(platform_code, parameter, rule)
+        if manifest['version'] != version:
+            return False
+
+        for chunk in chunks:
+            start, end = chunk_bounds(chunk)
+            mask = pc.and_(
+                pc.greater_equal(times, pa.scalar(start, times.type)),
+                pc.less(times, pa.scalar(end, times.type)))
+            chunk_table = table.filter(mask)
+
+            path = os.path.join(folder, f'{chunk}.parquet')
+            if chunk_table.num_rows:
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                pq.write_table(chunk_table, tmp_path)
+                os.replace(tmp_path, path)
+            elif os.path.exists(path):
+                os.remove(path)
+            manifest['chunks'][chunk] = version
+
+        write_manifest(platform_code, parameter, rule, manifest)
+    return True
+
+
+def filter_expression(depth_min=None, depth_max=None, time_min=None,
+                      time_max=None, qc=None):
+    """
+    Make the filter of the data, that is pushed down to the Parquet reader.
+
+    Returns
+    -------
+        expression: pyarrow.dataset.Expression or None
+    """
+    expression = None
+    conditions = []
+    if depth_min is not None:
+        conditions.append(ds.field('depth') >= float(depth_min))
+    if depth_max is not None:
+        conditions.append(ds.field('depth') <= float(depth_max))
+    if time_min is not None:
+        conditions.append(ds.field('time') >= pa.scalar(
+            to_timestamp(time_min), schema.field('time').type))
+    if time_max is not None:
+        conditions.append(ds.field('time') <= pa.scalar(
+            to_timestamp(time_max), schema.field('time').type))
+    if qc is not None:
+        conditions.append(ds.field('qc') == float(qc))
+
+    for condition in conditions:
+        if expression is None:
+            expression = condition
+        else:
+            expression = expression & condition
+    return expression
+
+
+def read_chunks(platform_code, parameter, rule, chunks, depth_min=None,
+                depth_max=None, time_min=None, time_max=None, qc=None):
+    """
+    Read data from the cache. Only the files of the requested chunks are read,
+    they are memory-mapped and the filters are pushed down to the reader.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - R, M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H,
+            2H, H
+        chunks: list of str
+            Names of the chunks.
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        time_min: str
+            Minimum date and time of the measurement.
+        time_max: str
+            Maximum date and time of the measurement.
+        qc: int
+            Quality Flag value of the measurement.
+
+    Returns
+    -------
+        table: pyarrow Table or None
+            None if there is no cached data in the chunks.
+    """
+    folder = partition_folder(platform_code, parameter, rule)
+    paths = [os.path.join(folder, f'{chunk}.parquet') for chunk in chunks]
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return None
+
+    try:
+        return pq.read_table(
+            paths, schema=schema, memory_map=True,
+            filters=filter_expression(depth_min, depth_max, time_min,
+                                      time_max, qc))
+    except FileNotFoundError:
+        # The chunks have been invalidated while reading
+        return None
+
+
+def filter_table(table, depth_min=None, depth_max=None, time_min=None,
+                 time_max=None, qc=None):
+    """
+    Apply the filters of read_chunks() to data that is already in memory.
+    """
+    expression = filter_expression(depth_min, depth_max, time_min, time_max,
+                                   qc)
+    if expression is None:
+        return table
+    return ds.dataset(table).to_table(filter=expression)
+
+
+def to_df(tables):
+    """
+    Join the tables of the cache in one DataFrame, sorted by time and with the
+    time as ISO 8601 string with milliseconds, like in the DB.
+
+    Parameters
+    ----------
+        tables: list of pyarrow Table
+
+    Returns
+    -------
+        df: pandas DataFrame
+    """
+    tables = [table for table in tables if table is not None and table.num_rows]
+    if not tables:
+        return pd.DataFrame()
+
+    df = pa.concat_tables(tables).to_pandas()
+    df = df.sort_values(by='time')
+    # The milliseconds are only written if the time has them, like the times
+    # of the documents
+    milliseconds = df['time'].dt.microsecond // 1000
+    df['time'] = df['time'].dt.strftime('%Y-%m-%dT%H:%M:%S') + \
+        ('.' + milliseconds.astype(str).str.zfill(3)).where(
+            milliseconds != 0, '') + 'Z'
+    return df.reset_index(drop=True)
+
+
+def invalidate(platform_code=None, parameter=None, rule=None, time_min=None,
+               time_max=None):
+    """
+    Delete the cached data of the chunks that overlap with a time range and
+    increase the version of their partitions, so the data that is being read
+    from the DB at the same time is not saved.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code. None means all platforms.
+        parameter: str
+            Parameter acronym. None means all parameters.
+        rule: str
+            Options - R, M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H,
+            2H, H. None means all rules.
+        time_min: str
+            Minimum date and time of the changed data. None means since the
+            beginning.
+        time_max: str
+            Maximum date and time of the changed data. None means until the
+            end.
+
+    Returns
+    -------
+        chunks: int
+            Number of deleted chunks.
+    """
+    pattern = [
+        '*' if platform_code is None else str(platform_code),
+        '*' if parameter is None else str(parameter),
+        '*' if rule is None else str(rule)]
+
+    start = to_timestamp(time_min) if time_min is not None else None
+    end = to_timestamp(time_max) if time_max is not None else None
+
+    deleted = 0
+    for folder in partition_folders(pattern):
+        platform, param, one_rule = \
+            os.path.relpath(folder, df_folder).split(os.sep)
+        with partition_lock(platform, param, one_rule):
+            manifest = read_manifest(platform, param, one_rule)
+            manifest['version'] += 1
+            manifest['extent'] = None
+
+            for chunk in list(manifest['chunks']):
+                chunk_start, chunk_end = chunk_bounds(chunk)
+                if (start is not None and chunk_end <= start) or \
+                        (end is not None and chunk_start > end):
+                    continue
+                del manifest['chunks'][chunk]
+                path = os.path.join(folder, f'{chunk}.parquet')
+                if os.path.exists(path):
+                    os.remove(path)
+                deleted += 1
+
+            write_manifest(platform, param, one_rule, manifest)
+    return deleted
+
+
+def partition_folders(pattern):
+    """ Folders of the partitions that match with a glob pattern """
+    path = os.path.join(df_folder, *pattern)
+    return [folder for folder in glob.glob(path) if os.path.isdir(folder)]
+
+
+@subscribe
+def invalidate_changes(changes):
+    """ Delete the cached chunks of the changed data """
+    for change in changes:
+        if change.kind == 'data':
+            invalidate(change.platform_code, change.parameter, change.rule,
+                       change.time_min, change.time_max)
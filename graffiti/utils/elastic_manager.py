@@ -0,0 +1,146 @@
+import os
+import socket
+import threading
+import time
+
+from elasticsearch import Elasticsearch, Transport, exceptions
+from elasticsearch.connection import Urllib3HttpConnection
+from urllib3.connection import HTTPConnection
+
+from config import (elastic_host, elastic_pool_size, elastic_timeout,
+                    elastic_max_retries, elastic_retry_backoff,
+                    elastic_keep_alive)
+
+
+# Status codes of the DB that are worth a retry
+retry_status_codes = (429, 502, 503, 504)
+
+_elastic = None
+_elastic_pid = None
+_elastic_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'retries': 0,
+    'in_use': 0,
+    'wait_time': 0.0,
+    'max_wait_time': 0.0
+}
+_connections = []
+
+
+class PooledConnection(Urllib3HttpConnection):
+    """
+    Connection with the DB that limits the number of simultaneous requests to
+    the size of the pool and keeps track of the time waiting for a free
+    connection.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.maxsize = kwargs.get('maxsize', elastic_pool_size)
+        self.slots = threading.BoundedSemaphore(self.maxsize)
+
+        if elastic_keep_alive:
+            self.pool.conn_kw['socket_options'] = \
+                HTTPConnection.default_socket_options + \
+                [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+        with _stats_lock:
+            _connections.append(self)
+
+    def perform_request(self, *args, **kwargs):
+        start = time.monotonic()
+        self.slots.acquire()
+        wait_time = time.monotonic() - start
+
+        with _stats_lock:
+            _stats['requests'] += 1
+            _stats['in_use'] += 1
+            _stats['wait_time'] += wait_time
+            _stats['max_wait_time'] = max(_stats['max_wait_time'], wait_time)
+        try:
+            return super().perform_request(*args, **kwargs)
+        finally:
+            with _stats_lock:
+                _stats['in_use'] -= 1
+            self.slots.release()
+
+    def idle_connections(self):
+        """ Number of open connections that are waiting in the pool """
+        return sum(1 for conn in list(self.pool.pool.queue) if conn is not None)
+
+
+class RetryTransport(Transport):
+    """
+    Transport that retries the requests that fail because of connection
+    errors or an overloaded DB, waiting an exponential backoff between them.
+    """
+    def perform_request(self, method, url, headers=None, params=None,
+                        body=None):
+        attempt = 0
+        while True:
+            try:
+                return super().perform_request(method, url, headers=headers,
+                                               params=params, body=body)
+            except exceptions.TransportError as e:
+                retry = isinstance(e, exceptions.ConnectionError) or \
+                    e.status_code in retry_status_codes
+                if not retry or attempt >= elastic_max_retries:
+                    raise
+
+            time.sleep(elastic_retry_backoff * 2 ** attempt)
+            attempt += 1
+            with _stats_lock:
+                _stats['retries'] += 1
+
+
+def get_elastic():
+    """
+    Get the client of the DB. There is only one client per process. It is
+    created the first time that it is needed and it is shared by all threads.
+
+    Returns
+    -------
+        elastic: Elasticsearch
+            Client of the DB.
+    """
+    global _elastic, _elastic_pid
+
+    # The connections of a parent process can not be used after a fork
+    if _elastic is None or _elastic_pid != os.getpid():
+        with _elastic_lock:
+            if _elastic is None or _elastic_pid != os.getpid():
+                with _stats_lock:
+                    _connections.clear()
+                _elastic = Elasticsearch(
+                    elastic_host, transport_class=RetryTransport,
+                    connection_class=PooledConnection,
+                    maxsize=elastic_pool_size, timeout=elastic_timeout,
+                    max_retries=0)
+                _elastic_pid = os.getpid()
+    return _elastic
+
+
+def pool_stats():
+    """
+    Statistics of the connection pool of the DB client.
+
+    Returns
+    -------
+        stats: dict
+            Keys: pool_size, in_use, idle, requests, retries, wait_time (total
+            seconds waiting for a free connection), mean_wait_time and
+            max_wait_time.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        connections = list(_connections)
+
+    stats['pool_size'] = sum(conn.maxsize for conn in connections)
+    stats['idle'] = sum(conn.idle_connections() for conn in connections)
+    if stats['requests']:
+        stats['mean_wait_time'] = stats['wait_time'] / stats['requests']
+    else:
+        stats['mean_wait_time'] = 0.0
+    return stats
@@ -0,0 +1,460 @@
+import gzip
+import json
+import base64
+import functools
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import plotly.express as px
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Styles of plotly.express for the values of line_dash and symbol
+dash_sequence = ['solid', 'dot', 'dash', 'longdash', 'dashdot', 'longdashdot']
+symbol_sequence = ['circle', 'diamond', 'square', 'x', 'cross']
+
+# Compression level of the gzip JSON files of the figures
+json_compresslevel = 6
+
+# Sentinels of the data and layout in the cached HTML shell
+_data_sentinel = '__graffiti_data__'
+_layout_sentinel = '__graffiti_layout__'
+
+# Types of the typed arrays of plotly.js
+_typed_dtypes = {
+    np.dtype('float64'): 'f8',
+    np.dtype('float32'): 'f4',
+    np.dtype('int32'): 'i4',
+    np.dtype('int16'): 'i2',
+    np.dtype('int8'): 'i1',
+    np.dtype('uint32'): 'u4',
+    np.dtype('uint16'): 'u2',
+    np.dtype('uint8'): 'u1'
+}
+
+
+def typed_array(values):
+    """
+    Encode a numeric array as a typed array of plotly.js, base64 of the bytes
+    of the array, instead of a list of numbers.
+
+    Parameters
+    ----------
+        values: array
+
+    Returns
+    -------
+        typed_array: dict
+            Keys: dtype and bdata.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu' and values.dtype not in _typed_dtypes:
+        # int64 is not supported by plotly.js
+        if values.size and (values.min() < np.iinfo(np.int32).min or
+                            values.max() > np.iinfo(np.int32).max):
+            values = values.astype(np.float64)
+        else:
+            values = values.astype(np.int32)
+    elif values.dtype not in _typed_dtypes:
+        values = values.astype(np.float64)
+    values = np.ascontiguousarray(values)
+    return {
+        'dtype': _typed_dtypes[values.dtype],
+        'bdata': base64.b64encode(values.tobytes()).decode('ascii')
+    }
+
+
+def epoch_milliseconds(times):
+    """
+    Convert the times of the data to epoch milliseconds, that plotly.js reads
+    as dates.
+
+    Parameters
+    ----------
+        times: pandas Series
+            ISO 8601 str or datetimes.
+
+    Returns
+    -------
+        milliseconds: array of float
+    """
+    if times.dtype == object or pd.api.types.is_string_dtype(times):
+        times = times.astype(str)
+        if times.str.endswith('Z').all():
+            # The times of the DB are UTC, and parsing them without the time
+            # zone is faster
+            times = pd.to_datetime(times.str.removesuffix('Z'),
+                                   format='ISO8601')
+    times = pd.to_datetime(times, utc=True, format='ISO8601')
+    milliseconds = times.dt.tz_convert(None).to_numpy(dtype='datetime64[ms]')
+    return milliseconds.astype(np.int64).astype(np.float64)
+
+
+@functools.lru_cache(maxsize=None)
+def template_layout(template=None):
+    """
+    Layout of a plotly template, like plotly.express applies it.
+
+    Parameters
+    ----------
+        template: str
+            Name of the template. By default, the default template of plotly.
+
+    Returns
+    -------
+        template_layout: dict
+    """
+    return pio.templates[template or pio.templates.default].to_plotly_json()
+
+
+@functools.lru_cache(maxsize=None)
+def template_colors(template=None):
+    """ Color sequence of a template, like plotly.express """
+    template = pio.templates[template or pio.templates.default]
+    return list(template.layout.colorway or px.colors.qualitative.D3)
+
+
+@functools.lru_cache(maxsize=None)
+def template_symbols(template=None):
+    """ Marker symbol sequence of a template, like plotly.express """
+    template = pio.templates[template or pio.templates.default]
+    symbols = [scatter.marker.symbol for scatter in template.data.scatter]
+    if not any(symbols):
+        return symbol_sequence
+    return symbols
+
+
+def group_rows(df, keys):
+    """
+    Split the rows of a DataFrame into the traces of plotly.express: one per
+    combination of the values of the keys, sorted by the first appearance of
+    every value and keeping the order of the rows.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+        keys: list of str
+            Columns of the groups.
+
+    Returns
+    -------
+        groups: list of (tuple, tuple, array of int)
+            Values of the keys, position of every value in the order of its
+            key and rows of the group.
+    """
+    orders = [pd.unique(df[key]) for key in keys]
+    codes = [pd.Categorical(df[key], categories=order).codes
+             for key, order in zip(keys, orders)]
+
+    # np.lexsort is stable and the last key is the primary one
+    rows = np.lexsort(codes[::-1])
+    sorted_codes = np.stack([code[rows] for code in codes], axis=1)
+    starts = np.flatnonzero(np.concatenate((
+        [True], (sorted_codes[1:] != sorted_codes[:-1]).any(axis=1))))
+    ends = np.append(starts[1:], len(rows))
+
+    groups = []
+    for start, end in zip(starts, ends):
+        group_codes = tuple(int(code) for code in sorted_codes[start])
+        values = tuple(order[code] for order, code in zip(orders, group_codes))
+        groups.append((values, group_codes, rows[start:end]))
+    return groups
+
+
+def series_layout(legend_title, template=None):
+    """ Layout of the time series figures of plotly.express """
+    return {
+        'template': template_layout(template),
+        'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'type': 'date',
+                  'title': {'text': 'time'}},
+        'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0],
+                  'title': {'text': 'value'}},
+        'legend': {'title': {'text': legend_title}, 'tracegroupgap': 0},
+        'margin': {'t': 60}
+    }
+
+
+def line_spec(df, template=None, render_mode='svg'):
+    """
+    Make the figure of px.line(df, x='time', y='value', color='depth',
+    symbol='parameter', line_dash='platform_code') without the objects of
+    plotly.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+            Output of get_df().
+        template: str
+            Name of the template.
+        render_mode: str
+            Options - svg, webgl. The lines are splines with SVG and linear
+            with WebGL.
+
+    Returns
+    -------
+        spec: dict
+            Keys: data and layout.
+    """
+    colors = template_colors(template)
+    symbols = template_symbols(template)
+    times = epoch_milliseconds(df['time'])
+    values = df['value'].to_numpy(dtype=float)
+
+    data = []
+    keys = ['depth', 'platform_code', 'parameter']
+    for (depth, platform_code, parameter), codes, rows in group_rows(df,
+                                                                    keys):
+        name = f'{depth}, {platform_code}, {parameter}'
+        trace = {
+            'hovertemplate': f'depth={depth}<br>platform_code=' + \
+                f'{platform_code}<br>parameter={parameter}<br>' + \
+                'time=%{x}<br>value=%{y}<extra></extra>',
+            'legendgroup': name,
+            'line': {
+                'color': colors[codes[0] % len(colors)],
+                'dash': dash_sequence[codes[1] % len(dash_sequence)],
+                'shape': 'spline' if render_mode == 'svg' else 'linear'
+            },
+            'marker': {'symbol': symbols[codes[2] % len(symbols)]},
+            'mode': 'lines+markers',
+            'name': name,
+            'showlegend': True,
+            'x': typed_array(times[rows]),
+            'xaxis': 'x',
+            'y': typed_array(values[rows]),
+            'yaxis': 'y',
+            'type': 'scatter' if render_mode == 'svg' else 'scattergl'
+        }
+        if render_mode == 'svg':
+            trace['orientation'] = 'v'
+        data.append(trace)
+
+    return {'data': data,
+            'layout': series_layout('depth, platform_code, parameter',
+                                    template)}
+
+
+def area_spec(df, template=None, render_mode='svg'):
+    """
+    Make the figure of px.area(df, x='time', y='value', color='depth',
+    line_group='platform_code', symbol='parameter', line_shape='spline')
+    without the objects of plotly.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+            Output of get_df().
+        template: str
+            Name of the template.
+        render_mode: str
+            Options - svg, webgl. WebGL has no spline lines nor stacked areas,
+            so the lines are linear and the areas are filled to zero.
+
+    Returns
+    -------
+        spec: dict
+            Keys: data and layout.
+    """
+    colors = template_colors(template)
+    symbols = template_symbols(template)
+    times = epoch_milliseconds(df['time'])
+    values = df['value'].to_numpy(dtype=float)
+
+    data = []
+    names = set()
+    keys = ['depth', 'parameter', 'platform_code']
+    for (depth, parameter, platform_code), codes, rows in group_rows(df,
+                                                                    keys):
+        name = f'{depth}, {parameter}'
+        trace = {
+            'hovertemplate': f'depth={depth}<br>parameter={parameter}<br>' + \
+                f'platform_code={platform_code}<br>' + \
+                'time=%{x}<br>value=%{y}<extra></extra>',
+            'legendgroup': name,
+            'line': {'color': colors[codes[0] % len(colors)]},
+            'marker': {'symbol': symbols[codes[1] % len(symbols)]},
+            'mode': 'lines+markers',
+            'name': name,
+            'showlegend': name not in names,
+            'x': typed_array(times[rows]),
+            'xaxis': 'x',
+            'y': typed_array(values[rows]),
+            'yaxis': 'y'
+        }
+        if render_mode == 'svg':
+            trace.update({'fillpattern': {'shape': ''}, 'orientation': 'v',
+                          'stackgroup': '1', 'type': 'scatter'})
+            trace['line']['shape'] = 'spline'
+        else:
+            trace.update({'fill': 'tozeroy', 'type': 'scattergl'})
+        names.add(name)
+        data.append(trace)
+
+    return {'data': data,
+            'layout': series_layout('depth, parameter', template)}
+
+
+def pie_spec(names, values, names_label, values_label, template=None,
+             margin=None):
+    """
+    Make the figure of px.pie() without the objects of plotly.
+
+    Parameters
+    ----------
+        names: list of str
+            Labels of the sectors.
+        values: list of float
+            Values of the sectors.
+        names_label: str
+            Label of the names in the hover.
+        values_label: str
+            Label of the values in the hover.
+        template: str
+            Name of the template.
+        margin: dict
+            Margin of the layout. By default, the one of plotly.express.
+
+    Returns
+    -------
+        spec: dict
+            Keys: data and layout.
+    """
+    data = [{
+        'domain': {'x': [0.0, 1.0], 'y': [0.0, 1.0]},
+        'hovertemplate': f'{names_label}=%{{label}}<br>' + \
+            f'{values_label}=%{{value}}<extra></extra>',
+        'labels': [str(name) for name in names],
+        'legendgroup': '',
+        'name': '',
+        'showlegend': True,
+        'values': typed_array(values),
+        'type': 'pie'
+    }]
+    layout = {
+        'template': template_layout(template),
+        'legend': {'tracegroupgap': 0},
+        'margin': margin or {'t': 60}
+    }
+    return {'data': data, 'layout': layout}
+
+
+def to_json(value):
+    """ Serialize a figure spec with the fastest JSON encoder available """
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, separators=(',', ':'))
+
+
+@functools.lru_cache(maxsize=None)
+def html_shell(config_json):
+    """
+    HTML page of plotly.io.write_html(include_plotlyjs='cdn'), split around
+    the data and the layout. It is made once per config.
+
+    Parameters
+    ----------
+        config_json: str
+            JSON of the config of the figures.
+
+    Returns
+    -------
+        (head, middle, tail): (str, str, str)
+    """
+    html = pio.to_html(
+        {'data': [{'type': _data_sentinel}],
+         'layout': {'title': _layout_sentinel}},
+        config=json.loads(config_json), include_plotlyjs='cdn',
+        validate=False, div_id='graffiti-figure')
+    head, rest = html.split(json.dumps([{'type': _data_sentinel}],
+                                       separators=(',', ':')), 1)
+    middle, tail = rest.split(json.dumps({'title': _layout_sentinel},
+                                         separators=(',', ':')), 1)
+    return head, middle, tail
+
+
+def write_spec(spec, file_path, config=None):
+    """
+    Save a figure spec in an HTML file, like plotly.io.write_html().
+
+    Parameters
+    ----------
+        spec: dict
+            Keys: data and layout.
+        file_path: str
+            Path of the HTML file.
+        config: dict
+            Config of the figure.
+    """
+    head, middle, tail = html_shell(json.dumps(config or {}, sort_keys=True))
+    with open(file_path, 'w', encoding='utf-8') as html_file:
+        html_file.write(head)
+        html_file.write(to_json(spec['data']))
+        html_file.write(middle)
+        html_file.write(to_json(spec['layout']))
+        html_file.write(tail)
+
+
+def write_json(fig, file_path):
+    """
+    Save the Plotly JSON of a figure in a gzip compressed file.
+
+    Parameters
+    ----------
+        fig: dict or plotly Figure
+            Figure spec, with the keys data and layout, or figure of
+            plotly.express.
+        file_path: str
+            Path of the file, like {fig_name}.json.gz
+    """
+    if isinstance(fig, dict):
+        text = to_json(fig)
+    else:
+        text = pio.to_json(fig, validate=False)
+    # mtime=0 makes the same file for the same figure
+    content = gzip.compress(text.encode('utf-8'), json_compresslevel,
+                            mtime=0)
+    with open(file_path, 'wb') as json_file:
+        json_file.write(content)
+
+
+@functools.lru_cache(maxsize=None)
+def viewer_html(config_json, json_url='json/'):
+    """
+    HTML page that loads the Plotly JSON of a figure and draws it. The key of
+    the figure is the parameter key of the URL of the page, like
+    viewer?key=line-0123. It is the HTML shell of write_spec() that fetches
+    the data and the layout.
+
+    Parameters
+    ----------
+        config_json: str
+            JSON of the config of the figures.
+        json_url: str
+            URL of the JSON of the figures, the key is added at the end.
+
+    Returns
+    -------
+        html: str
+    """
+    head, middle, tail = html_shell(config_json)
+    script_start = head.rindex('<script>') + len('<script>')
+    script_end = tail.index('</script>')
+    fetch_start = f"""
+                var key = new URLSearchParams(window.location.search).get("key");
+                fetch({json.dumps(json_url)} + encodeURIComponent(key)).then(function (response) {{
+                    if (!response.ok) {{
+                        throw new Error(response.status === 404 ? "Figure not found" : "Error " + response.status);
+                    }}
+                    return response.json();
+                }}).then(function (figure) {{"""
+    fetch_end = """
+                }).catch(function (error) {
+                    document.getElementById("graffiti-figure").textContent = error.message;
+                });"""
+    return head[:script_start] + fetch_start + head[script_start:] + \
+        'figure.data' + middle + 'figure.layout' + tail[:script_end] + \
+        fetch_end + tail[script_end:]
@@ -0,0 +1,349 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from contextlib import closing
+
+from .df_cache import to_timestamp
+from .invalidation import subscribe
+
+from config import (fig_folder, figure_cache_db, figure_cache_bytes,
+                    csv_folder, export_cache_db, export_cache_bytes)
+
+# Fields of the dependencies of a cached file
+dependency_fields = ('platform_code', 'parameter', 'rule')
+
+# Fields of the time range of the data of a cached file
+time_fields = ('time_min', 'time_max')
+
+
+def time_key(value):
+    """
+    Date and time as an UTC ISO 8601 str with a fixed format, so the times can
+    be compared as text. None if the value is not a date.
+    """
+    if value is None or value is False or value == '':
+        return None
+    try:
+        return to_timestamp(value).strftime('%Y-%m-%dT%H:%M:%S.%f')
+    except (TypeError, ValueError):
+        return None
+
+
+class FileCache:
+    """
+    Cache of files (figures, exports) with hashed names, bounded in bytes.
+    A SQLite manifest keeps the size, the last access and the dependencies of
+    every file: the platform_codes, parameters and rules of the data that it
+    shows. When the cache is bigger than max_bytes, the files with the oldest
+    access are deleted.
+
+    The cache subscribes to the changes of the data: the files whose
+    dependencies overlap with a change are deleted.
+
+    Parameters
+    ----------
+        folder: str
+            Folder of the files.
+        db_path: str
+            Path of the SQLite manifest.
+        max_bytes: int
+            Maximum size of the files of the cache.
+        data_kinds: tuple of str
+            Kinds of the files that show data. None means all the kinds.
+        metadata_kinds: tuple of str
+            Kinds of the files that show the metadata of the platforms.
+    """
+    def __init__(self, folder, db_path, max_bytes, data_kinds=None,
+                 metadata_kinds=()):
+        self.folder = folder
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.data_kinds = data_kinds
+        self.metadata_kinds = metadata_kinds
+        self.lock = threading.Lock()
+        self.ready = False
+
+    def connect(self):
+        """ New connection with the manifest, it is created if needed """
+        if not self.ready:
+            with self.lock:
+                if not self.ready:
+                    for folder in (self.folder, os.path.dirname(self.db_path)):
+                        if folder:
+                            os.makedirs(folder, exist_ok=True)
+                    with closing(self._connect()) as connection:
+                        connection.execute('PRAGMA journal_mode=WAL')
+                        connection.executescript(
+                            'CREATE TABLE IF NOT EXISTS entry ('
+                            'key TEXT PRIMARY KEY, '
+                            'extension TEXT NOT NULL, '
+                            'size INTEGER NOT NULL, '
+                            'created REAL NOT NULL, '
+                            'accessed REAL NOT NULL); '
+                            'CREATE INDEX IF NOT EXISTS entry_accessed '
+                            'ON entry (accessed); '
+                            'CREATE TABLE IF NOT EXISTS dependency ('
+                            'key TEXT NOT NULL, '
+                            'field TEXT NOT NULL, '
+                            'value TEXT NOT NULL, '
+                            'PRIMARY KEY (key, field, value)); '
+                            'CREATE INDEX IF NOT EXISTS dependency_value '
+                            'ON dependency (field, value);')
+                    self.ready = True
+        return self._connect()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=60,
+                               isolation_level=None)
+
+    @staticmethod
+    def key(name):
+        """
+        Hashed name of a file. It keeps the kind of the file (the text
+        before the first '-') to be readable.
+
+        Parameters
+        ----------
+            name: str
+                Name with all the arguments of the file, like
+                line-OBSEA-TEMP-dminNone-...
+
+        Returns
+        -------
+            key: str
+        """
+        kind = name.split('-', 1)[0]
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]
+        return f'{kind}-{digest}'
+
+    def path(self, key, extension='html'):
+        """ Path of the file of a key """
+        return f'{self.folder}/{key}.{extension}'
+
+    def get(self, key, extension='html'):
+        """
+        Check if a file is in the cache and update its last access.
+
+        Parameters
+        ----------
+            key: str
+                Output of FileCache.key()
+            extension: str
+                Extension of the file.
+
+        Returns
+        -------
+            path: str or None
+                Path of the file. None if it is not in the cache.
+        """
+        file_path = self.path(key, extension)
+        if not os.path.exists(file_path):
+            return None
+
+        with closing(self.connect()) as connection:
+            updated = connection.execute(
+                'UPDATE entry SET accessed = ? WHERE key = ?',
+                (time.time(), key)).rowcount
+        if not updated:
+            # A file that is not in the manifest depends on all the data
+            self.put(key, extension=extension)
+        return file_path
+
+    def put(self, key, dependencies=None, extension='html'):
+        """
+        Add a file to the manifest, after it is written in path(key). Then, the
+        oldest files are deleted if the cache is too big.
+
+        Parameters
+        ----------
+            key: str
+                Output of FileCache.key()
+            dependencies: dict
+                The keys are platform_code, parameter or rule and the values
+                are lists of the values in the file. A missing key means that
+                the file depends on all the values. The keys time_min and
+                time_max are the time range of the data in the file.
+            extension: str
+                Extension of the file.
+        """
+        file_path = self.path(key, extension)
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return
+
+        now = time.time()
+        with closing(self.connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT OR REPLACE INTO entry VALUES (?, ?, ?, ?, ?)',
+                (key, extension, size, now, now))
+            connection.execute('DELETE FROM dependency WHERE key = ?', (key,))
+            for field, values in (dependencies or {}).items():
+                if field in time_fields:
+                    values = time_key(values)
+                if values is None:
+                    continue
+                if isinstance(values, str):
+                    values = [values]
+                connection.executemany(
+                    'INSERT OR IGNORE INTO dependency VALUES (?, ?, ?)',
+                    [(key, field, str(value)) for value in values])
+            connection.execute('COMMIT')
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Delete the files with the oldest access until the size fits. The file
+        of the key keep is not deleted, so it can be sent after put().
+        """
+        with closing(self.connect()) as connection:
+            total = connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM entry').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            rows = connection.execute(
+                'SELECT key, extension, size FROM entry ORDER BY accessed')
+            evicted = []
+            for key, extension, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                evicted.append((key, extension))
+                total -= size
+        self._delete(evicted)
+
+    def invalidate(self, platform_code=None, parameter=None, rule=None,
+                   kind=None, time_min=None, time_max=None):
+        """
+        Delete the files that depend on some data. A file is deleted if it
+        depends on all the given values and its time range overlaps with the
+        given one. With no arguments, all the files are deleted.
+
+        Parameters
+        ----------
+            platform_code: str
+                Platform code
+            parameter: str
+                Parameter acronym
+            rule: str
+                Rule of the data.
+            kind: str
+                Only delete the files of this kind, like line or map.
+            time_min: str
+                Minimum date and time of the changed data.
+            time_max: str
+                Maximum date and time of the changed data.
+
+        Returns
+        -------
+            deleted: int
+                Number of deleted files.
+        """
+        conditions = []
+        arguments = []
+        values = {'platform_code': platform_code, 'parameter': parameter,
+                  'rule': rule}
+        for field in dependency_fields:
+            if values[field] is None:
+                continue
+            # No dependencies of a field means all the values of the field
+            conditions.append(
+                '(NOT EXISTS (SELECT 1 FROM dependency d WHERE d.key = e.key '
+                'AND d.field = ?) OR EXISTS (SELECT 1 FROM dependency d '
+                'WHERE d.key = e.key AND d.field = ? AND d.value = ?))')
+            arguments += [field, field, str(values[field])]
+        # A file without time range has the data of all the times
+        for field, operator, value in (('time_max', '<', time_min),
+                                       ('time_min', '>', time_max)):
+            value = time_key(value)
+            if value is None:
+                continue
+            conditions.append(
+                'NOT EXISTS (SELECT 1 FROM dependency d WHERE d.key = e.key '
+                f'AND d.field = ? AND d.value {operator} ?)')
+            arguments += [field, value]
+        if kind is not None:
+            conditions.append('substr(e.key, 1, ?) = ?')
+            arguments += [len(kind) + 1, f'{kind}-']
+
+        query = 'SELECT e.key, e.extension FROM entry e'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        with closing(self.connect()) as connection:
+            rows = connection.execute(query, arguments).fetchall()
+        self._delete(rows)
+        return len(rows)
+
+    def _delete(self, rows):
+        if not rows:
+            return
+        with closing(self.connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            for key, _ in rows:
+                connection.execute('DELETE FROM entry WHERE key = ?', (key,))
+                connection.execute('DELETE FROM dependency WHERE key = ?',
+                                   (key,))
+            connection.execute('COMMIT')
+        for key, extension in rows:
+            try:
+                os.remove(self.path(key, extension))
+            except FileNotFoundError:
+                pass
+
+    def on_change(self, changes):
+        """
+        Delete the files of the changed data. A change of the data deletes
+        the files of the data_kinds and a change of the metadata deletes the
+        files of the metadata_kinds.
+
+        Parameters
+        ----------
+            changes: list of Change
+        """
+        for change in changes:
+            if change.kind == 'data':
+                for kind in self.data_kinds or [None]:
+                    self.invalidate(change.platform_code, change.parameter,
+                                    change.rule, kind, change.time_min,
+                                    change.time_max)
+            else:
+                for kind in self.metadata_kinds:
+                    self.invalidate(platform_code=change.platform_code,
+                                    kind=kind)
+
+    def stats(self):
+        """
+        Get the size of the cache.
+
+        Returns
+        -------
+            stats: dict
+                Keys: files, bytes and max_bytes.
+        """
+        with closing(self.connect()) as connection:
+            files, size = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry'
+            ).fetchone()
+        return {'files': files, 'bytes': size, 'max_bytes': self.max_bytes}
+
+
+# Cache of the html figures. The maps and the figures that only show the
+# platforms with metadata depend on the metadata.
+figure_cache = FileCache(fig_folder, figure_cache_db, figure_cache_bytes,
+                         metadata_kinds=('map', 'platform_pie',
+                                         'parameter_availability'))
+
+# Cache of the files of the data and metadata that are downloaded
+export_cache = FileCache(csv_folder, export_cache_db, export_cache_bytes,
+                         data_kinds=('data',), metadata_kinds=('metadata',))
+
+subscribe(figure_cache.on_change)
+subscribe(export_cache.on_change)
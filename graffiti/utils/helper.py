@@ -1,3 +1,8 @@
+import numpy as np
+import pandas as pd
+
+from pandas.tseries.frequencies import to_offset
+
 from config import (data_index_r, data_index_h, data_index_2h, data_index_3h,
                     data_index_6h, data_index_8h, data_index_12h, data_index_d,
                     data_index_2d, data_index_3d, data_index_4d, data_index_5d,
@@ -13,6 +18,10 @@ from config import (data_index_r, data_index_h, data_index_2h, data_index_3h,
                     data_index_3h_min, data_index_3h_max, data_index_2h_min,
                     data_index_2h_max, data_index_h_min, data_index_h_max)
 
+# Average rules, from the finest to the coarsest
+rules = ['R', 'H', '2H', '3H', '6H', '8H', '12H', 'D', '2D', '3D', '4D', '5D',
+         '6D', '10D', '15D', 'M']
+
 
 def index_name(rule, method='mean'):
     """
@@ -168,4 +177,167 @@ def time_to_str(time_min:str, time_max:str):
     else:
         time_max_str = time_max
     
-    return time_min_str, time_max_str
\ No newline at end of file
+    return time_min_str, time_max_str
+
+
+def valid_range(platform_code: str, parameter: str):
+    """
+    Range of the valid values of a parameter. Some data has erroneus values
+    and they must not be used.
+
+    Parameters
+    ----------
+        platform_code: str
+            Platform code.
+        parameter: str
+            Parameter acronym.
+
+    Returns
+    -------
+        (value_min, value_max): (float, float)
+            Minimum and maximum valid values. None if there is no limit.
+    """
+    value_min = None
+    value_max = None
+    if parameter == 'TEMP':
+        if platform_code == 'OBSEA':
+            value_min, value_max = 10, 30
+        else:
+            value_min, value_max = 1, 40
+    elif parameter == 'PSAL':
+        value_min = 30
+
+    return value_min, value_max
+
+
+def rule_interval(rule: str):
+    """
+    Time interval of the averages of a rule.
+
+    Parameters
+    ----------
+        rule: str
+            Options - R, M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H,
+            2H, H. The interval of R (raw data) is one hour.
+
+    Returns
+    -------
+        (interval, freq): (dict, str)
+            The interval is the argument of an Elastic Search date_histogram
+            (fixed_interval or calendar_interval) and the freq is the same
+            interval as a pandas frequency.
+    """
+    if rule == 'R':
+        return {'fixed_interval': '1h'}, 'h'
+    elif rule == 'M':
+        return {'calendar_interval': '1M'}, 'MS'
+
+    number = rule[:-1] or '1'
+    if rule.endswith('H'):
+        return {'fixed_interval': f'{number}h'}, f'{number}h'
+    return {'fixed_interval': f'{number}d'}, f'{number}D'
+
+
+def true_runs(mask):
+    """
+    Run-length encoding of the True values of a boolean array.
+
+    Parameters
+    ----------
+        mask: array of bool
+
+    Returns
+    -------
+        (starts, ends): (array of int, array of int)
+            Index of the first value of every run and index after its last
+            value.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def availability_intervals(times, freq: str):
+    """
+    Get the time intervals with data from the times of the non-empty buckets
+    of a date histogram.
+
+    Parameters
+    ----------
+        times: array
+            Start time of the buckets with data, as epoch milliseconds or
+            datetimes, sorted.
+        freq: str
+            Size of the buckets, as pandas frequency.
+
+    Returns
+    -------
+        (starts, ends): (DatetimeIndex, DatetimeIndex)
+            Start and end of every interval without gaps. The end is the start
+            of the first empty bucket.
+    """
+    if len(times) == 0:
+        empty = pd.DatetimeIndex([])
+        return empty, empty
+
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.number):
+        times = pd.to_datetime(times, unit='ms')
+    else:
+        times = pd.to_datetime(times)
+
+    # All the buckets, plus one to get the end of the last interval
+    grid = pd.date_range(times[0], times[-1] + to_offset(freq), freq=freq)
+
+    starts, ends = true_runs(grid[:-1].isin(times))
+    return grid[starts], grid[ends]
+
+
+def depth_profile(df, column, depth_bin, depth_min=None, depth_max=None):
+    """
+    Average the values of a DataFrame in bins of depth, in one pass. The bins
+    are closed on the right, (start + (n - 1) * depth_bin, start + n *
+    depth_bin], and the first one includes the start depth.
+
+    Parameters
+    ----------
+        df: pandas DataFrame
+            Data with the columns depth and column.
+        column: str
+            Column with the values.
+        depth_bin: float
+            Size of the bins, in meters.
+        depth_min: float
+            Start of the first bin. By default, the minimum depth of the data.
+        depth_max: float
+            Maximum depth of the bins. By default, the maximum depth of the
+            data.
+
+    Returns
+    -------
+        profile: pandas DataFrame
+            One row per bin with data, sorted by depth. Columns: depth (mean
+            depth of the bin), column (mean value), min, max and count.
+    """
+    depths = pd.to_numeric(df['depth'], errors='coerce').to_numpy(dtype=float)
+    values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+
+    mask = ~(np.isnan(depths) | np.isnan(values))
+    if depth_min is not None:
+        mask &= depths >= float(depth_min)
+    if depth_max is not None:
+        mask &= depths <= float(depth_max)
+    depths = depths[mask]
+    values = values[mask]
+    if not len(depths):
+        return pd.DataFrame(columns=['depth', column, 'min', 'max', 'count'])
+
+    start = float(depth_min) if depth_min is not None else depths.min()
+    bins = np.maximum(np.ceil((depths - start) / depth_bin), 1).astype(
+        np.int64)
+
+    profile = pd.DataFrame({'bin': bins, 'depth': depths, column: values})
+    profile = profile.groupby('bin', sort=True).agg(
+        depth=('depth', 'mean'), value=(column, 'mean'),
+        min=(column, 'min'), max=(column, 'max'), count=(column, 'size'))
+    return profile.rename(columns={'value': column}).reset_index(drop=True)
@@ -0,0 +1,221 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+
+def data_documents(data, metadata, parameter):
+    """
+    Make the data documents of a parameter from the columns of a WaterFrame.
+    The fields are computed for the whole columns at once and the rows
+    without value are skipped.
+
+    Parameters
+    ----------
+        data: pandas DataFrame
+            Data of the WaterFrame, with a (DEPTH, TIME) MultiIndex and the
+            columns {parameter}, {parameter}_QC, TIME_QC and DEPTH_QC.
+        metadata: dict
+            Metadata of the WaterFrame. It needs platform_code,
+            last_latitude_observation and last_longitude_observation.
+        parameter: str
+            Parameter acronym.
+
+    Yields
+    ------
+        data: dict
+            Data document, with the keys of post_data().
+    """
+    values = pd.to_numeric(data[parameter], errors='coerce').to_numpy(
+        dtype=float)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return
+
+    index = data.index[valid]
+    times = pd.DatetimeIndex(
+        index.get_level_values(1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    depths = index.get_level_values(0)
+
+    columns = zip(
+        times,
+        depths.tolist(),
+        values[valid].tolist(),
+        data[f'{parameter}_QC'].to_numpy()[valid].tolist(),
+        data['TIME_QC'].astype(str).to_numpy()[valid].tolist(),
+        data['DEPTH_QC'].astype(str).to_numpy()[valid].tolist())
+
+    platform_code = metadata['platform_code']
+    lat = metadata['last_latitude_observation']
+    lon = metadata['last_longitude_observation']
+
+    for time, depth, value, qc, time_qc, depth_qc in columns:
+        yield {
+            'platform_code': platform_code,
+            'parameter': parameter,
+            'time': time,
+            'time_qc': time_qc,
+            'lat': lat,
+            'lat_qc': '0',
+            'lon': lon,
+            'lon_qc': '0',
+            'depth': depth,
+            'depth_qc': depth_qc,
+            'value': value,
+            'qc': qc
+        }
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of size elements. The last list can be
+    smaller.
+
+    Yields
+    ------
+        chunk: list
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Rules of the averages, from the finest to the coarsest, with the rule that
+# they are computed from. The buckets of every rule are made of whole buckets
+# of its source rule, so the statistics can be aggregated again.
+resample_rules = [
+    ('H', None),
+    ('2H', 'H'),
+    ('3H', 'H'),
+    ('6H', '3H'),
+    ('8H', '2H'),
+    ('12H', '6H'),
+    ('D', '12H'),
+    ('2D', 'D'),
+    ('3D', 'D'),
+    ('4D', '2D'),
+    ('5D', 'D'),
+    ('6D', '3D'),
+    ('10D', '5D'),
+    ('15D', '5D'),
+    ('M', 'D')
+]
+
+
+def rule_offset(rule):
+    """
+    pandas offset of a rule.
+
+    Parameters
+    ----------
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H, H
+
+    Returns
+    -------
+        offset: pandas DateOffset
+    """
+    if rule == 'M':
+        return pd.offsets.MonthEnd()
+    number = int(rule[:-1] or 1)
+    if rule.endswith('H'):
+        return pd.offsets.Hour(number)
+    return pd.offsets.Day(number)
+
+
+def group_buckets(df, rule):
+    """ Group a (DEPTH, TIME) DataFrame by depth and time bucket """
+    return df.groupby([df.index.get_level_values('DEPTH'),
+                       pd.Grouper(freq=rule_offset(rule), level='TIME')])
+
+
+def resample_data(data, parameters, methods=('mean', 'min', 'max'),
+                  rules=None):
+    """
+    Compute the averages of all the rules. The raw data is grouped only once,
+    by hour, into the sum, count, sum of squares, minimum and maximum of every
+    bucket. The statistics of the other rules are computed from the ones of a
+    finer rule.
+
+    Parameters
+    ----------
+        data: pandas DataFrame
+            Data of the WaterFrame, with a (DEPTH, TIME) MultiIndex.
+        parameters: list of str
+            Parameter acronyms (columns of data).
+        methods: list of str
+            Options - mean, min, max, std, count
+        rules: list of str
+            Rules to return. By default, all the resample_rules.
+
+    Yields
+    ------
+        (rule, frames): (str, dict)
+            The keys of frames are the methods and the values are DataFrames
+            like data, with the QC columns set to 0.
+    """
+    if rules is None:
+        rules = [rule for rule, _ in resample_rules]
+
+    values = data[list(parameters)].apply(pd.to_numeric, errors='coerce')
+
+    stats = {}
+    for position, (rule, source) in enumerate(resample_rules):
+        if source is None:
+            grouped = group_buckets(values, rule)
+            rule_stats = {
+                'sum': grouped.sum(),
+                'count': grouped.count(),
+                'sum_sq': group_buckets(values ** 2, rule).sum(),
+                'min': grouped.min(),
+                'max': grouped.max()
+            }
+        else:
+            rule_stats = {
+                'sum': group_buckets(stats[source]['sum'], rule).sum(),
+                'count': group_buckets(stats[source]['count'], rule).sum(),
+                'sum_sq': group_buckets(stats[source]['sum_sq'], rule).sum(),
+                'min': group_buckets(stats[source]['min'], rule).min(),
+                'max': group_buckets(stats[source]['max'], rule).max()
+            }
+        stats[rule] = rule_stats
+
+        # Only keep the statistics that are the source of other rules
+        for one_rule in list(stats):
+            if not any(one_source == one_rule
+                       for _, one_source in resample_rules[position + 1:]):
+                del stats[one_rule]
+
+        if rule in rules:
+            yield rule, {method: stats_frame(rule_stats, method, parameters)
+                         for method in methods}
+
+
+def stats_frame(rule_stats, method, parameters):
+    """ Make the DataFrame of a method from the statistics of a rule """
+    count = rule_stats['count'].where(rule_stats['count'] > 0)
+
+    if method == 'mean':
+        df = rule_stats['sum'] / count
+    elif method == 'min':
+        df = rule_stats['min'].copy()
+    elif method == 'max':
+        df = rule_stats['max'].copy()
+    elif method == 'std':
+        variance = (rule_stats['sum_sq'] -
+                    rule_stats['sum'] ** 2 / count) / (count - 1)
+        df = np.sqrt(variance.clip(lower=0))
+    elif method == 'count':
+        df = count
+    else:
+        raise ValueError(f'Unknown method {method}')
+
+    # Change "_QC" values to 0
+    for parameter in parameters:
+        df[f'{parameter}_QC'] = 0
+    df['TIME_QC'] = 0
+    df['DEPTH_QC'] = 0
+    return df
@@ -0,0 +1,130 @@
+import threading
+import importlib
+
+from collections import namedtuple
+
+# Modules with caches of the data. They subscribe to the changes when they are
+# imported, and they are imported before the first change is published.
+subscriber_modules = ('db_manager', 'df_cache', 'file_cache', 'summary')
+
+_subscribers = []
+_lock = threading.Lock()
+_loaded = False
+
+
+class Change(namedtuple('Change', ['kind', 'platform_code', 'parameter',
+                                   'rule', 'time_min', 'time_max'])):
+    """
+    Change of the data or the metadata of the DB. A None field means that all
+    the values may have changed.
+
+    Parameters
+    ----------
+        kind: str
+            Options - data, metadata
+        platform_code: str
+            Platform code
+        parameter: str
+            Parameter acronym
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+        time_min: str
+            Minimum date and time of the changed data.
+        time_max: str
+            Maximum date and time of the changed data.
+    """
+    __slots__ = ()
+
+    def __new__(cls, kind='data', platform_code=None, parameter=None,
+                rule=None, time_min=None, time_max=None):
+        return super().__new__(cls, kind, platform_code, parameter, rule,
+                               time_min, time_max)
+
+    def overlaps(self, platform_code=None, parameter=None, rule=None):
+        """
+        Check if the change affects the data of some platform_codes,
+        parameters and rules.
+
+        Parameters
+        ----------
+            platform_code: str or list of str
+                Platform code or list of platform_code. None means all.
+            parameter: str or list of str
+                Parameter acronym or list of parameters. None means all.
+            rule: str
+                Rule of the data. None means all.
+
+        Returns
+        -------
+            overlaps: bool
+        """
+        for changed, values in ((self.platform_code, platform_code),
+                                (self.parameter, parameter),
+                                (self.rule, rule)):
+            if changed is None or values is None:
+                continue
+            if isinstance(values, (list, tuple, set)):
+                if changed not in values:
+                    return False
+            elif changed != values:
+                return False
+        return True
+
+
+def subscribe(handler):
+    """
+    Add a function that is called with the list of Change of every publish().
+    It can be used as a decorator.
+
+    Parameters
+    ----------
+        handler: callable
+
+    Returns
+    -------
+        handler: callable
+    """
+    with _lock:
+        if handler not in _subscribers:
+            _subscribers.append(handler)
+    return handler
+
+
+def load_subscribers():
+    """ Import the modules of the caches, so they are subscribed """
+    global _loaded
+
+    if not _loaded:
+        for module in subscriber_modules:
+            importlib.import_module(f'.{module}', __package__)
+        _loaded = True
+
+
+def publish(*changes):
+    """
+    Tell all the caches that some data has changed, so they delete the
+    entries that depend on it. All the caches are invalidated even if one of
+    them fails, and then the first error is raised.
+
+    Parameters
+    ----------
+        *changes: Change
+    """
+    changes = [change for change in changes if change is not None]
+    if not changes:
+        return
+
+    load_subscribers()
+    with _lock:
+        handlers = list(_subscribers)
+
+    error = None
+    for handler in handlers:
+        try:
+            handler(changes)
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
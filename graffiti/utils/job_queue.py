@@ -0,0 +1,145 @@
+import time
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import figure_workers, figure_queue_size
+
+# Number of finished jobs whose state is remembered
+job_history = 1000
+
+
+class JobQueue:
+    """
+    Pool of worker threads that run named jobs. A job that is submitted while
+    another job with the same name is queued or running is not run again: the
+    caller gets the Future of the job in progress.
+
+    Parameters
+    ----------
+        max_workers: int
+            Number of jobs that run at the same time.
+        max_jobs: int
+            Maximum number of queued and running jobs. New jobs are rejected
+            when the queue is full.
+    """
+    def __init__(self, max_workers, max_jobs):
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='job')
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.pending = 0
+
+    def submit(self, name, function, *args, **kwargs):
+        """
+        Run function(*args, **kwargs) in the pool.
+
+        Parameters
+        ----------
+            name: str
+                Name of the job.
+            function: callable
+                The job is failed if it returns False or raises an exception.
+
+        Returns
+        -------
+            future: concurrent.futures.Future or None
+                Future with the return value of the function. None if the
+                queue is full.
+        """
+        with self.lock:
+            job = self.jobs.get(name)
+            if job and job['state'] in ('queued', 'running'):
+                return job['future']
+
+            if self.pending >= self.max_jobs:
+                return None
+
+            job = {
+                'state': 'queued',
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+                'error': None
+            }
+            self.jobs[name] = job
+            self.jobs.move_to_end(name)
+            self.pending += 1
+            job['future'] = self.executor.submit(self._run, job, function,
+                                                 args, kwargs)
+            return job['future']
+
+    def _run(self, job, function, args, kwargs):
+        with self.lock:
+            job['state'] = 'running'
+            job['started'] = time.time()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self._finish(job, 'failed', str(e) or type(e).__name__)
+            raise
+        if result is False:
+            self._finish(job, 'failed', 'Data not found')
+        else:
+            self._finish(job, 'done')
+        return result
+
+    def _finish(self, job, state, error=None):
+        with self.lock:
+            job['state'] = state
+            job['error'] = error
+            job['finished'] = time.time()
+            self.pending -= 1
+
+            # Forget the oldest finished jobs
+            finished = [name for name, one_job in self.jobs.items()
+                        if one_job['state'] in ('done', 'failed')]
+            for name in finished[:max(len(finished) - job_history, 0)]:
+                del self.jobs[name]
+
+    def status(self, name):
+        """
+        Get the state of a job.
+
+        Parameters
+        ----------
+            name: str
+                Name of the job.
+
+        Returns
+        -------
+            job: dict or None
+                Keys: name, state (queued, running, done or failed),
+                submitted, started, finished (timestamps) and error. None if
+                the job is unknown.
+        """
+        with self.lock:
+            job = self.jobs.get(name)
+            if job is None:
+                return None
+            status = {key: value for key, value in job.items()
+                      if key != 'future'}
+        status['name'] = name
+        return status
+
+    def stats(self):
+        """
+        Get the number of jobs in every state.
+
+        Returns
+        -------
+            stats: dict
+                Keys: queued, running, done, failed and max_jobs.
+        """
+        stats = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        with self.lock:
+            for job in self.jobs.values():
+                stats[job['state']] += 1
+        stats['max_jobs'] = self.max_jobs
+        return stats
+
+
+# Jobs that make the figures
+figure_jobs = JobQueue(figure_workers, figure_queue_size)
@@ -0,0 +1,225 @@
+import json
+
+import pandas as pd
+
+# Fields that are filtered by exact values and fields that are filtered by a
+# [min, max] range
+term_fields = ('platform_code', 'parameter', 'qc')
+range_fields = ('depth', 'time', 'value')
+
+
+def is_unset(value):
+    """ The filters of the API use None, False or '' for 'no filter' """
+    return value is None or value is False or \
+        (isinstance(value, str) and not value)
+
+
+def normalize_terms(value):
+    """ Sorted tuple of the unique values of a term filter """
+    if is_unset(value):
+        return None
+    if isinstance(value, (list, tuple, set)):
+        values = value
+    else:
+        values = [value]
+    values = [one_value for one_value in values if not is_unset(one_value)]
+    if not values:
+        return None
+    return tuple(sorted(set(values), key=lambda one_value: (
+        type(one_value).__name__, one_value)))
+
+
+def normalize_bound(field, value):
+    """ Bound of a range filter: ISO string for time, float for the others """
+    if is_unset(value):
+        return None
+    if field == 'time':
+        if isinstance(value, pd.Timestamp):
+            return value.isoformat()
+        return str(value)
+    return float(value)
+
+
+def term_query(field, values):
+    """
+    Exact filter of a field. The indexes that were created without the data
+    mapping have the strings as text with a keyword sub-field, so the filter
+    matches the field or its keyword sub-field.
+
+    Parameters
+    ----------
+        field: str
+            Name of the field.
+        values: tuple
+            Values of the filter.
+
+    Returns
+    -------
+        query: dict
+    """
+    if len(values) == 1:
+        kind, value = 'term', values[0]
+    else:
+        kind, value = 'terms', list(values)
+    return {'bool': {'should': [{kind: {field: value}},
+                                {kind: {f'{field}.keyword': value}}],
+                     'minimum_should_match': 1}}
+
+
+class QueryFilter:
+    """
+    Filter of the data documents. It is immutable and it has a canonical form
+    (key), so two filters with the same conditions are equal and have the
+    same hash, and it can be used as key of result caches. It compiles to a
+    bool query with term, terms and range queries in filter context, which
+    the DB can cache.
+
+    Parameters
+    ----------
+        platform_code: str or list of str
+            Platform code or list of platform_code.
+        parameter: str or list of str
+            Parameter acronym or list of parameters.
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        time_min: str
+            Minimum date and time of the measurement.
+        time_max: str
+            Maximum date and time of the measurement.
+        qc: int or list of int
+            Quality Flag value of the measurement.
+        value_min: float
+            Minimum value of the measurement.
+        value_max: float
+            Maximum value of the measurement.
+    """
+    __slots__ = ('key', '_hash')
+
+    def __init__(self, platform_code=None, parameter=None, depth_min=None,
+                 depth_max=None, time_min=None, time_max=None, qc=None,
+                 value_min=None, value_max=None):
+        terms = {'platform_code': platform_code, 'parameter': parameter,
+                 'qc': qc}
+        bounds = {'depth': (depth_min, depth_max),
+                  'time': (time_min, time_max),
+                  'value': (value_min, value_max)}
+
+        key = []
+        for field in term_fields:
+            key.append((field, normalize_terms(terms[field])))
+        for field in range_fields:
+            key.append((field, tuple(normalize_bound(field, bound)
+                                     for bound in bounds[field])))
+
+        object.__setattr__(self, 'key', tuple(key))
+        object.__setattr__(self, '_hash', hash(self.key))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('QueryFilter is immutable')
+
+    @classmethod
+    def of(cls, query):
+        """
+        Make a QueryFilter from a QueryFilter, a dict with the arguments of
+        QueryFilter or its JSON.
+
+        Returns
+        -------
+            query: QueryFilter
+        """
+        if query is None:
+            return cls()
+        if isinstance(query, cls):
+            return query
+        if isinstance(query, str):
+            query = json.loads(query)
+        return cls(**query)
+
+    def __eq__(self, other):
+        return isinstance(other, QueryFilter) and self.key == other.key
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        arguments = ', '.join(
+            f'{name}={value!r}' for name, value in self.to_dict().items())
+        return f'QueryFilter({arguments})'
+
+    def to_dict(self):
+        """
+        Arguments of the filter, without the ones that are not set.
+
+        Returns
+        -------
+            arguments: dict
+        """
+        arguments = {}
+        for field, value in self.key:
+            if field in term_fields:
+                if value is not None:
+                    arguments[field] = list(value) if len(value) > 1 \
+                        else value[0]
+            else:
+                for suffix, bound in zip(('min', 'max'), value):
+                    if bound is not None:
+                        arguments[f'{field}_{suffix}'] = bound
+        return arguments
+
+    def replace(self, **changes):
+        """
+        Make a copy of the filter with some arguments changed. A None argument
+        removes the filter.
+
+        Returns
+        -------
+            query: QueryFilter
+        """
+        arguments = self.to_dict()
+        arguments.update(changes)
+        return QueryFilter(**arguments)
+
+    def cache_key(self):
+        """
+        Canonical form of the filter as a str.
+
+        Returns
+        -------
+            cache_key: str
+        """
+        return json.dumps(self.key, separators=(',', ':'))
+
+    def to_query(self):
+        """
+        Compile the filter into a query of Elastic Search.
+
+        Returns
+        -------
+            query: dict
+        """
+        filters = []
+        for field, value in self.key:
+            if field in term_fields:
+                if value is not None:
+                    filters.append(term_query(field, value))
+            else:
+                bounds = {operator: bound for operator, bound in
+                          zip(('gte', 'lte'), value) if bound is not None}
+                if bounds:
+                    filters.append({'range': {field: bounds}})
+
+        if not filters:
+            return {'match_all': {}}
+        return {'bool': {'filter': filters}}
+
+    def to_body(self):
+        """
+        Compile the filter into the body of a search of Elastic Search.
+
+        Returns
+        -------
+            search_body: dict
+        """
+        return {'query': self.to_query()}
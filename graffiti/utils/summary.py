@@ -0,0 +1,401 @@
+import time
+import itertools
+import threading
+
+from elasticsearch import exceptions, helpers
+from elasticsearch_dsl import Search
+
+from .elastic_manager import get_elastic
+from .helper import index_name, rules
+from .invalidation import subscribe
+from .job_queue import JobQueue
+from .query import QueryFilter
+
+from config import summary_index
+
+# Mapping of the summary documents
+summary_mapping = {
+    'properties': {
+        'index': {'type': 'keyword'},
+        'platform_code': {'type': 'keyword'},
+        'parameter': {'type': 'keyword'},
+        'depth': {'type': 'double'},
+        'count': {'type': 'long'},
+        'time_min': {'type': 'date'},
+        'time_max': {'type': 'date'},
+        'value_min': {'type': 'double'},
+        'value_max': {'type': 'double'},
+        'qc_counts': {'type': 'object', 'enabled': False}
+    }
+}
+
+# (parameter, depth) buckets per page of the summary aggregation. Every
+# bucket has up to 100 QC buckets, so a page stays under search.max_buckets.
+summary_page_size = 500
+
+_index_ready = False
+_index_lock = threading.Lock()
+
+# The summary of a data index is only used after rebuild_summary() has
+# computed it for all the data of the index. The indexes are in the _meta
+# built of the summary index.
+_built_indexes = set()
+_built_checked = 0
+
+# Seconds between the checks of the indexes that are not built
+built_check_seconds = 60
+
+# The summary of the changes is refreshed in the background, one refresh at a
+# time so they are done in the order of the changes
+summary_queue_size = 10000
+summary_jobs = JobQueue(1, summary_queue_size)
+
+# (rule, platform_code, parameter) of the refreshes that have not started
+_queued = set()
+_queued_lock = threading.Lock()
+_job_ids = itertools.count()
+
+
+def ensure_summary_index():
+    """ Create the summary index with its mapping if it does not exist """
+    global _index_ready
+
+    if _index_ready:
+        return
+    with _index_lock:
+        if not _index_ready:
+            elastic = get_elastic()
+            if not elastic.indices.exists(index=summary_index):
+                try:
+                    elastic.indices.create(
+                        index=summary_index,
+                        body={'mappings': summary_mapping})
+                except exceptions.RequestError as e:
+                    if e.error != 'resource_already_exists_exception':
+                        raise
+            _index_ready = True
+
+
+def built_indexes():
+    """
+    Get the data indexes whose summary is computed, from the _meta of the
+    summary index.
+
+    Returns
+    -------
+        indexes: set of str
+    """
+    try:
+        mappings = get_elastic().indices.get_mapping(index=summary_index)
+    except exceptions.NotFoundError:
+        return set()
+    indexes = set()
+    for index_mappings in mappings.values():
+        built = index_mappings['mappings'].get('_meta', {}).get('built', [])
+        # The old flag True did not say which indexes were built
+        if isinstance(built, list):
+            indexes.update(built)
+    return indexes
+
+
+def summary_ready(rule):
+    """
+    Check if the summary of all the data of a rule is computed.
+
+    Parameters
+    ----------
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+
+    Returns
+    -------
+        ready: bool
+    """
+    global _built_indexes, _built_checked
+
+    data_index = index_name(rule)
+    if data_index not in _built_indexes and \
+            time.monotonic() - _built_checked > built_check_seconds:
+        _built_indexes = built_indexes()
+        _built_checked = time.monotonic()
+    return data_index in _built_indexes
+
+
+def qc_key(qc):
+    """ Key of a QC flag in qc_counts: '1' for 1, 1.0 and '1' """
+    try:
+        number = float(qc)
+    except (TypeError, ValueError):
+        return str(qc)
+    return str(int(number)) if number.is_integer() else str(number)
+
+
+def summary_id(data_index, platform_code, parameter, depth):
+    """ ID of the summary document of a platform, parameter and depth """
+    return f'{data_index}_{platform_code}_{parameter}_{depth}'
+
+
+def summary_buckets(elastic, data_index, query):
+    """
+    Aggregate the data of every parameter and depth, page by page with a
+    composite aggregation, so platforms with many depths do not exceed the
+    maximum number of buckets.
+
+    Parameters
+    ----------
+        elastic: Elasticsearch
+        data_index: str
+            Name of the data index.
+        query: QueryFilter
+            Filter of the data.
+
+    Yields
+    ------
+        bucket: AttrDict
+            The key has the parameter and the depth, and the metrics are
+            values, times and qc.
+    """
+    after = None
+    while True:
+        elastic_search = Search(using=elastic, index=data_index
+                                ).update_from_dict(query.to_body())
+        elastic_search = elastic_search.extra(size=0)
+        composite = {'size': summary_page_size,
+                     'sources': [
+                         {'parameter': {'terms': {'field': 'parameter'}}},
+                         {'depth': {'terms': {'field': 'depth'}}}]}
+        if after is not None:
+            composite['after'] = after
+        summaries = elastic_search.aggs.bucket('summaries', 'composite',
+                                               **composite)
+        summaries.metric('values', 'stats', field='value')
+        summaries.metric('times', 'stats', field='time')
+        summaries.bucket('qc', 'terms', field='qc', size=100)
+
+        aggregation = elastic_search.execute().aggregations.summaries
+        yield from aggregation.buckets
+        after = aggregation.to_dict().get('after_key')
+        if after is None or len(aggregation.buckets) < summary_page_size:
+            return
+
+
+def refresh_summary(rule, platform_code, parameter=None, depth=None):
+    """
+    Compute again the summary documents of a platform_code from the data of a
+    rule. For every parameter and depth, the summary has the number of values,
+    the first and last time, the minimum and maximum value and the number of
+    values of every QC flag.
+
+    Parameters
+    ----------
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+        platform_code: str
+            Platform code
+        parameter: str
+            Only refresh the summary of this parameter. By default, all.
+        depth: float
+            Only refresh the summary of this depth. By default, all.
+
+    Returns
+    -------
+        summaries: int
+            Number of summary documents of the platform_code, parameter and
+            depth.
+    """
+    ensure_summary_index()
+    elastic = get_elastic()
+    data_index = index_name(rule)
+
+    query = QueryFilter(platform_code=platform_code, parameter=parameter,
+                        depth_min=depth, depth_max=depth)
+
+    documents = []
+    try:
+        for bucket in summary_buckets(elastic, data_index, query):
+            documents.append({
+                '_id': summary_id(data_index, platform_code,
+                                  bucket.key.parameter, bucket.key.depth),
+                'index': data_index,
+                'platform_code': platform_code,
+                'parameter': bucket.key.parameter,
+                'depth': bucket.key.depth,
+                'count': bucket.doc_count,
+                'time_min': bucket.times.min_as_string,
+                'time_max': bucket.times.max_as_string,
+                'value_min': bucket.values.min,
+                'value_max': bucket.values.max,
+                'qc_counts': {
+                    qc_key(qc_bucket.key): qc_bucket.doc_count
+                    for qc_bucket in bucket.qc.buckets}
+            })
+    except exceptions.NotFoundError:
+        pass
+
+    helpers.bulk(elastic, ({'_index': summary_index, '_id': document.pop('_id'),
+                            '_source': document} for document in documents),
+                 refresh='wait_for')
+
+    # Delete the summaries of the data that does not exist anymore
+    stale_query = {
+        'bool': {
+            'filter': [
+                {'term': {'index': data_index}},
+                QueryFilter(platform_code=platform_code, parameter=parameter,
+                            depth_min=depth, depth_max=depth).to_query()],
+            'must_not': [
+                {'ids': {'values': [
+                    summary_id(data_index, platform_code, document['parameter'],
+                               document['depth'])
+                    for document in documents]}}]}}
+    elastic.delete_by_query(index=summary_index, body={'query': stale_query},
+                            refresh=True, conflicts='proceed')
+
+    return len(documents)
+
+
+def summary_counts(rule, field, platform_code=None, parameter=None,
+                   depth_min=None, depth_max=None, qc=None):
+    """
+    Get the number of values of every platform_code or parameter from the
+    summary index.
+
+    Parameters
+    ----------
+        rule: str
+            Options - M, 15D, 10D, 6D, 5D, 4D, 3D, 2D, D, 12H, 8H, 6H, 3H, 2H,
+            H, R
+        field: str
+            Options - platform_code, parameter
+        platform_code: str or list of str
+            Platform code or list of platform_code
+        parameter: str or list of str
+            Parameter acronym or list of parameters.
+        depth_min: float
+            Minimum depth of the measurement.
+        depth_max: float
+            Maximum depth of the measurement.
+        qc: int
+            Quality Control value of the measurement.
+
+    Returns
+    -------
+        counts: dict or None
+            Number of values of every platform_code or parameter with data,
+            sorted from the largest number. None if the summary is not
+            computed.
+    """
+    if not summary_ready(rule):
+        return None
+
+    query = QueryFilter(platform_code=platform_code, parameter=parameter,
+                        depth_min=depth_min, depth_max=depth_max)
+    elastic_search = Search(using=get_elastic(), index=summary_index).query(
+        'bool', filter=[{'term': {'index': index_name(rule)}},
+                        query.to_query()])
+    elastic_search = elastic_search.source([field, 'count', 'qc_counts'])
+
+    counts = {}
+    try:
+        for hit in elastic_search.scan():
+            source = hit.to_dict()
+            if qc is None or qc == '':
+                count = source['count']
+            else:
+                count = source.get('qc_counts', {}).get(qc_key(qc), 0)
+            counts[source[field]] = counts.get(source[field], 0) + count
+    except exceptions.NotFoundError:
+        return None
+
+    return dict(sorted(((key, count) for key, count in counts.items()
+                        if count > 0), key=lambda item: -item[1]))
+
+
+def refresh_job(rule, platform_code, parameter):
+    """
+    Refresh the summary of a change in the background. The errors are logged,
+    because the change is already saved in the DB.
+    """
+    with _queued_lock:
+        _queued.discard((rule, platform_code, parameter))
+    try:
+        # The changed documents must be searchable before the aggregation
+        get_elastic().indices.refresh(index=index_name(rule),
+                                      ignore_unavailable=True)
+        refresh_summary(rule, platform_code, parameter)
+    except Exception as e:
+        print(f'Error refreshing the summary of {platform_code} {parameter} '
+              f'{rule}: {e}')
+
+
+@subscribe
+def refresh_changes(changes):
+    """
+    Queue the refresh of the summary of the changed data. The changes of
+    several parameters of a platform_code and rule are refreshed with one
+    aggregation, and a refresh that is already queued is not queued again.
+
+    Parameters
+    ----------
+        changes: list of Change
+    """
+    parameters = {}
+    for change in changes:
+        if change.kind != 'data' or change.platform_code is None:
+            continue
+        for rule in [change.rule] if change.rule else rules:
+            parameters.setdefault((rule, change.platform_code), set()).add(
+                change.parameter)
+
+    for (rule, platform_code), changed in parameters.items():
+        parameter = changed.pop() if len(changed) == 1 else None
+        key = (rule, platform_code, parameter)
+        with _queued_lock:
+            if key in _queued:
+                continue
+            _queued.add(key)
+        name = f'summary-{rule}-{platform_code}-{parameter}-{next(_job_ids)}'
+        if summary_jobs.submit(name, refresh_job, *key) is None:
+            with _queued_lock:
+                _queued.discard(key)
+            print(f'Summary queue full, {platform_code} {parameter} {rule} '
+                  'is not refreshed')
+
+
+def rebuild_summary(rules):
+    """
+    Compute the summary of all the platform_codes of some rules. After that,
+    the summary is used to count the data of these rules.
+
+    Parameters
+    ----------
+        rules: list of str
+            Rules of the data indexes.
+
+    Returns
+    -------
+        summaries: int
+            Number of summary documents.
+    """
+    ensure_summary_index()
+    elastic = get_elastic()
+    summaries = 0
+    for rule in rules:
+        elastic_search = Search(using=elastic, index=index_name(rule)).extra(
+            size=0)
+        elastic_search.aggs.bucket('platforms', 'terms',
+                                   field='platform_code', size=10000)
+        try:
+            buckets = elastic_search.execute().aggregations.platforms.buckets
+        except exceptions.NotFoundError:
+            continue
+        for bucket in buckets:
+            summaries += refresh_summary(rule, bucket.key)
+
+    # The rules are marked as built after all their platforms are summarized
+    built = built_indexes() | {index_name(rule) for rule in rules}
+    elastic.indices.put_mapping(index=summary_index,
+                                body={'_meta': {'built': sorted(built)}})
+    return summaries
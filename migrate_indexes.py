@@ -0,0 +1,27 @@
+import argparse
+
+from graffiti.utils.db_manager import rule_indexes
+from graffiti.utils.data_index import put_data_template, migrate_index
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Apply the mapping of the data to the rule indexes.')
+    parser.add_argument('rules', nargs='*',
+                        help='Rules of the indexes to migrate. By default, all.')
+    parser.add_argument('--force', action='store_true',
+                        help='Migrate the indexes that already have the mapping.')
+    args = parser.parse_args()
+
+    put_data_template()
+    print('Index template updated')
+
+    for rule, index in rule_indexes:
+        if args.rules and rule not in args.rules:
+            continue
+        new_index = migrate_index(index, args.force)
+        if new_index:
+            print(f'{index} -> {new_index}')
+        else:
+            print(f'{index} - nothing to migrate')
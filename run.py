@@ -4,6 +4,7 @@ import socket
 from flask_cors import CORS
 
 from graffiti import api
+from graffiti.utils.data_index import put_data_template
 
 
 app = Flask(__name__)
@@ -13,6 +14,12 @@ CORS(app)
 
 api.init_app(app)
 
+# The new data indexes are created with the data mapping
+try:
+    put_data_template()
+except Exception as e:
+    print(f'Error updating the index template of the data: {e}')
+
 if __name__ == '__main__':
     hostname = socket.gethostname()
     app.run(hostname, 5001, debug=True)
@@ -47,6 +47,28 @@ class ResourceTest(unittest.TestCase):
         response = self.app.get(query, headers={'Authorization': test_token})
         self.assertEqual(200, response.status_code)
 
+    def test_get_data_stream_200(self):
+        """
+        GET /data/stream/R/test_platform/test_parameter.
+        The status_code of the response should be 200 and the response should
+        be a CSV with a header and the 3 values.
+        """
+        query = '/data/stream/R/test_platform/test_parameter'
+
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(4, len(response.data.decode().splitlines()))
+
+    def test_get_data_parquet_200(self):
+        """
+        GET /data/R/test_platform/test_parameter?format=parquet.
+        The status_code of the response should be 200.
+        """
+        query = '/data/R/test_platform/test_parameter?format=parquet'
+
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(200, response.status_code)
+
     def tearDown(self):
         """
         Delete all generated data
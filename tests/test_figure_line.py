@@ -229,6 +229,28 @@ class ResourceTest(unittest.TestCase):
         response = self.app.get(query, headers={'Authorization': test_token})
         self.assertEqual(201, response.status_code)
 
+    def test_get_line_201_output_json(self):
+        """
+        GET figure/line/test_platform/test_parameter?output=json
+        should return a status_code = 201 and the link to the figure JSON
+        """
+        query = 'figure/line/test_platform/test_parameter?output=json'
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(201, response.status_code)
+
+        response = self.app.get(response.get_json()['result'][0])
+        self.assertEqual(200, response.status_code)
+        self.assertIn('data', response.get_json())
+
+    def test_get_line_400_points(self):
+        """
+        GET figure/line/test_platform/test_parameter?points=0
+        should return a status_code = 400
+        """
+        query = 'figure/line/test_platform/test_parameter?points=0'
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(400, response.status_code)
+
     def tearDown(self):
         """
         Delete all generated data
@@ -418,6 +418,18 @@ class ResourceTest(unittest.TestCase):
         response = self.app.get(query, headers={'Authorization': test_token})
         self.assertEqual(201, response.status_code)
 
+    def test_get_scatter_201_depth_bin(self):
+        """
+        GET
+        figure/scatter/test_platform/test_parameter1/test_platform/depth?
+        depth_bin=1
+        should return a status_code = 201
+        """
+        query = 'figure/scatter/test_platform/test_parameter1/test_platform/' + \
+            'depth?depth_bin=1'
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(201, response.status_code)
+
     def tearDown(self):
         """
         Delete all generated data
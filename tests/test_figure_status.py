@@ -0,0 +1,42 @@
+import unittest
+
+from run import app
+from config import test_token
+
+class ResourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    def test_get_status_404_bad_figure(self):
+        """
+        GET figure/status/bad_figure should return a status_code = 404
+        """
+        query = 'figure/status/bad_figure'
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(404, response.status_code)
+
+    def test_get_status_401(self):
+        """
+        GET figure/status/bad_figure without token should return a
+        status_code = 401
+        """
+        query = 'figure/status/bad_figure'
+        response = self.app.get(query)
+        self.assertEqual(401, response.status_code)
+
+    def test_get_json_404_bad_figure(self):
+        """
+        GET figure/json/bad_figure should return a status_code = 404
+        """
+        query = 'figure/json/bad_figure'
+        response = self.app.get(query)
+        self.assertEqual(404, response.status_code)
+
+    def test_get_viewer_200(self):
+        """
+        GET figure/viewer?key=bad_figure should return a status_code = 200
+        """
+        query = 'figure/viewer?key=bad_figure'
+        response = self.app.get(query)
+        self.assertEqual(200, response.status_code)
@@ -0,0 +1,45 @@
+import unittest
+
+from run import app
+from config import test_token
+
+class ResourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    def test_get_elastic_stats_200(self):
+        """
+        GET /monitor/elastic with the admin token.
+        The status_code of the response should be 200.
+        """
+        query = '/monitor/elastic'
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(200, response.status_code)
+
+    def test_get_elastic_stats_401(self):
+        """
+        GET /monitor/elastic without token.
+        The status_code of the response should be 401.
+        """
+        query = '/monitor/elastic'
+        response = self.app.get(query)
+        self.assertEqual(401, response.status_code)
+
+    def test_get_audit_stats_200(self):
+        """
+        GET /monitor/audit with the admin token.
+        The status_code of the response should be 200.
+        """
+        query = '/monitor/audit'
+        response = self.app.get(query, headers={'Authorization': test_token})
+        self.assertEqual(200, response.status_code)
+
+    def test_get_audit_stats_401(self):
+        """
+        GET /monitor/audit without token.
+        The status_code of the response should be 401.
+        """
+        query = '/monitor/audit'
+        response = self.app.get(query)
+        self.assertEqual(401, response.status_code)
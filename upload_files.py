@@ -1,187 +1,71 @@
-import math
 import mooda as md
 from os import listdir
 from os.path import isfile, join
-import pandas as pd
-import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from service.email_service import send_to_admin
-from service.ingestion_service import (post_metadata, post_vocabulary,
-                                       post_data_index)
-from service.fig_service import (delete_scatter, delete_platform_pie,
-                                 delete_platform_availability,
-                                 delete_parameter_availability, delete_map,
-                                 delete_parameter_pie)
-
-from config import (auto_upload_folder, data_index_m, data_index_m_max,
-                    data_index_m_min, data_index_15d,
-                    data_index_15d_max, data_index_15d_min,
-                    data_index_10d, data_index_10d_max, data_index_10d_min,
-                    data_index_6d, data_index_6d_max,
-                    data_index_6d_min, data_index_5d, data_index_5d_max,
-                    data_index_5d_min, data_index_4d, data_index_4d_max,
-                    data_index_4d_min, data_index_3d, data_index_3d_max,
-                    data_index_3d_min, data_index_2d, data_index_2d_max,
-                    data_index_2d_min, data_index_d, data_index_d_max,
-                    data_index_d_min, data_index_12h, data_index_12h_max,
-                    data_index_12h_min, data_index_8h, data_index_8h_max,
-                    data_index_8h_min, data_index_6h, data_index_6h_max,
-                    data_index_6h_min, data_index_3h, data_index_3h_max,
-                    data_index_3h_min, data_index_2h, data_index_2h_max,
-                    data_index_2h_min, data_index_h, data_index_h_max,
-                    data_index_h_min, data_index_r)
-
-ingestion_raw = False
-ingestion_d = False
-ingestion_3d = False
-ingestion_16d = False
-
-ingestion_m = True
-ingestion_m_max = True
-ingestion_m_min = True
-# ingestion_m_std = True
-
-ingestion_15d = True
-ingestion_15d_max = True
-ingestion_15d_min = True
-# ingestion_15d_std = True
-
-ingestion_10d = True
-ingestion_10d_max = True
-ingestion_10d_min = True
-# ingestion_10d_std = False
-
-ingestion_6d = True
-ingestion_6d_max = True
-ingestion_6d_min = True
-# ingestion_6d_std = False
-
-ingestion_5d = True
-ingestion_5d_max = True
-ingestion_5d_min = True
-# ingestion_5d_std = False
-
-ingestion_4d = True
-ingestion_4d_max = True
-ingestion_4d_min = True
-# ingestion_4d_std = False
-
-ingestion_3d = True
-ingestion_3d_max = True
-ingestion_3d_min = True
-# ingestion_3d_std = False
-
-ingestion_2d = True
-ingestion_2d_max = True
-ingestion_2d_min = True
-# ingestion_2d_std = False
-
-ingestion_d = True
-ingestion_d_max = True
-ingestion_d_min = True
-# ingestion_d_std = False
-
-ingestion_12h = True
-ingestion_12h_max = True
-ingestion_12h_min = True
-
-ingestion_8h = True
-ingestion_8h_max = True
-ingestion_8h_min = True
-
-ingestion_6h = True
-ingestion_6h_max = True
-ingestion_6h_min = True
-
-ingestion_3h = True
-ingestion_3h_max = True
-ingestion_3h_min = True
-
-ingestion_2h = True
-ingestion_2h_max = True
-ingestion_2h_min = True
-
-ingestion_h = True
-ingestion_h_max = True
-ingestion_h_min = True
+from service.ingestion_service import post_metadata, post_vocabulary
+from graffiti.utils.db_manager import post_data_bulk, refresh_indexes
+from graffiti.utils.ingestion import data_documents, resample_data, chunked
+from graffiti.utils.checkpoint import CheckpointStore, file_hash
+from graffiti.utils.data_index import put_data_template
+from graffiti.utils.helper import index_name
+from graffiti.utils.invalidation import Change, publish
+
+from config import (auto_upload_folder, data_index_r, ingestion_workers,
+                    checkpoint_db, checkpoint_chunk_size)
+
+# Averages to ingest
+ingestion_rules = ['M', '15D', '10D', '6D', '5D', '4D', '3D', '2D', 'D', '12H',
+                   '8H', '6H', '3H', '2H', 'H']
+ingestion_methods = ['mean', 'max', 'min']
 
 ingestion_r = True
 
-def resample_wf(wf_in, rule, method='mean'):
+# Old log of the ingested files, imported into the checkpoint store
+ingestion_log = 'ingestion_log.txt'
+
+
+def log_name(rule, method):
+    """ Name of the rule and method in the ingestion log """
+    if method == 'mean':
+        return rule
+    return f'{rule}_{method.upper()}'
+
+
+def file_done(checkpoints, one_hash):
+    """
+    Check if all the ingestion of a file is complete: the metadata, every
+    average rule and method and the raw data.
     """
-    Convenience method for frequency conversion and sampling of time series of the WaterFrame
-    object. Warning: if WaterFrame.data contains MultiIndex, those indexes will disappear, obtaining a single 'TIME'
-    index.
-
-    Parameters
-    ----------
-        rule: str
-            The offset string or object representing target conversion.
-            You can find all of the resample options here:
-            http://pandas.pydata.org/pandas-docs/stable/timeseries.html#offset-aliases
-        method: "mean", "max", "min", optional, (method = "mean")
-            Save the new value with the mean(), max() or min() function.
-        inplace: bool
-            If True, resample in place and return 'True', If False, return a new WaterFrame.
+    steps = [('metadata', 'mean')] + [
+        (rule, method) for rule in ingestion_rules
+        for method in ingestion_methods]
+    if ingestion_r:
+        steps.append(('R', 'mean'))
+    return all(checkpoints.is_done(one_hash, rule, method)
+               for rule, method in steps)
+
+
+def ingestion_wf(data, metadata, parameters, data_index, checkpoints,
+                 one_file, one_hash, rule, method):
+    """
+    Ingest the data of a rule and method in chunks. The chunks that are in the
+    checkpoint store are skipped.
 
     Returns
     -------
-        new_wf: WaterFrame
+        changes: list of Change
+            Platform, parameter, rule and time range of the ingested data.
+        complete: bool
+            True if all the chunks are ingested. The failed chunks are not
+            saved in the checkpoint store, so they are retried.
     """
-    if isinstance(wf_in.data.index,
-        pd.MultiIndex) and 'DEPTH' in wf_in.data.index.names:
-    
-        # pd.Grouper allows you to specify a "groupby instruction for a target
-        # object".
-        # Ref: https://stackoverflow.com/questions/15799162/resampling-within-a-pandas-multiindex
-        level_values = wf_in.data.index.get_level_values
-
-        if method == "mean":
-            data = (
-                wf_in.data.groupby(
-                    [level_values(0)] +  # 0 is 'DEPTH'
-                    [pd.Grouper(freq=rule, level='TIME')]).mean())
-        elif method == "max":
-            data = (
-                wf_in.data.groupby(
-                    [level_values(0)] +  # 0 is 'DEPTH'
-                    [pd.Grouper(freq=rule, level='TIME')]).max())
-        elif method == "min":
-            data = (
-                wf_in.data.groupby(
-                    [level_values(0)] +  # 0 is 'DEPTH'
-                    [pd.Grouper(freq=rule, level='TIME')]).min())
-        elif method == "std":
-            data = (
-                wf_in.data.groupby(
-                    [level_values(0)] +  # 0 is 'DEPTH'
-                    [pd.Grouper(freq=rule, level='TIME')]).std(axis=1))
-    else:
-        # Legacy
-        if method == "mean":
-            data = wf_in.data.resample(rule, level='TIME').mean()
-        elif method == "max":
-            data = wf_in.data.resample(rule, level='TIME').max()
-        elif method == "min":
-            data = wf_in.data.resample(rule, level='TIME').min()
-        elif method == "std":
-            data = wf_in.data.resample(rule, level='TIME').std()
-
-    # Change "_QC" values to 0
-    for key in wf_in.data.keys():
-        if "_QC" in key:
-            data[key] = 0
-
-    
-    new_wf = wf_in.copy()
-    new_wf.data = data
-    return new_wf
-
-def ingestion_wf(wf_in, index_name):
-    data = wf_in.data
-    metadata = wf_in.metadata
-
-    for param in wf_in.parameters:
+    done = checkpoints.done_chunks(one_hash, rule, method)
+    changes = []
+    complete = True
+
+    for param in parameters:
 
         print(metadata['platform_code'], param)
         # send_to_admin(f'START - Ingestion nc EmodNet {one_file} - {param}',
@@ -189,52 +73,47 @@ def ingestion_wf(wf_in, index_name):
 
         data_param = data[[param, f'{param}_QC', 'TIME_QC', 'DEPTH_QC']]
 
-        for index, row in data_param.iterrows():
-            if math.isnan(row[param]):
+        documents = data_documents(data_param, metadata, param)
+        for number, chunk in enumerate(
+                chunked(documents, checkpoint_chunk_size)):
+            chunk_name = f'{param}:{number}'
+            if chunk_name in done:
                 continue
-            ingestion_data = {
-                'platform_code': metadata['platform_code'],
-                'parameter': param,
-                # 'time': str(index[1]), df['column_name'].dt.strftime('%Y-%m-%d')
-                'time': index[1].strftime("%Y-%m-%dT%H:%M:%SZ"),
-                'time_qc': str(row['TIME_QC']),
-                'lat': metadata['last_latitude_observation'],
-                'lat_qc': '0',
-                'lon': metadata['last_longitude_observation'],
-                'lon_qc': '0',
-                'depth': index[0],
-                'depth_qc': str(row['DEPTH_QC']),
-                'value': row[param],
-                'qc': row[f'{param}_QC']}
-
-            response, status_code = post_data_index(ingestion_data, index_name)
-            if status_code != 201:
+
+            response, status_code = post_data_bulk(data_index, chunk)
+            if response['status']:
+                checkpoints.mark_done(one_hash, rule, method, chunk_name,
+                                      one_file)
+            else:
+                complete = False
                 send_to_admin(
                     f'ERROR {status_code} - Ingestion nc EmodNet {one_file} - {param}',
-                    f'{response.get("message")}')
+                    f'{response.get("message")}: ' + \
+                        f'{response["result"][0]["error_samples"]}')
         
-        delete_parameter_availability(param)
+        # Only the cached data with the time range of the file is outdated
+        times = data_param.index.get_level_values(1)
+        changes.append(Change('data', metadata['platform_code'], param, rule,
+                              times.min(), times.max()))
 
-onlyfiles = [
-    f for f in listdir(auto_upload_folder) if isfile(join(auto_upload_folder, f))]
+    return changes, complete
 
-# Read ingestion log
-lines = []
-try:
-    with open("ingestion_log.txt") as file:
-        lines = file.readlines()
-        stripped_lines = [j.strip() for j in lines]
-        lines = stripped_lines
-except FileNotFoundError:
-    pass
 
-for one_file in onlyfiles:
+def ingest_file(one_file, one_hash):
+    """
+    Ingest the metadata, the vocabulary and the data of a NetCDF file. It runs
+    in a worker process.
 
+    Returns
+    -------
+        one_file: str
+            Name of the file.
+    """
     print(one_file)
 
-    if f'{one_file} R' in lines:
-        # This file is already ingested
-        continue
+    checkpoints = CheckpointStore(checkpoint_db)
+    changes = []
+    ingested_indexes = set()
 
     file_path = auto_upload_folder + f'/{one_file}'
 
@@ -260,474 +139,98 @@ for one_file in onlyfiles:
         wf.metadata[
             'last_longitude_observation'] = wf.metadata['geospatial_lon_max']
 
-    wf_m = wf.copy()
-    wf_m.resample('M')
-    if ingestion_m and f'{one_file} M' not in lines:
-        # Metadata and vocabulary ingestion, only this time
+    if not checkpoints.is_done(one_hash, 'metadata', 'mean'):
+        # Metadata and vocabulary ingestion, only the first time
         post_metadata(platform_code, metadata)
         vocabulary = wf.vocabulary.copy()
         post_vocabulary(platform_code, vocabulary)
-
-        # Data ingestion
-        ingestion_wf(wf_m, data_index_m)
-        # Write file into log
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} M\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_m_max = wf.copy()
-    wf_m_max.resample('M', 'max')
-    if ingestion_m_max and f'{one_file} M_MAX' not in lines:
-        ingestion_wf(wf_m_max, data_index_m_max)
-        # Write file into log
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} M_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_m_min = wf.copy()
-    wf_m_min.resample('M', 'min')
-    if ingestion_m_min and f'{one_file} M_MIN' not in lines:
-        ingestion_wf(wf_m_min, data_index_m_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} M_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_15d = wf.copy()
-    wf_15d.resample('15D')
-    if ingestion_15d and f'{one_file} 15D' not in lines:
-        ingestion_wf(wf_15d, data_index_15d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 15D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_15d_max = wf.copy()
-    wf_15d_max.resample('15D', 'max')
-    if ingestion_15d_max and f'{one_file} 15D_MAX' not in lines:
-        print('15D MAX -------------------')
-        ingestion_wf(wf_15d_max, data_index_15d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 15D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_15d_min = wf.copy()
-    wf_15d_min.resample('15D', 'min')
-    if ingestion_15d_min and f'{one_file} 15D_MIN' not in lines:
-        print('15D MIN -------------------')
-        ingestion_wf(wf_15d_min, data_index_15d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 15D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_10d = wf.copy()
-    wf_10d.resample('10D')
-    if ingestion_10d and f'{one_file} 10D' not in lines:
-        print('10D -------------------')
-        ingestion_wf(wf_10d, data_index_10d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 10D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_10d_max = wf.copy()
-    wf_10d_max.resample('10D', 'max')
-    if ingestion_10d_max and f'{one_file} 10D_MAX' not in lines:
-        print('10D MAX -------------------')
-        ingestion_wf(wf_10d_max, data_index_10d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 10D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_10d_min = wf.copy()
-    wf_10d_min.resample('10D', 'min')
-    if ingestion_10d_min and f'{one_file} 10D_MIN' not in lines:
-        print('10D MIN -------------------')
-        ingestion_wf(wf_10d_min, data_index_10d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 10D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_6d = wf.copy()
-    wf_6d.resample('6D')
-    if ingestion_6d and f'{one_file} 6D' not in lines:
-        print('6D -------------------')
-        ingestion_wf(wf_6d, data_index_6d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 6D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_6d_max = wf.copy()
-    wf_6d_max.resample('6D', 'max')
-    if ingestion_6d_max and f'{one_file} 6D_MAX' not in lines:
-        print('6D MAX -------------------')
-        ingestion_wf(wf_6d_max, data_index_6d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 6D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_6d_min = wf.copy()
-    wf_6d_min.resample('6D', 'min')
-    if ingestion_6d_min and f'{one_file} 6D_MIN' not in lines:
-        print('6D MIN -------------------')
-        ingestion_wf(wf_6d_min, data_index_6d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 6D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_5d = wf.copy()
-    wf_5d.resample('5D')
-    if ingestion_5d and f'{one_file} 5D' not in lines:
-        print('5D -------------------')
-        ingestion_wf(wf_5d, data_index_5d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 5D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_5d_max = wf.copy()
-    wf_5d_max.resample('5D', 'max')
-    if ingestion_5d_max and f'{one_file} 5D_MAX' not in lines:
-        print('5D MAX -------------------')
-        ingestion_wf(wf_5d_max, data_index_5d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 5D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_5d_min = wf.copy()
-    wf_5d_min.resample('5D', 'min')
-    if ingestion_5d_min and f'{one_file} 5D_MIN' not in lines:
-        print('5D MIN -------------------')
-        ingestion_wf(wf_5d_min, data_index_5d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 5D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_4d = wf.copy()
-    wf_4d.resample('4D')
-    if ingestion_4d and f'{one_file} 4D' not in lines:
-        print('4D -------------------')
-        ingestion_wf(wf_4d, data_index_4d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 4D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_4d_max = wf.copy()
-    wf_4d_max.resample('4D', 'max')
-    if ingestion_4d_max and f'{one_file} 4D_MAX' not in lines:
-        print('4D MAX -------------------')
-        ingestion_wf(wf_4d_max, data_index_4d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 4D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_4d_min = wf.copy()
-    wf_4d_min.resample('4D', 'min')
-    if ingestion_4d_min and f'{one_file} 4D_MIN' not in lines:
-        print('4D MIN -------------------')
-        ingestion_wf(wf_4d_min, data_index_4d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 4D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_3d = wf.copy()
-    wf_3d.resample('3D')
-    if ingestion_3d and f'{one_file} 3D' not in lines:
-        print('3D -------------------')
-        ingestion_wf(wf_3d, data_index_3d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 3D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_3d_max = wf.copy()
-    wf_3d_max.resample('3D', 'max')
-    if ingestion_3d_max and f'{one_file} 3D_MAX' not in lines:
-        print('3D MAX -------------------')
-        ingestion_wf(wf_3d_max, data_index_3d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 3D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_3d_min = wf.copy()
-    wf_3d_min.resample('3D', 'min')
-    if ingestion_3d_min and f'{one_file} 3D_MIN' not in lines:
-        print('3D MIN -------------------')
-        ingestion_wf(wf_3d_min, data_index_3d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 3D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_2d = wf.copy()
-    wf_2d.resample('2D')
-    if ingestion_2d and f'{one_file} 2D' not in lines:
-        print('2D -------------------')
-        ingestion_wf(wf_2d, data_index_2d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 2D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_2d_max = wf.copy()
-    wf_2d_max.resample('2D', 'max')
-    if ingestion_2d_max and f'{one_file} 2D_MAX' not in lines:
-        print('2D MAX -------------------')
-        ingestion_wf(wf_2d_max, data_index_2d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 2D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_2d_min = wf.copy()
-    wf_2d_min.resample('2D', 'min')
-    if ingestion_2d_min and f'{one_file} 2D_MIN' not in lines:
-        print('2D MIN -------------------')
-        ingestion_wf(wf_2d_min, data_index_2d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 2D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_d = wf.copy()
-    wf_d.resample('D')
-    if ingestion_d and f'{one_file} D' not in lines:
-        print('D -------------------')
-        ingestion_wf(wf_d, data_index_d)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} D\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_d_max = wf.copy()
-    wf_d_max.resample('D', 'max')
-    if ingestion_d_max and f'{one_file} D_MAX' not in lines:
-        print('D MAX -------------------')
-        ingestion_wf(wf_d_max, data_index_d_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} D_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_d_min = wf.copy()
-    wf_d_min.resample('D', 'min')
-    if ingestion_d_min and f'{one_file} D_MIN' not in lines:
-        print('D MIN -------------------')
-        ingestion_wf(wf_d_min, data_index_d_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} D_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_12h = wf.copy()
-    wf_12h.resample('12H')
-    if ingestion_12h and f'{one_file} 12H' not in lines:
-        print('12H -------------------')
-        ingestion_wf(wf_12h, data_index_12h)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 12H\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_12h_max = wf.copy()
-    wf_12h_max.resample('12H', 'max')
-    if ingestion_12h_max and f'{one_file} 12H_MAX' not in lines:
-        print('12H MAX -------------------')
-        ingestion_wf(wf_12h_max, data_index_12h_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 12H_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_12h_min = wf.copy()
-    wf_12h_min.resample('12H', 'min')
-    if ingestion_12h_min and f'{one_file} 12H_MIN' not in lines:
-        print('12H MIN -------------------')
-        ingestion_wf(wf_12h_min, data_index_12h_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 12H_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_8h = wf.copy()
-    wf_8h.resample('8H')
-    if ingestion_8h and f'{one_file} 8H' not in lines:
-        print('8H -------------------')
-        ingestion_wf(wf_8h, data_index_8h)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 8H\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_8h_max = wf.copy()
-    wf_8h_max.resample('8H', 'max')
-    if ingestion_8h_max and f'{one_file} 8H_MAX' not in lines:
-        print('8H MAX -------------------')
-        ingestion_wf(wf_8h_max, data_index_8h_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 8H_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_8h_min = wf.copy()
-    wf_8h_min.resample('8H', 'min')
-    if ingestion_8h_min and f'{one_file} 8H_MIN' not in lines:
-        print('8H MIN -------------------')
-        ingestion_wf(wf_8h_min, data_index_8h_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 8H_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-    
-    wf_6h = wf.copy()
-    wf_6h.resample('6H')
-    if ingestion_6h and f'{one_file} 6H' not in lines:
-        print('6H -------------------')
-        ingestion_wf(wf_6h, data_index_6h)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 6H\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_6h_max = wf.copy()
-    wf_6h_max.resample('6H', 'max')
-    if ingestion_6h_max and f'{one_file} 6H_MAX' not in lines:
-        print('6H MAX -------------------')
-        ingestion_wf(wf_6h_max, data_index_6h_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 6H_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_6h_min = wf.copy()
-    wf_6h_min.resample('6H', 'min')
-    if ingestion_6h_min and f'{one_file} 6H_MIN' not in lines:
-        print('6H MIN -------------------')
-        ingestion_wf(wf_6h_min, data_index_6h_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 6H_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_3h = wf.copy()
-    wf_3h.resample('3H')
-    if ingestion_3h and f'{one_file} 3H' not in lines:
-        print('3H -------------------')
-        ingestion_wf(wf_3h, data_index_3h)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 3H\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_3h_max = wf.copy()
-    wf_3h_max.resample('3H', 'max')
-    if ingestion_3h_max and f'{one_file} 3H_MAX' not in lines:
-        print('3H MAX -------------------')
-        ingestion_wf(wf_3h_max, data_index_3h_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 3H_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_3h_min = wf.copy()
-    wf_3h_min.resample('3H', 'min')
-    if ingestion_3h_min and f'{one_file} 3H_MIN' not in lines:
-        print('3H MIN -------------------')
-        ingestion_wf(wf_3h_min, data_index_3h_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 3H_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_2h = wf.copy()
-    wf_2h.resample('2H')
-    if ingestion_2h and f'{one_file} 2H' not in lines:
-        print('2H -------------------')
-        ingestion_wf(wf_2h, data_index_2h)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 2H\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_2h_max = wf.copy()
-    wf_2h_max.resample('2H', 'max')
-    if ingestion_2h_max and f'{one_file} 2H_MAX' not in lines:
-        print('2H MAX -------------------')
-        ingestion_wf(wf_2h_max, data_index_2h_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 2H_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_2h_min = wf.copy()
-    wf_2h_min.resample('2H', 'min')
-    if ingestion_2h_min and f'{one_file} 2H_MIN' not in lines:
-        print('2H MIN -------------------')
-        ingestion_wf(wf_2h_min, data_index_2h_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} 2H_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_h = wf.copy()
-    wf_h.resample('H')
-    if ingestion_h and f'{one_file} H' not in lines:
-        print('H -------------------')
-        ingestion_wf(wf_h, data_index_h)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} H\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_h_max = wf.copy()
-    wf_h_max.resample('H', 'max')
-    if ingestion_h_max and f'{one_file} H_MAX' not in lines:
-        print('H MAX -------------------')
-        ingestion_wf(wf_h_max, data_index_h_max)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} H_MAX\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    wf_h_min = wf.copy()
-    wf_h_min.resample('H', 'min')
-    if ingestion_h_min and f'{one_file} H_MIN' not in lines:
-        print('H MIN -------------------')
-        ingestion_wf(wf_h_min, data_index_h_min)
-        with open("ingestion_log.txt", "a") as file:
-            file.write(f"{one_file} H_MIN\n")
-            # now = datetime.datetime.now()
-            # file.write(f"{str(now)}\n")
-
-    if ingestion_r and f'{one_file} R' not in lines:
+        checkpoints.mark_done(one_hash, 'metadata', 'mean',
+                              file_name=one_file)
+        changes.append(Change('metadata', platform_code))
+
+    # All the averages are computed from one grouping of the raw data, from
+    # the finest rule to the coarsest
+    pending_rules = [
+        rule for rule in ingestion_rules
+        if any(not checkpoints.is_done(one_hash, rule, method)
+               for method in ingestion_methods)]
+
+    for rule, averages in resample_data(wf.data, wf.parameters,
+                                        ingestion_methods, pending_rules):
+        for method, data in averages.items():
+            if checkpoints.is_done(one_hash, rule, method):
+                continue
+            print(f'{log_name(rule, method)} -------------------')
+            rule_changes, complete = ingestion_wf(
+                data, metadata, wf.parameters, index_name(rule, method),
+                checkpoints, one_file, one_hash, rule, method)
+            changes += rule_changes
+            ingested_indexes.add(index_name(rule, method))
+            if complete:
+                checkpoints.mark_done(one_hash, rule, method,
+                                      file_name=one_file)
+
+    r_error = None
+    if ingestion_r and not checkpoints.is_done(one_hash, 'R', 'mean'):
         print('R -------------------')
         try:
-            ingestion_wf(wf, data_index_r)
-            with open("ingestion_log.txt", "a") as file:
-                file.write(f"{one_file} R\n")
-                # now = datetime.datetime.now()
-                # file.write(f"{str(now)}\n")
-        except:
-            print('ERROR')
-
-    # Delete figures
-    delete_scatter(platform_code)
-    delete_platform_pie()
-    delete_platform_availability(platform_code)
-    delete_map()
-    delete_parameter_pie()
+            rule_changes, complete = ingestion_wf(
+                wf.data, metadata, wf.parameters, data_index_r, checkpoints,
+                one_file, one_hash, 'R', 'mean')
+            changes += rule_changes
+            ingested_indexes.add(data_index_r)
+            if complete:
+                checkpoints.mark_done(one_hash, 'R', 'mean',
+                                      file_name=one_file)
+        except Exception as e:
+            # The changes of the averages are published before the error is
+            # raised
+            r_error = e
+
+    # The summary is aggregated from the ingested documents, so they must be
+    # searchable before the changes are published
+    refresh_indexes(ingested_indexes)
+
+    # The cached data, figures, files and summary of the changes are updated.
+    # The min and max averages have the same changes as the mean.
+    publish(*dict.fromkeys(changes))
+
+    checkpoints.close()
+    if r_error is not None:
+        raise r_error
+    return one_file
+
+
+if __name__ == '__main__':
+
+    # The rule indexes that do not exist are created by the ingestion, with
+    # the data mapping
+    put_data_template()
+
+    onlyfiles = [
+        f for f in listdir(auto_upload_folder)
+        if isfile(join(auto_upload_folder, f))]
+    file_hashes = {
+        one_file: file_hash(join(auto_upload_folder, one_file))
+        for one_file in onlyfiles}
+
+    checkpoints = CheckpointStore(checkpoint_db)
+    checkpoints.import_log(ingestion_log, file_hashes, ingestion_methods)
+
+    # The files with failed chunks in any rule are retried
+    pending_files = [
+        one_file for one_file in onlyfiles
+        if not file_done(checkpoints, file_hashes[one_file])]
+    checkpoints.close()
+
+    with ProcessPoolExecutor(max_workers=ingestion_workers) as executor:
+        futures = {
+            executor.submit(ingest_file, one_file, file_hashes[one_file]):
+                one_file
+            for one_file in pending_files}
+        for future in as_completed(futures):
+            try:
+                print(f'{future.result()} ingested')
+            except Exception as e:
+                send_to_admin(
+                    f'ERROR - Ingestion nc EmodNet {futures[future]}', f'{e}')